@@ -0,0 +1,141 @@
+from datetime import datetime
+from db import (
+    connection,
+    habit_list,
+    json_list,
+    streak_is_current,
+    virtual_occurrences,
+)
+from habit import Habit
+from streak import Streak
+from utils import MICROSECOND, to_epoch
+
+# Completion statistics of the tasks of each habit started in a time range. Streaks
+# within the range are the runs of consecutive completed habit orders, numbered with
+# ROW_NUMBER as in rebuild_streaks.
+SUMMARY_QUERY = """WITH ranged AS (
+    SELECT habit_id, habit_order, completed, completed_at, start, end FROM tasks
+    WHERE habit_id IN (SELECT value FROM json_each(?)) AND start >= ? AND start < ?
+),
+runs AS (
+    SELECT
+        habit_id,
+        habit_order - ROW_NUMBER() OVER (
+            PARTITION BY habit_id ORDER BY habit_order
+        ) AS run
+    FROM (SELECT DISTINCT habit_id, habit_order FROM ranged WHERE completed = 1)
+),
+longest AS (
+    SELECT habit_id, MAX(length) AS length
+    FROM (SELECT habit_id, COUNT(*) AS length FROM runs GROUP BY habit_id, run)
+    GROUP BY habit_id
+)
+SELECT
+    ranged.habit_id,
+    COUNT(*),
+    SUM(completed),
+    SUM(end <= ?),
+    SUM(completed = 1 AND end <= ?),
+    AVG(CASE WHEN completed = 1 THEN completed_at - start END),
+    coalesce(longest.length, 0)
+FROM ranged LEFT JOIN longest ON longest.habit_id = ranged.habit_id
+GROUP BY ranged.habit_id"""
+
+# The last streak of each habit, current as long as its next task can be completed
+LAST_STREAKS_QUERY = """SELECT habit_id, start_order, end_order FROM streaks
+WHERE habit_id IN (SELECT value FROM json_each(?))
+AND (habit_id, end_order) IN (
+    SELECT habit_id, MAX(end_order) FROM streaks GROUP BY habit_id
+)"""
+
+
+def habit_summaries(
+    habit_id: int | str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    now: datetime | None = None,
+) -> list[dict]:
+    """Returns the completion statistics of habits for their tasks started between
+    start and end, or now if earlier, ordered by habit id.
+
+    Missed tasks ended without being completed. The completion rate is the share of
+    completed tasks among completed and missed ones, the average latency the mean
+    time in seconds from the start to the completion of a task. The longest streak
+    is counted within the range, the current streak is the habit's ongoing streak.
+    """
+
+    if now is None:
+        now = datetime.now()
+    until = min(end, now) if end is not None else now
+    start = start if start is not None else datetime.min
+
+    habits = {habit.id: habit for habit in habit_list(id=habit_id)}
+    summaries = {
+        id: {
+            "habit_id": id,
+            "name": habit.name,
+            "occurrences": 0,
+            "completed": 0,
+            "missed": 0,
+            "completion_rate": None,
+            "longest_streak": 0,
+            "current_streak": 0,
+            "average_latency": None,
+        }
+        for id, habit in habits.items()
+    }
+    ids = json_list(habits.keys())
+
+    with connection() as con:
+        closed = {}
+        for row in con.execute(
+            SUMMARY_QUERY,
+            (ids, to_epoch(start), to_epoch(until), to_epoch(now), to_epoch(now)),
+        ):
+            summary = summaries[row[0]]
+            summary["occurrences"] = row[1]
+            summary["completed"] = row[2]
+            summary["missed"] = row[3] - row[4]
+            summary["longest_streak"] = row[6]
+            if row[5] is not None:
+                summary["average_latency"] = (row[5] * MICROSECOND).total_seconds()
+            closed[row[0]] = row[4]
+
+        for row in con.execute(LAST_STREAKS_QUERY, (ids,)):
+            streak = Streak(*row)
+            if streak_is_current(streak, now):
+                summaries[streak.habit_id]["current_streak"] = streak.length
+
+    # Only the completed tasks of virtual habits are stored
+    for habit in habits.values():
+        if habit.virtual:
+            summary = summaries[habit.id]
+            occurrences, ended = count_occurrences(habit, start, until, now)
+            summary["occurrences"] = occurrences
+            summary["missed"] = ended - closed.get(habit.id, 0)
+
+    for summary in summaries.values():
+        done = summary["completed"] + summary["missed"]
+        if done > 0:
+            summary["completion_rate"] = summary["completed"] / done
+
+    return [summaries[id] for id in sorted(summaries)]
+
+
+def count_occurrences(
+    habit: Habit, start: datetime, until: datetime, now: datetime
+) -> tuple[int, int]:
+    """Counts the occurrences of a habit starting from start up to until, and those of
+    them that ended by now
+    """
+
+    lifetime = habit.lifetime.duration
+    occurrences = 0
+    ended = 0
+    for _, occurrence in virtual_occurrences(
+        habit, "<" + until.isoformat(), None, not_before=start
+    ):
+        occurrences += 1
+        if occurrence + lifetime <= now:
+            ended += 1
+    return occurrences, ended
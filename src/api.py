@@ -0,0 +1,255 @@
+"""Handlers of the HTTP API, shared by the server and the direct mode of the CLI.
+
+Handlers take the query parameters as a mapping of strings and the decoded JSON body,
+and return JSON compatible data. Listings are returned as lazy iterators of items, or
+as a page when a limit is given.
+"""
+
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from datetime import datetime
+from itertools import islice
+from analytics import habit_summaries
+from db import (
+    habit_cache_info,
+    habit_create,
+    habit_delete,
+    habit_iter,
+    habit_list,
+    habit_update,
+    query_cache_info,
+    streak_iter,
+    task_complete,
+    task_complete_many,
+    task_habit_iter,
+    task_iter,
+)
+from duration import Duration, duration_cache_info
+from habit import Habit
+from utils import not_none, parse_datetime
+
+# Helpers
+
+
+def arg(args: Mapping[str, str], key: str, type: Callable = str):
+    """Returns the query parameter key converted with type, or None if not given"""
+
+    value = args.get(key)
+    return type(value) if value is not None else None
+
+
+def flag(args: Mapping[str, str], key: str) -> bool | None:
+    """Returns a true/false query parameter as a bool, or None if not given"""
+
+    value = args.get(key)
+    return value.lower() == "true" if value is not None else None
+
+
+def page_limit(args: Mapping[str, str]) -> int | None:
+    """Returns the page size requested with the limit query parameter"""
+
+    limit = arg(args, "limit", int)
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+    return limit
+
+
+def page(items: Iterable[dict], limit: int) -> dict:
+    """Returns a page of up to limit items, fetched with limit + 1 to detect further
+    pages, and the cursor to pass as after for the next page (None on the last page)
+    """
+
+    items = list(islice(items, limit + 1))
+    next = items[limit - 1]["id"] if len(items) > limit else None
+    return {"items": items[:limit], "next": next}
+
+
+def listing(items: Iterable[dict], limit: int | None) -> Iterator[dict] | dict:
+    """Returns the items of a listing, as a page if a limit is given"""
+
+    if limit is not None:
+        return page(items, limit)
+    return iter(items)
+
+
+def parse_completion(item: int | dict) -> tuple[int | tuple[int, int], datetime | None]:
+    """Parses an item of a batch completion, either a task id or an object with an id
+    or a habit_id and habit_order and an optional completed_at
+    """
+
+    if isinstance(item, int):
+        return item, None
+    if not isinstance(item, dict):
+        raise TypeError("completions must be task ids or objects")
+
+    if item.get("id") is not None:
+        task = item["id"]
+        if not isinstance(task, int):
+            raise TypeError("id must be a int")
+    else:
+        task = (item.get("habit_id"), item.get("habit_order"))
+        if not all(isinstance(value, int) for value in task):
+            raise TypeError("habit_id and habit_order must be ints if id is not given")
+
+    completed_at = item.get("completed_at")
+    if completed_at is not None:
+        completed_at = parse_datetime(completed_at)
+    return task, completed_at
+
+
+# Handlers
+
+
+def list_habits(args: Mapping[str, str], body=None) -> Iterator[dict] | dict:
+    """List habits with filtering support"""
+
+    limit = page_limit(args)
+    habits = habit_iter(
+        arg(args, "id"),
+        arg(args, "name"),
+        arg(args, "description"),
+        arg(args, "interval", Duration),
+        arg(args, "lifetime", Duration),
+        flag(args, "active"),
+        after=arg(args, "after", int),
+        limit=limit + 1 if limit is not None else None,
+    )
+    return listing((habit.to_dict() for habit in habits), limit)
+
+
+def create_habit(args: Mapping[str, str], body: dict) -> dict:
+    """Create a new habit"""
+
+    habit = Habit(
+        name=body.get("name"),
+        description=body.get("description"),
+        interval=body.get("interval"),
+        lifetime=body.get("lifetime"),
+        active=body.get("active"),
+        start=body.get("start"),
+        end=body.get("end"),
+        virtual=not_none(body.get("virtual"), False),
+    )
+    habit_create(habit)
+    return habit.to_dict()
+
+
+def update_habit(args: Mapping[str, str], body: dict) -> dict:
+    """Update an existing habit"""
+
+    id = body.get("id")
+    if id is None:
+        raise ValueError("Habit id is None")
+    existing_habits = habit_list(id=id)
+    if len(existing_habits) < 1:
+        raise ValueError(f"Habit with id {id} does not exist")
+    existing_habit = existing_habits[0]
+
+    new_habit = Habit(
+        id=not_none(body.get("id"), existing_habit.id),
+        name=not_none(body.get("name"), existing_habit.name),
+        description=not_none(body.get("description"), existing_habit.description),
+        interval=not_none(body.get("interval"), existing_habit.interval),
+        lifetime=not_none(body.get("lifetime"), existing_habit.lifetime),
+        active=not_none(body.get("active"), existing_habit.active),
+        start=not_none(body.get("start"), existing_habit.start),
+        end=not_none(body.get("end"), existing_habit.end),
+        virtual=existing_habit.virtual,
+    )
+    return habit_update(new_habit).to_dict()
+
+
+def delete_habit(args: Mapping[str, str], body=None) -> dict:
+    """Delete a habit"""
+
+    id = arg(args, "id", int)
+    habit_delete((id,))
+    return {"id": id}
+
+
+def list_tasks(args: Mapping[str, str], body=None) -> Iterator[dict] | dict:
+    """List tasks with filtering support, with include=habit joined with the name
+    and description of their habit
+    """
+
+    include = arg(args, "include")
+    if include not in (None, "habit"):
+        raise ValueError("include must be habit")
+    limit = page_limit(args)
+    filters = (
+        arg(args, "habit_id"),
+        flag(args, "completed"),
+        arg(args, "start"),
+        arg(args, "end"),
+    )
+    after = arg(args, "after", int)
+    fetch = limit + 1 if limit is not None else None
+
+    if include == "habit":
+        items = (
+            task.to_dict() | {"habit": {"name": name, "description": description}}
+            for task, name, description in task_habit_iter(
+                *filters, after=after, limit=fetch
+            )
+        )
+    else:
+        items = (
+            task.to_dict() for task in task_iter(*filters, after=after, limit=fetch)
+        )
+    return listing(items, limit)
+
+
+def complete_tasks(args: Mapping[str, str], body: list | None = None) -> dict:
+    """Marks a task as completed, or a batch of tasks given in the body"""
+
+    id = arg(args, "id", int)
+    if id is None and body is not None:
+        ids = task_complete_many(parse_completion(item) for item in body)
+        return {"ids": ids}
+
+    if id is None:
+        raise ValueError("Task id is None")
+    task_complete(id)
+    return {"id": id}
+
+
+def list_streaks(args: Mapping[str, str], body=None) -> Iterator[dict]:
+    """List streaks of completed tasks, longest first, with filtering support"""
+
+    streaks = streak_iter(
+        arg(args, "habit_id"), arg(args, "streak"), flag(args, "current") or False
+    )
+    return (streak.to_dict() for streak in islice(streaks, page_limit(args)))
+
+
+def habit_analytics(args: Mapping[str, str], body=None) -> list[dict]:
+    """Completion statistics of habits for their tasks started in a time range"""
+
+    return habit_summaries(
+        arg(args, "habit_id"),
+        arg(args, "start", parse_datetime),
+        arg(args, "end", parse_datetime),
+    )
+
+
+def stats(args: Mapping[str, str], body=None) -> dict:
+    """Hit and miss counters of the server caches"""
+
+    return {
+        "query_cache": query_cache_info(),
+        "habit_cache": habit_cache_info(),
+        "duration_cache": duration_cache_info(),
+    }
+
+
+# Handlers by method and path
+ROUTES = {
+    ("GET", "/habits"): list_habits,
+    ("POST", "/habits"): create_habit,
+    ("PUT", "/habits"): update_habit,
+    ("DELETE", "/habits"): delete_habit,
+    ("GET", "/tasks"): list_tasks,
+    ("PATCH", "/tasks"): complete_tasks,
+    ("GET", "/streaks"): list_streaks,
+    ("GET", "/analytics/habits"): habit_analytics,
+    ("GET", "/stats"): stats,
+}
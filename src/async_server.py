@@ -0,0 +1,328 @@
+"""An asyncio HTTP/1.1 server for WSGI apps.
+
+Connections are handled by coroutines on a single event loop, so idle keep-alive
+clients cost no thread. The WSGI app, and the iteration of streamed responses, run on
+a bounded thread pool, which also bounds the number of concurrent database users.
+"""
+
+import asyncio
+import io
+import sys
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 75
+
+# Maximum size in bytes of the request line and headers
+MAX_HEADER_SIZE = 64 * 1024
+
+# Maximum size in bytes of a request body
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# Default number of threads running the WSGI app
+WORKERS = 16
+
+# Status codes whose responses never have a body
+NO_BODY_STATUSES = (204, 304)
+
+
+class BadRequest(Exception):
+    """Raised for requests that cannot be parsed"""
+
+
+class ContentTooLarge(Exception):
+    """Raised for request bodies larger than MAX_BODY_SIZE"""
+
+
+class AsyncWSGIServer:
+    """Serves a WSGI app over HTTP/1.1 with keep-alive and chunked streaming"""
+
+    def __init__(self, app: Callable, workers: int = WORKERS):
+        """Initializes the server with the app and the size of its thread pool"""
+
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="wsgi"
+        )
+        self.connections: set[asyncio.Task] = set()
+
+    async def serve(self, host: str, port: int, ready: Callable | None = None):
+        """Serves until cancelled, calling ready with the port once the socket is
+        listening. Open connections are closed once cancelled.
+        """
+
+        server = await asyncio.start_server(
+            self.handle, host, port, limit=MAX_HEADER_SIZE, backlog=1024
+        )
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            connections = list(self.connections)
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+
+    def run(self, host: str, port: int):
+        """Runs the server on a new event loop until interrupted"""
+
+        print(f" * Serving on http://{host}:{port} (async, press CTRL+C to quit)")
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handles the requests of one connection until it is closed"""
+
+        peer = writer.get_extra_info("peername") or ("", 0)
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT
+                    )
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.write_error(
+                        writer, "431 Request Header Fields Too Large"
+                    )
+                    return
+
+                try:
+                    environ, keep_alive = await self.read_request(
+                        head, reader, writer, peer
+                    )
+                except BadRequest:
+                    await self.write_error(writer, "400 Bad Request")
+                    return
+                except ContentTooLarge:
+                    await self.write_error(writer, "413 Content Too Large")
+                    return
+
+                keep_alive = await self.respond(environ, writer, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        except asyncio.CancelledError:
+            # Cancelled by serve on shutdown
+            return
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def read_request(
+        self,
+        head: bytes,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        peer: tuple,
+    ) -> tuple[dict, bool]:
+        """Parses the request head, reads the body and returns the WSGI environ and
+        whether the client wants to keep the connection open
+        """
+
+        lines = head[:-4].decode("latin-1").split("\r\n")
+        try:
+            method, target, protocol = lines[0].split(" ")
+        except ValueError:
+            raise BadRequest()
+        if not protocol.startswith("HTTP/1."):
+            raise BadRequest()
+
+        headers = {}
+        for line in lines[1:]:
+            name, separator, value = line.partition(":")
+            if separator == "":
+                raise BadRequest()
+            key = name.strip().upper().replace("-", "_")
+            value = value.strip()
+            headers[key] = headers[key] + ", " + value if key in headers else value
+
+        connection = headers.get("CONNECTION", "").lower()
+        if protocol == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+
+        # Requests with both could be framed differently by a proxy in front
+        if "TRANSFER_ENCODING" in headers and "CONTENT_LENGTH" in headers:
+            raise BadRequest()
+        chunked = "chunked" in headers.get("TRANSFER_ENCODING", "").lower()
+        length = 0
+        if not chunked:
+            try:
+                length = int(headers.get("CONTENT_LENGTH", "0"))
+            except ValueError:
+                raise BadRequest()
+            if length < 0:
+                raise BadRequest()
+            if length > MAX_BODY_SIZE:
+                raise ContentTooLarge()
+
+        if headers.get("EXPECT", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        if chunked:
+            body = await self.read_chunked(reader)
+        else:
+            body = await reader.readexactly(length)
+
+        path, _, query = target.partition("?")
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(path, "latin-1"),
+            "QUERY_STRING": query,
+            "SERVER_NAME": writer.get_extra_info("sockname")[0],
+            "SERVER_PORT": str(writer.get_extra_info("sockname")[1]),
+            "SERVER_PROTOCOL": protocol,
+            "REMOTE_ADDR": peer[0],
+            "REMOTE_PORT": str(peer[1]),
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for key, value in headers.items():
+            if key == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif key not in ("CONTENT_LENGTH", "TRANSFER_ENCODING"):
+                environ["HTTP_" + key] = value
+
+        return environ, keep_alive
+
+    async def read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        """Reads a request body sent with chunked transfer encoding"""
+
+        body = bytearray()
+        while True:
+            try:
+                line = await reader.readuntil(b"\r\n")
+                size = int(line.split(b";")[0], 16)
+            except (ValueError, asyncio.LimitOverrunError):
+                raise BadRequest()
+            if size < 0:
+                raise BadRequest()
+            if len(body) + size > MAX_BODY_SIZE:
+                raise ContentTooLarge()
+            if size == 0:
+                # Skip the trailers
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return bytes(body)
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+
+    async def respond(
+        self, environ: dict, writer: asyncio.StreamWriter, keep_alive: bool
+    ) -> bool:
+        """Runs the app and writes its response, streaming bodies without a known
+        length with chunked transfer encoding, or to HTTP/1.0 clients until the
+        connection is closed. Returns whether to keep the connection.
+        """
+
+        loop = asyncio.get_running_loop()
+        response = {}
+
+        def start_response(status: str, headers: list, exc_info=None):
+            if exc_info is not None and "status" in response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = status
+            response["headers"] = headers
+            return response.setdefault("written", []).append
+
+        def call_app() -> tuple[Iterable[bytes], bytes | None, Iterator[bytes]]:
+            # The first chunk is produced here, as apps may call start_response lazily
+            result = self.app(environ, start_response)
+            iterator = iter(result)
+            return result, next(iterator, None), iterator
+
+        try:
+            result, first, iterator = await loop.run_in_executor(
+                self.executor, call_app
+            )
+        except Exception:
+            print(f"Error handling {environ['PATH_INFO']}", file=sys.stderr)
+            sys.excepthook(*sys.exc_info())
+            await self.write_error(writer, "500 Internal Server Error")
+            return False
+
+        try:
+            status = response["status"]
+            headers = [
+                (name, value)
+                for name, value in response["headers"]
+                if name.lower() not in ("connection", "transfer-encoding")
+            ]
+            has_body = (
+                environ["REQUEST_METHOD"] != "HEAD"
+                and int(status[:3]) not in NO_BODY_STATUSES
+            )
+            length_known = any(name.lower() == "content-length" for name, _ in headers)
+            chunked = has_body and not length_known
+            if chunked and environ["SERVER_PROTOCOL"] == "HTTP/1.0":
+                # HTTP/1.0 clients cannot parse chunks, closing ends the body
+                chunked = False
+                keep_alive = False
+            if chunked:
+                headers.append(("Transfer-Encoding", "chunked"))
+            if not keep_alive:
+                headers.append(("Connection", "close"))
+
+            head = f"HTTP/1.1 {status}\r\n" + "".join(
+                f"{name}: {value}\r\n" for name, value in headers
+            )
+            writer.write(head.encode("latin-1") + b"\r\n")
+
+            chunk = b"".join(response.get("written", [])) + (first or b"")
+            while chunk is not None:
+                if has_body and len(chunk) > 0:
+                    if chunked:
+                        writer.write(b"%x\r\n%b\r\n" % (len(chunk), chunk))
+                    else:
+                        writer.write(chunk)
+                    await writer.drain()
+                chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except Exception:
+            # Headers may already be sent, the connection cannot be reused
+            print(f"Error streaming {environ['PATH_INFO']}", file=sys.stderr)
+            sys.excepthook(*sys.exc_info())
+            keep_alive = False
+        finally:
+            if hasattr(result, "close"):
+                # Shielded, so the result is closed even if the connection is
+                # cancelled on shutdown
+                await asyncio.shield(loop.run_in_executor(self.executor, result.close))
+
+        return keep_alive
+
+    async def write_error(self, writer: asyncio.StreamWriter, status: str):
+        """Writes an empty error response and closes the connection"""
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode(
+                "latin-1"
+            )
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
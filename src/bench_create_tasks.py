@@ -0,0 +1,92 @@
+"""Benchmarks task materialization throughput in rows/second.
+
+Compares the per-task path (one INSERT and commit per task, as task_create does)
+with the bulk path used by habit_create through create_tasks_for_habit, and times
+computing the timestamps of the tasks alone with habit_occurrences.
+Runs against a throwaway database in a temporary directory.
+
+Usage: python src/bench_create_tasks.py [--rows 100000] [--per-task-rows 2000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# db.py opens database.db in the working directory on first use
+os.chdir(tempfile.mkdtemp())
+
+from db import habit_create, task_create  # noqa: E402
+from habit import Habit  # noqa: E402
+from occurrences import habit_occurrences  # noqa: E402
+from task import Task  # noqa: E402
+
+
+def make_habit(rows: int) -> Habit:
+    """Creates a PT5M habit spanning the given number of occurrences"""
+
+    start = datetime(2023, 1, 1, 8, 0, 0)
+    return Habit(
+        name="bench",
+        description="bench",
+        interval="PT5M",
+        lifetime="PT5M",
+        start=start,
+        end=start + timedelta(minutes=5 * rows),
+    )
+
+
+def bench_per_task(rows: int) -> float:
+    """Times inserting the tasks one by one, committing each"""
+
+    habit = make_habit(rows)
+    habit.id = 0
+    current = habit.start
+    started = time.perf_counter()
+    for order in range(1, rows + 1):
+        task_create(
+            Task(
+                habit_id=habit.id,
+                habit_order=order,
+                start=current,
+                end=current + habit.lifetime.duration,
+            )
+        )
+        current += habit.interval.duration
+    return time.perf_counter() - started
+
+
+def bench_bulk(rows: int) -> float:
+    """Times creating a habit with all of its tasks in one transaction"""
+
+    habit = make_habit(rows)
+    started = time.perf_counter()
+    habit_create(habit)
+    return time.perf_counter() - started
+
+
+def bench_occurrences(rows: int) -> float:
+    """Times computing the starts and ends of the tasks of a habit"""
+
+    habit = make_habit(rows)
+    started = time.perf_counter()
+    habit_occurrences(habit)
+    return time.perf_counter() - started
+
+
+def report(label: str, rows: int, seconds: float):
+    print(
+        f"{label:<18} {rows:>8} rows in {seconds:8.3f}s  {rows / seconds:>12,.0f} rows/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Task materialization benchmark")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--per-task-rows", type=int, default=2_000)
+    args = parser.parse_args()
+
+    report("per-task commits", args.per_task_rows, bench_per_task(args.per_task_rows))
+    report("occurrences", args.rows, bench_occurrences(args.rows))
+    report("bulk transaction", args.rows, bench_bulk(args.rows))
@@ -0,0 +1,62 @@
+"""Benchmarks Duration.find_next_instance in calls/second.
+
+Compares stepping from the start time one interval at a time, as find_next_instance
+did before, with the computed instances, for short and calendar intervals whose
+start time lies a number of days in the past.
+
+Usage: python src/bench_duration.py [--days 365] [--calls 20]
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from duration import Duration
+
+INTERVALS = ["PT1M", "PT1H", "P1D", "P1M", "P1Y", "P1M1D"]
+
+
+def step_next_instance(duration: Duration, current_time: datetime) -> datetime:
+    """Finds the next instance by repeated addition of the duration"""
+
+    next_instance = duration.start_time
+    while next_instance <= current_time:
+        next_instance += duration.duration
+    return next_instance
+
+
+def bench(find, duration: Duration, now: datetime, calls: int) -> float:
+    """Times calls of find for times following now by a second each"""
+
+    started = time.perf_counter()
+    for call in range(calls):
+        find(duration, now + timedelta(seconds=call))
+    return time.perf_counter() - started
+
+
+def report(label: str, calls: int, seconds: float):
+    print(
+        f"{label:<18} {calls:>6} calls in {seconds:8.3f}s  {calls / seconds:>12,.0f} calls/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Duration instance benchmark")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    for interval in INTERVALS:
+        duration = Duration(interval, now - timedelta(days=args.days))
+        assert step_next_instance(duration, now) == duration.find_next_instance(now)
+        print(interval)
+        report(
+            "  stepping",
+            args.calls,
+            bench(step_next_instance, duration, now, args.calls),
+        )
+        report(
+            "  computed",
+            args.calls,
+            bench(Duration.find_next_instance, duration, now, args.calls),
+        )
@@ -0,0 +1,81 @@
+"""Benchmarks creating Task models from database rows.
+
+Compares the validating constructor with Task.from_row, which skips validation
+and converts timestamps on first access, by the time per row, the time to also
+convert the rows with to_dict, and the memory held by the models of the rows.
+
+Usage: python src/bench_models.py [--rows 100000]
+"""
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime
+from task import Task
+from utils import to_epoch
+
+
+def make_rows(count: int) -> list[tuple]:
+    """Creates rows of the tasks table of a PT1M habit"""
+
+    start = to_epoch(datetime(2023, 1, 1, 8, 0, 0))
+    minute = 60 * 1_000_000
+    return [
+        (order, 1, order, 0, None, start + order * minute, start + (order + 1) * minute)
+        for order in range(1, count + 1)
+    ]
+
+
+def validated(row: tuple) -> Task:
+    """Creates a Task from a row like task_from_row did before from_row"""
+
+    return Task(
+        id=row[0],
+        habit_id=row[1],
+        habit_order=row[2],
+        completed=bool(row[3]),
+        completed_at=row[4],
+        start=row[5],
+        end=row[6],
+    )
+
+
+def bench(create, rows: list[tuple]) -> tuple[float, float, int]:
+    """Returns the seconds to create the models, the seconds to also convert them
+    to dictionaries and the bytes allocated for the models
+    """
+
+    started = time.perf_counter()
+    for row in rows:
+        create(row)
+    created = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for row in rows:
+        create(row).to_dict()
+    converted = time.perf_counter() - started
+
+    tracemalloc.start()
+    models = [create(row) for row in rows]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del models
+    return created, converted, size
+
+
+def report(label: str, rows: int, created: float, converted: float, size: int):
+    print(
+        f"{label:<12} {created / rows * 1e6:8.2f}us/row  "
+        f"{converted / rows * 1e6:8.2f}us/row with to_dict  "
+        f"{size / rows * 100_000 / 2**20:8.1f}MiB/100k rows"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Task model benchmark")
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    report("validated", args.rows, *bench(validated, rows))
+    report("from_row", args.rows, *bench(Task.from_row, rows))
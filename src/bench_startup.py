@@ -0,0 +1,91 @@
+"""Benchmarks the cold start of the CLI in milliseconds.
+
+Prints the modules taking the longest to import, measured with -X importtime, and
+the median wall time of short commands, each run in a fresh interpreter. The
+--direct commands run against a throwaway database in a temporary directory.
+
+Usage: python src/bench_startup.py [--runs 10] [--top 10] [--max-ms 500]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+CLI = os.path.join(SRC, "cli.py")
+
+
+def import_times(module: str) -> list[tuple[int, str]]:
+    """Returns the cumulative import time in microseconds of each module imported by
+    importing module, longest first
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times.append((int(cumulative), name.strip()))
+    return sorted(times, reverse=True)
+
+
+def time_command(arguments: list[str], runs: int) -> float:
+    """Returns the median wall time in seconds of running the CLI with arguments"""
+
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, CLI] + arguments,
+            cwd=SRC,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CLI startup benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Exit with an error if a command takes longer than this",
+    )
+    args = parser.parse_args()
+
+    print(f"{'module':<40} {'cumulative':>12}")
+    for microseconds, name in import_times("cli")[: args.top]:
+        print(f"{name:<40} {microseconds / 1000:>10.1f}ms")
+    print()
+
+    database = os.path.join(tempfile.mkdtemp(), "database.db")
+    commands = [
+        ["-h"],
+        ["tasks:list", "-h"],
+        ["--direct", database, "--format", "json", "habits:list"],
+        ["--direct", database, "habits:list"],
+    ]
+    slowest = 0.0
+    for command in commands:
+        seconds = time_command(command, args.runs)
+        slowest = max(slowest, seconds)
+        label = " ".join(command).replace(database, "DB")
+        print(f"{label:<40} {seconds * 1000:>8.1f}ms")
+
+    if args.max_ms is not None and slowest * 1000 > args.max_ms:
+        sys.exit(f"slowest command took {slowest * 1000:.1f}ms > {args.max_ms}ms")
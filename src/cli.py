@@ -1,13 +1,34 @@
 import argparse
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from itertools import islice
 import json
-import requests
+import shlex
+import sys
 from types import SimpleNamespace
-from tabulate import tabulate
+
+# requests and tabulate are imported on first use. Importing them takes most of the
+# start up time of a command, and not every command needs them.
 
 
 url_base = "http://127.0.0.1"
 
+# Keep-alive session shared by all requests, so they reuse one connection. Created
+# on first use by get_session.
+session = None
+
+# Analytics computed from a snapshot file instead of by the server
+SNAPSHOT_ANALYTICS = ("completion_heatmap", "weekday_hours", "rolling_completion_rate")
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# Number of listings kept by etag_cache
+ETAG_CACHE_SIZE = 32
+
+# Bodies of earlier listings by url, with their ETag for revalidation, least
+# recently used first
+etag_cache: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+
 # Helper functions
 
 
@@ -27,62 +48,124 @@ def create_url(
     return url
 
 
+def get_session():
+    """Return the shared keep-alive session, importing requests on first use."""
+    global session
+    if session is None:
+        import requests
+
+        session = requests.Session()
+    return session
+
+
 def output(data, format="table"):
     """Helper function for printing the given data in a tabular format."""
     if format == "table":
+        from tabulate import tabulate
+
         print(tabulate(data, headers="keys"))
     else:
         print(json.dumps(data))
 
 
-def get_streaks_from_tasks(input_list):
-    """Get streaks from a list of tasks."""
-    streaks = []
-    current_streak = None
-
-    input_list.sort(key=lambda x: (x["habit_id"], x["habit_order"]))
-
-    for item in input_list:
-        habit_id = item["habit_id"]
-        habit_order = item["habit_order"]
-
-        if (
-            current_streak is None
-            or current_streak["habit_id"] != habit_id
-            or habit_order != current_streak["last_habit_order"] + 1
-        ):
-            if current_streak is not None:
-                streaks.append(current_streak)
-            current_streak = {
-                "streak": 1,
-                "ids": [item["id"]],
-                "habit_id": habit_id,
-                "last_habit_order": habit_order,
-            }
-        else:
-            current_streak["streak"] += 1
-            current_streak["ids"].append(item["id"])
-            current_streak["last_habit_order"] = habit_order
-
-    if current_streak is not None:
-        streaks.append(current_streak)
+def output_pages(data, page_size: int, format="table"):
+    """Helper function for printing lazily fetched data one page at a time."""
+    data = iter(data)
+    if format == "table":
+        from tabulate import tabulate
 
-    for streak in streaks:
-        del streak["last_habit_order"]
+        while page := list(islice(data, page_size)):
+            print(tabulate(page, headers="keys"))
+    else:
+        separator = "["
+        for item in data:
+            print(separator + json.dumps(item), end="", flush=True)
+            separator = ", "
+        print("[]" if separator == "[" else "]")
 
-    streaks.sort(key=lambda x: x["streak"], reverse=True)
 
-    return streaks
+# HTTP Requests
 
 
-# HTTP Requests
+def send(
+    args,
+    method: str,
+    endpoint: str,
+    parameters: dict | None = None,
+    body: dict | list | None = None,
+    revalidate: bool = False,
+):
+    """Send a request to the server, or handle it in process with --direct.
+    With revalidate, GET responses are cached and revalidated by their ETag."""
+    if args.direct is not None:
+        return direct_request(args.direct, method, endpoint, parameters, body)
+    url = create_url(args.port, endpoint, parameters)
+    if method == "GET" and revalidate:
+        return req_get_json(url)
+    return get_session().request(method, url, json=body).json()
+
+
+def direct_request(
+    path: str,
+    method: str,
+    endpoint: str,
+    parameters: dict | None = None,
+    body: dict | list | None = None,
+):
+    """Handle a request in process against the database at path, like the server."""
+    # Only loaded in direct mode, which opens the database on first use
+    import api
+    import db
+
+    db.open_database(path)
+    query = {
+        key: str(value)
+        for key, value in (parameters or {}).items()
+        if value is not None
+    }
+    try:
+        result = api.ROUTES[(method, endpoint)](query, body)
+        if not isinstance(result, (dict, list)):
+            result = list(result)
+    except Exception as e:
+        return {"message": getattr(e, "message", repr(e))}
+    return sort_keys(result)
+
+
+def sort_keys(value):
+    """Sort the keys of the objects in value recursively, as the server encodes them."""
+    if isinstance(value, dict):
+        return {key: sort_keys(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [sort_keys(item) for item in value]
+    return value
+
+
+def req_get_json(url: str):
+    """HTTP GET request revalidating an earlier response to the same url by its ETag.
+    Keeps the last ETAG_CACHE_SIZE responses."""
+    cached = etag_cache.get(url)
+    headers = {"If-None-Match": cached[0]} if cached is not None else {}
+    response = get_session().get(url, headers=headers)
+    if response.status_code == 304 and cached is not None:
+        etag_cache.move_to_end(url)
+        return json.loads(cached[1])
+    etag = response.headers.get("ETag")
+    if etag is not None:
+        etag_cache[url] = (etag, response.content)
+        etag_cache.move_to_end(url)
+        while len(etag_cache) > ETAG_CACHE_SIZE:
+            etag_cache.popitem(last=False)
+    return response.json()
 
 
 def req_habits_create(args):
     """HTTP request to create a habit."""
-    return requests.post(
-        create_url(args.port, "/habits"),
-        json={
+    return send(
+        args,
+        "POST",
+        "/habits",
+        body={
             "name": args.name,
             "description": args.description,
             "interval": args.interval,
@@ -90,15 +173,18 @@ def req_habits_create(args):
             "active": args.active,
             "start": args.start,
             "end": args.end,
+            "virtual": args.virtual,
         },
-    ).json()
+    )
 
 
 def req_habits_update(args):
     """HTTP request to update a habit."""
-    return requests.put(
-        create_url(args.port, "/habits"),
-        json={
+    return send(
+        args,
+        "PUT",
+        "/habits",
+        body={
             "id": args.id,
             "name": args.name,
             "description": args.description,
@@ -108,128 +194,177 @@ def req_habits_update(args):
             "start": args.start,
             "end": args.end,
         },
-    ).json()
+    )
+
+
+def habits_list_parameters(args):
+    """Query parameters to list habits."""
+    return {
+        "id": str(args.id) if args.id is not None else None,
+        "name": args.name,
+        "description": args.description,
+        "interval": args.interval,
+        "lifetime": args.lifetime,
+        "active": args.active,
+    }
 
 
 def req_habits_list(args):
     """HTTP request to list habits."""
-    return requests.get(
-        create_url(
-            args.port,
-            "/habits",
-            parameters={
-                "id": str(args.id) if args.id is not None else None,
-                "name": args.name,
-                "description": args.description,
-                "interval": args.interval,
-                "lifetime": args.lifetime,
-                "active": args.active,
-            },
-        )
-    ).json()
+    return send(args, "GET", "/habits", habits_list_parameters(args), revalidate=True)
+
+
+def req_habits_pages(args):
+    """HTTP requests to lazily list habits page by page."""
+    return req_pages(args, "/habits", habits_list_parameters(args), args.page_size)
 
 
 def req_habits_delete(args):
     """HTTP request to update a habit."""
-    return requests.delete(
-        create_url(args.port, "/habits", parameters={"id": args.id}),
-    ).json()
+    return send(args, "DELETE", "/habits", {"id": args.id})
+
+
+def tasks_list_parameters(args):
+    """Query parameters to list tasks."""
+    return {
+        "habit_id": args.habit_id,
+        "completed": args.completed,
+        "start": args.start,
+        "end": args.end,
+    }
 
 
 def req_tasks_list(args):
     """HTTP request to list tasks."""
-    return requests.get(
-        create_url(
-            args.port,
-            "/tasks",
-            parameters={
-                "habit_id": args.habit_id,
-                "completed": args.completed,
-                "start": args.start,
-                "end": args.end,
-            },
+    return send(args, "GET", "/tasks", tasks_list_parameters(args), revalidate=True)
+
+
+def req_tasks_with_habits(args):
+    """HTTP request to list tasks joined with the name and description of their habit."""
+    return send(
+        args, "GET", "/tasks", tasks_list_parameters(args) | {"include": "habit"}
+    )
+
+
+def req_tasks_pages(args):
+    """HTTP requests to lazily list tasks page by page."""
+    return req_pages(args, "/tasks", tasks_list_parameters(args), args.page_size)
+
+
+def req_pages(args, endpoint: str, parameters: dict, page_size: int):
+    """HTTP requests to lazily walk the pages of a list endpoint, page_size items at a time."""
+    after = None
+    while True:
+        page = send(
+            args, "GET", endpoint, parameters | {"limit": page_size, "after": after}
         )
-    ).json()
+        yield from page["items"]
+        after = page["next"]
+        if after is None:
+            return
 
 
 def req_tasks_complete(args):
     """HTTP request to complete a task."""
-    return requests.patch(
-        create_url(args.port, "/tasks", parameters={"id": args.id}),
-    ).json()
+    return send(args, "PATCH", "/tasks", {"id": args.id})
 
 
-# Functions using HTTP requests
+def req_tasks_complete_many(args, completions: list):
+    """HTTP request to complete a batch of tasks in one transaction."""
+    return send(args, "PATCH", "/tasks", body=completions)
 
 
-def tasks_active(args):
-    """Function to get active tasks."""
-    tasks = req_tasks_list(
-        SimpleNamespace(
-            port=args.port,
-            habit_id=None,
-            completed=False,
-            start="<" + datetime.now().isoformat(),
-            end=">" + datetime.now().isoformat(),
-        )
+def req_streaks_list(args):
+    """HTTP request to list streaks."""
+    return send(
+        args,
+        "GET",
+        "/streaks",
+        {
+            "habit_id": args.habit_id,
+            "streak": args.streak,
+            "current": args.current,
+            "limit": args.limit,
+        },
     )
 
-    return map_habits_to_tasks(args, tasks)
+
+def req_analytics_habits(args):
+    """HTTP request for the completion statistics of habits."""
+    return send(
+        args,
+        "GET",
+        "/analytics/habits",
+        {"habit_id": args.habit_id, "start": args.start, "end": args.end},
+    )
 
 
-def map_habits_to_tasks(args, tasks):
-    """Map habits to tasks."""
+# Functions using HTTP requests
 
-    if len(tasks) < 1:
-        return tasks
 
-    habit_ids = [element["habit_id"] for element in tasks]
-    habits = req_habits_list(
+def habits_list(args):
+    """Function to list habits, page by page if a page size is given."""
+    if args.page_size is None:
+        output(req_habits_list(args), args.format)
+    else:
+        output_pages(req_habits_pages(args), args.page_size, args.format)
+
+
+def tasks_list(args):
+    """Function to list tasks, page by page if a page size is given."""
+    if args.page_size is None:
+        output(req_tasks_list(args), args.format)
+    else:
+        output_pages(req_tasks_pages(args), args.page_size, args.format)
+
+
+def tasks_active(args):
+    """Function to get active tasks with the name and description of their habit."""
+    tasks = req_tasks_with_habits(
         SimpleNamespace(
             port=args.port,
-            id="*in(" + ",".join([str(id) for id in habit_ids]) + ")",
-            name=None,
-            description=None,
-            interval=None,
-            lifetime=None,
-            active=True,
+            direct=args.direct,
+            habit_id=None,
+            completed=False,
+            start="<" + datetime.now().isoformat(),
+            end=">" + datetime.now().isoformat(),
         )
     )
 
-    def map_habit_to_task(task: dict):
-        habit = [x for x in habits if x["id"] == task["habit_id"]][0]
+    def flatten_habit(task: dict):
+        habit = task.pop("habit")
         task["name"] = habit["name"]
         task["description"] = habit["description"]
         return task
 
-    return list(map(map_habit_to_task, tasks))
+    return list(map(flatten_habit, tasks))
 
 
-def list_task_streaks(args):
-    """List task streaks."""
-    tasks = req_tasks_list(
-        SimpleNamespace(
-            port=args.port, habit_id=args.habit_id, completed=True, start=None, end=None
-        )
-    )
+def tasks_complete(args):
+    """Complete a task, or a batch of tasks in one request."""
+    if args.ids is not None:
+        completions = [int(id) for id in args.ids.split(",")]
+    elif args.from_file is not None:
+        with open(args.from_file) as file:
+            completions = json.load(file)
+    else:
+        return req_tasks_complete(args)
 
-    streaks = get_streaks_from_tasks(tasks)
+    return req_tasks_complete_many(args, completions)
 
-    if args.streak is not None:
-        if args.streak.startswith(">"):
-            streaks = [
-                streak for streak in streaks if streak["streak"] > int(args.streak[1:])
-            ]
-        elif args.streak.startswith("<"):
-            streaks = [
-                streak for streak in streaks if streak["streak"] < int(args.streak[1:])
-            ]
-        else:
-            streaks = [
-                streak for streak in streaks if streak["streak"] == int(args.streak)
-            ]
 
-    return streaks
+def list_task_streaks(args, current: bool = False, limit: int | None = None):
+    """List task streaks, longest first."""
+    return req_streaks_list(
+        SimpleNamespace(
+            port=args.port,
+            direct=args.direct,
+            habit_id=args.habit_id,
+            streak=args.streak,
+            current=current,
+            limit=limit,
+        )
+    )
 
 
 def analytics(args):
@@ -238,6 +373,7 @@ def analytics(args):
         data = req_habits_list(
             SimpleNamespace(
                 port=args.port,
+                direct=args.direct,
                 id=args.habit_id,
                 name=None,
                 description=None,
@@ -253,13 +389,90 @@ def analytics(args):
         output(data, args.format)
 
     elif args.type == "get_longest_streak":
-        data = list_task_streaks(args)
-        output([data[0]], args.format)
+        data = list_task_streaks(args, limit=1)
+        output(data, args.format)
+
+    elif args.type == "list_current_streaks":
+        data = list_task_streaks(args, current=True)
+        output(data, args.format)
+
+    elif args.type == "habit_summary":
+        data = req_analytics_habits(args)
+        output(data, args.format)
+
+    elif args.type in SNAPSHOT_ANALYTICS:
+        output(snapshot_analytics(args), args.format)
 
     else:
         raise ValueError("Unknown analytics type")
 
 
+def column_rows(columns: dict) -> list[dict]:
+    """Turns a dictionary of numpy columns into a list of rows."""
+    values = [
+        (
+            [value.isoformat() for value in column.tolist()]
+            if column.dtype.kind == "M"
+            else column.tolist()
+        )
+        for column in columns.values()
+    ]
+    return [dict(zip(columns.keys(), row)) for row in zip(*values)]
+
+
+def snapshot_analytics(args):
+    """Query analytics computed in process from a snapshot file."""
+    if args.snapshot is None:
+        raise ValueError(f"{args.type} requires --snapshot")
+
+    # Imported on first use like requests and tabulate, numpy takes long to import
+    import snapshot_analytics
+    from snapshot import Snapshot
+
+    snapshot = Snapshot(args.snapshot)
+    if args.type == "completion_heatmap":
+        return column_rows(
+            snapshot_analytics.completion_heatmap(snapshot, args.habit_id)
+        )
+
+    if args.type == "weekday_hours":
+        matrix = snapshot_analytics.weekday_hour_distribution(snapshot, args.habit_id)
+        return [
+            {"weekday": weekday} | {str(hour): count for hour, count in enumerate(row)}
+            for weekday, row in zip(WEEKDAYS, matrix.tolist())
+        ]
+
+    if args.habit_id is None:
+        raise ValueError(f"{args.type} requires --habit_id")
+    return column_rows(
+        snapshot_analytics.rolling_completion_rate(snapshot, args.habit_id, args.window)
+    )
+
+
+def run_batch(args):
+    """Run commands read one per line over the shared session, printing results as they go."""
+    for number, line in enumerate(args.file, start=1):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        try:
+            if line.startswith("["):
+                arguments = [str(argument) for argument in json.loads(line)]
+            else:
+                arguments = shlex.split(line)
+            # Options of the batch apply to every command unless it overrides them
+            options = ["--port", str(args.port), "--format", args.format]
+            if args.direct is not None:
+                options += ["--direct", args.direct]
+            command = parse_args(options + arguments)
+            if command.func is run_batch:
+                raise ValueError("batch commands cannot be nested")
+            command.func(command)
+        except (Exception, SystemExit) as e:
+            print(f"Error in line {number}: {e!r}", file=sys.stderr)
+        sys.stdout.flush()
+
+
 # CLI
 
 parser = argparse.ArgumentParser(description="Habit Tracker CLI")
@@ -267,6 +480,13 @@ parser.add_argument("--port", type=int, help="Port of the server", default=5000)
 parser.add_argument(
     "--format", choices=["table", "json"], help="Output format", default="table"
 )
+parser.add_argument(
+    "--direct",
+    type=str,
+    metavar="DB_PATH",
+    help="Run commands in process against the database file instead of the server",
+    default=None,
+)
 parser.set_defaults(func=lambda args: parser.print_help())
 
 
@@ -319,6 +539,11 @@ def assign_subparser_habits_create():
         help="The end of the habit to create, iso format, default 1 year from now",
         default=(datetime.now() + timedelta(days=365)).isoformat(),
     )
+    subparser.add_argument(
+        "--virtual",
+        action="store_true",
+        help="Only store completed tasks, open tasks are computed from the interval and lifetime",
+    )
     subparser.set_defaults(
         func=lambda args: output([req_habits_create(args)], args.format)
     )
@@ -343,7 +568,12 @@ def assign_subparser_habits_list():
         type=str,
         help="Filter by end date, can use < or > to filter, e.g. >2021-10-19T13:43:12",
     )
-    subparser.set_defaults(func=lambda args: output(req_habits_list(args), args.format))
+    subparser.add_argument(
+        "--page-size",
+        type=int,
+        help="Fetch the habits in pages of this size, printing each page as it arrives",
+    )
+    subparser.set_defaults(func=habits_list)
 
 
 def assign_subparser_habits_update():
@@ -424,7 +654,12 @@ def assign_subparser_tasks_list():
         type=str,
         help="Filter by end date, can use < or > to filter, e.g. >2021-10-19T13:43:12",
     )
-    subparser.set_defaults(func=lambda args: output(req_tasks_list(args), args.format))
+    subparser.add_argument(
+        "--page-size",
+        type=int,
+        help="Fetch the tasks in pages of this size, printing each page as it arrives",
+    )
+    subparser.set_defaults(func=tasks_list)
 
 
 def assign_subparser_tasks_active():
@@ -437,11 +672,22 @@ def assign_subparser_tasks_active():
 
 def assign_subparser_tasks_complete():
     """Assign subparser for tasks:complete."""
-    subparser = subparsers.add_parser("tasks:complete", help="Complete a task")
-    subparser.add_argument("--id", type=int, help="The id of the task to complete")
-    subparser.set_defaults(
-        func=lambda args: output(req_tasks_complete(args), args.format)
+    subparser = subparsers.add_parser(
+        "tasks:complete", help="Complete a task or a batch of tasks"
     )
+    group = subparser.add_mutually_exclusive_group()
+    group.add_argument("--id", type=int, help="The id of the task to complete")
+    group.add_argument(
+        "--ids",
+        type=str,
+        help="Comma separated ids of tasks to complete together, e.g. 1,2,3",
+    )
+    group.add_argument(
+        "--from-file",
+        type=str,
+        help='A JSON file with a list of task ids or objects with an "id" or a "habit_id" and "habit_order", and an optional "completed_at", to complete together',
+    )
+    subparser.set_defaults(func=lambda args: output(tasks_complete(args), args.format))
 
 
 def assign_subparser_analytics():
@@ -450,6 +696,11 @@ def assign_subparser_analytics():
         "list_current_habits": "List current (active) habits (can be filtered by interval)",
         "list_longest_streaks": "List longest streaks (can be filtered by habit_id)",
         "get_longest_streak": "Get longest streak (can be filtered by habit_id)",
+        "list_current_streaks": "List streaks that are still ongoing (can be filtered by habit_id)",
+        "habit_summary": "Completion rate, missed tasks, streaks and average completion latency per habit (can be filtered by habit_id, start and end)",
+        "completion_heatmap": "Tasks and completed tasks per day from a snapshot file (can be filtered by habit_id)",
+        "weekday_hours": "Completed tasks by weekday and hour from a snapshot file (can be filtered by habit_id)",
+        "rolling_completion_rate": "Completion rate over the last tasks of a habit at each of its tasks from a snapshot file (requires habit_id, see window)",
     }
 
     subparser = subparsers.add_parser(
@@ -473,21 +724,94 @@ def assign_subparser_analytics():
         type=str,
         help="The amount of streaks to filter by, can use < or > to filter, e.g. >4",
     )
+    subparser.add_argument(
+        "--start",
+        type=str,
+        help="Only include tasks starting at or after this datetime, e.g. 2023-10-24T08:00:00",
+    )
+    subparser.add_argument(
+        "--end",
+        type=str,
+        help="Only include tasks starting before this datetime, e.g. 2023-10-31T08:00:00",
+    )
+    subparser.add_argument(
+        "--snapshot",
+        type=str,
+        metavar="PATH",
+        help="The snapshot file written by the server with --snapshot, for the snapshot analytics",
+    )
+    subparser.add_argument(
+        "--window",
+        type=int,
+        help="The number of tasks of a rolling completion rate",
+        default=7,
+    )
     subparser.set_defaults(func=lambda args: analytics(args))
 
 
-assign_subparser_habits_create()
-assign_subparser_habits_list()
-assign_subparser_habits_update()
-assign_subparser_habits_delete()
-assign_subparser_tasks_list()
-assign_subparser_tasks_active()
-assign_subparser_tasks_complete()
-assign_subparser_analytics()
+def assign_subparser_batch():
+    """Assign subparser for batch."""
+    subparser = subparsers.add_parser(
+        "batch",
+        help="Run many commands over one connection, one per line as shell words or a JSON array of arguments",
+    )
+    subparser.add_argument(
+        "file",
+        nargs="?",
+        type=argparse.FileType("r"),
+        default="-",
+        help="The file to read commands from, stdin by default",
+    )
+    subparser.set_defaults(func=run_batch)
+
+
+# Subparsers by command, built by parse_args when needed
+commands = {
+    "habits:create": assign_subparser_habits_create,
+    "habits:list": assign_subparser_habits_list,
+    "habits:update": assign_subparser_habits_update,
+    "habits:delete": assign_subparser_habits_delete,
+    "tasks:list": assign_subparser_tasks_list,
+    "tasks:active": assign_subparser_tasks_active,
+    "tasks:complete": assign_subparser_tasks_complete,
+    "analytics": assign_subparser_analytics,
+    "batch": assign_subparser_batch,
+}
+assigned_commands = set()
+
+# Options of the main parser that take a value
+VALUE_OPTIONS = ("--port", "--format", "--direct")
+
+
+def parse_args(arguments: list[str] | None = None):
+    """Parse the arguments, building only the subparser of the command they name."""
+    if arguments is None:
+        arguments = sys.argv[1:]
+
+    command = None
+    skip = False
+    for argument in arguments:
+        if skip:
+            skip = False
+        elif argument in VALUE_OPTIONS:
+            skip = True
+        elif not argument.startswith("-"):
+            command = argument
+            break
+
+    # The help of the main parser and errors for unknown commands list all of them
+    names = [command] if command in commands else commands
+    for name in names:
+        if name not in assigned_commands:
+            commands[name]()
+            assigned_commands.add(name)
+
+    return parser.parse_args(arguments)
+
 
 # Parse arguments and call the function
 if __name__ == "__main__":
-    args = parser.parse_args()
+    args = parse_args()
 
     if hasattr(args, "func"):
         args.func(args)
@@ -1,147 +1,829 @@
+import heapq
+import json
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from copy import copy
+from functools import lru_cache
+from datetime import datetime, timedelta
+from itertools import islice, repeat
 from duration import Duration
 from habit import Habit
+from streak import Streak
 from task import Task
+from utils import from_epoch, parse_datetime, to_epoch
 
 
-con = sqlite3.connect("database.db", check_same_thread=False)
-db = con.cursor()
+DATABASE_PATH = "database.db"
 
-# Create tables if not exists
-db.execute(
-    """CREATE TABLE IF NOT EXISTS habits (
+# Seconds a connection waits for a lock held by another connection
+BUSY_TIMEOUT = 5.0
+
+# Number of idle connections kept open by the pool
+POOL_SIZE = 8
+
+# Number of task rows written per executemany call
+TASK_BATCH_SIZE = 1000
+
+# Number of rows fetched at a time when iterating over query results
+FETCH_SIZE = 500
+
+# Number of query shapes kept compiled by compile_query
+QUERY_CACHE_SIZE = 128
+
+# Number of prepared statements cached per connection, covers all compiled queries
+STATEMENT_CACHE_SIZE = 2 * QUERY_CACHE_SIZE
+
+# Number of habits kept by habit_cache
+HABIT_CACHE_SIZE = 4096
+
+# How far ahead of now tasks are materialized, as a Duration or a number of habit
+# intervals. None materializes all tasks up to the end of a habit. Set with set_horizon.
+horizon: Duration | int | None = None
+
+
+class ConnectionPool:
+    """A pool of sqlite3 connections handing out one connection per thread.
+
+    Connections run in WAL mode, so readers do not block each other or the writer,
+    with synchronous=NORMAL and a busy timeout for concurrent writers.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        """Initializes the pool, connections are opened on demand"""
+
+        self.path = path
+        self.idle = queue.LifoQueue(maxsize=size)
+        self.local = threading.local()
+        self.watch: sqlite3.Connection | None = None
+        self.watch_lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens and configures a new connection"""
+
+        # Connections are only used by one thread at a time, but move between threads
+        con = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = NORMAL")
+        con.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+        return con
+
+    def data_version(self) -> int:
+        """Returns PRAGMA data_version of a connection that never writes, which
+        changes whenever any other connection, of this or another process, commits
+        """
+
+        with self.watch_lock:
+            if self.watch is None:
+                self.watch = self.connect()
+            return self.watch.execute("PRAGMA data_version").fetchone()[0]
+
+    @contextmanager
+    def connection(self, bind: bool = True) -> Iterator[sqlite3.Connection]:
+        """Checks out a connection. If the current thread already has one checked out,
+        it is shared, and with it the open transaction. Otherwise a connection is taken
+        from the pool and, with bind, becomes the current thread's connection until the
+        block exits. Unbound connections can be held by generators that are resumed
+        from other threads.
+        """
+
+        con = getattr(self.local, "con", None)
+        if con is not None:
+            yield con
+            return
+
+        try:
+            con = self.idle.get_nowait()
+        except queue.Empty:
+            con = self.connect()
+
+        if bind:
+            self.local.con = con
+        try:
+            yield con
+        finally:
+            if bind:
+                self.local.con = None
+            if con.in_transaction:
+                con.rollback()
+            try:
+                self.idle.put_nowait(con)
+            except queue.Full:
+                con.close()
+
+
+# The pool of the open database, set by open_database
+pool: ConnectionPool | None = None
+database_ready = False
+database_lock = threading.RLock()
+
+
+def open_database(path: str = DATABASE_PATH):
+    """Opens the database at path for all following connections and creates or
+    migrates its schema, unless it is already open. Called with DATABASE_PATH by the
+    first connection if no database was opened before.
+    """
+
+    global pool, database_ready
+    with database_lock:
+        if database_ready and pool.path == path:
+            return
+        database_ready = False
+        pool = ConnectionPool(path)
+        habit_cache.invalidate()
+        migrate()
+        database_ready = True
+
+
+def database() -> ConnectionPool:
+    """Returns the pool of the open database, opening DATABASE_PATH if none is"""
+
+    if not database_ready:
+        # The thread opening the database migrates it with the new pool
+        with database_lock:
+            if pool is None:
+                open_database()
+    return pool
+
+
+def connection(bind: bool = True):
+    """Checks out a connection from the pool, see ConnectionPool.connection"""
+
+    return database().connection(bind)
+
+
+def fetch_rows(query: str, params: list) -> Iterator[tuple]:
+    """Lazily yields the rows of a query, fetching FETCH_SIZE rows at a time"""
+
+    with connection(bind=False) as con:
+        cursor = con.execute(query, params)
+        try:
+            while rows := cursor.fetchmany(FETCH_SIZE):
+                yield from rows
+        finally:
+            cursor.close()
+
+
+# Number of changes of the data seen by this process, see data_version
+data_version_counter = 0
+data_version_seen: int | None = None
+data_version_lock = threading.Lock()
+
+
+def data_version() -> int:
+    """Returns a counter that grows with every write committed by this process, and
+    with writes of other processes seen through ConnectionPool.data_version, so
+    readers can tell that nothing changed without running their query
+    """
+
+    global data_version_counter, data_version_seen
+    seen = database().data_version()
+    with data_version_lock:
+        if seen != data_version_seen:
+            data_version_seen = seen
+            data_version_counter += 1
+        return data_version_counter
+
+
+def bump_data_version():
+    """Advances the data version, called after every committed write"""
+
+    global data_version_counter
+    with data_version_lock:
+        data_version_counter += 1
+
+
+# Version of the schema, stored in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+HABITS_TABLE = """CREATE TABLE IF NOT EXISTS {name} (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     description TEXT NOT NULL,
     interval TEXT NOT NULL,
     lifetime TEXT NOT NULL,
     active INTEGER NOT NULL,
-    start TEXT NOT NULL,
-    end TEXT NOT NULL
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    virtual INTEGER NOT NULL DEFAULT 0,
+    materialized_until INTEGER,
+    last_order INTEGER NOT NULL DEFAULT 0
 )"""
-)
-db.execute(
-    """CREATE TABLE IF NOT EXISTS tasks (
+
+TASKS_TABLE = """CREATE TABLE IF NOT EXISTS {name} (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     habit_id INTEGER NOT NULL,
     habit_order INTEGER NOT NULL,
     completed INTEGER NOT NULL,
-    completed_at TEXT,
-    start TEXT NOT NULL,
-    end TEXT NOT NULL,
+    completed_at INTEGER,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
     FOREIGN KEY(habit_id) REFERENCES habits(id) ON DELETE CASCADE
 )"""
-)
 
+# Timestamp columns, stored as microseconds since utils.EPOCH from schema version 1
+# and as ISO 8601 text before
+TIMESTAMP_COLUMNS = {
+    "habits": ("start", "end", "materialized_until"),
+    "tasks": ("start", "end", "completed_at"),
+}
+
+
+def migrate():
+    """Creates the tables if they do not exist and brings the schema of an existing
+    database up to date
+    """
+
+    with connection() as con, con:
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        habits_exist = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'habits'"
+        ).fetchone()
+        if habits_exist is None:
+            version = SCHEMA_VERSION
+
+        con.execute(HABITS_TABLE.format(name="habits"))
+        con.execute(TASKS_TABLE.format(name="tasks"))
+
+        # Runs of consecutive completed tasks, maintained on task completion
+        streaks_exist = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'streaks'"
+        ).fetchone()
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS streaks (
+            habit_id INTEGER NOT NULL,
+            start_order INTEGER NOT NULL,
+            end_order INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            PRIMARY KEY (habit_id, start_order),
+            FOREIGN KEY(habit_id) REFERENCES habits(id) ON DELETE CASCADE
+        )"""
+        )
+
+        # Columns introduced after the initial schema
+        habit_columns = [
+            column[1] for column in con.execute("PRAGMA table_info(habits)")
+        ]
+        if "virtual" not in habit_columns:
+            con.execute(
+                "ALTER TABLE habits ADD COLUMN virtual INTEGER NOT NULL DEFAULT 0"
+            )
+        if "materialized_until" not in habit_columns:
+            con.execute("ALTER TABLE habits ADD COLUMN materialized_until INTEGER")
+        if "last_order" not in habit_columns:
+            con.execute(
+                "ALTER TABLE habits ADD COLUMN last_order INTEGER NOT NULL DEFAULT 0"
+            )
+            con.execute(
+                """UPDATE habits SET last_order = coalesce(
+                    (SELECT MAX(habit_order) FROM tasks WHERE habit_id = habits.id), 0
+                )"""
+            )
+
+    if version < 1:
+        migrate_timestamps("habits", HABITS_TABLE)
+        migrate_timestamps("tasks", TASKS_TABLE)
 
-def add_filters_to_query(query: str, filters: dict[str, str]) -> tuple[str, list[str]]:
-    """Adds filters to a query"""
+    with connection() as con, con:
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        # Secondary indexes for the task lookups by habit, the active task range
+        # filters and the open/completed task lists
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_habit_id_habit_order ON tasks (habit_id, habit_order)"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS tasks_start_end ON tasks (start, end)")
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_completed_habit_id ON tasks (completed, habit_id)"
+        )
+
+        # Streak lookups by the adjacent task on completion and longest first
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS streaks_habit_id_end_order ON streaks (habit_id, end_order)"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS streaks_length ON streaks (length)")
 
-    if len(filters) == 0:
-        return query
+        # Habits whose tasks are only materialized up to a horizon
+        con.execute(
+            """CREATE INDEX IF NOT EXISTS habits_materialized_until ON habits (materialized_until)
+            WHERE materialized_until IS NOT NULL"""
+        )
+
+        # Version counter of the habit definitions, bumped by triggers on every
+        # write from any connection, see HabitCache
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )"""
+        )
+        con.execute(
+            "INSERT OR IGNORE INTO versions (name, version) VALUES ('habits', 0)"
+        )
+        for trigger, event in (
+            ("insert", "INSERT"),
+            ("delete", "DELETE"),
+            (
+                "update",
+                'UPDATE OF name, description, interval, lifetime, active, start, "end", virtual',
+            ),
+        ):
+            con.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS habits_version_{trigger} AFTER {event} ON habits
+                BEGIN
+                    UPDATE versions SET version = version + 1 WHERE name = 'habits';
+                END"""
+            )
+
+        # Databases created before the streaks table already hold completed tasks
+        if streaks_exist is None:
+            rebuild_streaks()
+
+
+def migrate_timestamps(table: str, schema: str):
+    """Converts the ISO 8601 timestamps of a table to epoch microseconds online.
+
+    Rows are copied in batches of TASK_BATCH_SIZE, each in its own transaction, into
+    a new table that triggers keep in sync with writes from other connections. The
+    new table then replaces the old one in a single short transaction. An
+    interrupted migration starts over on the next run.
+    """
+
+    new = table + "_v1"
+    with connection() as con:
+        columns = [column[1] for column in con.execute(f"PRAGMA table_info({table})")]
+
+        def values(prefix: str) -> str:
+            return ", ".join(
+                epoch_sql(prefix + column)
+                if column in TIMESTAMP_COLUMNS[table]
+                else prefix + column
+                for column in columns
+            )
 
+        insert = f"INSERT OR REPLACE INTO {new} ({', '.join(columns)})"
+        with con:
+            con.execute(schema.format(name=new))
+            con.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS {new}_insert AFTER INSERT ON {table}
+                BEGIN {insert} VALUES ({values("NEW.")}); END"""
+            )
+            con.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS {new}_update AFTER UPDATE ON {table}
+                BEGIN
+                    DELETE FROM {new} WHERE id = OLD.id;
+                    {insert} VALUES ({values("NEW.")});
+                END"""
+            )
+            con.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS {new}_delete AFTER DELETE ON {table}
+                BEGIN DELETE FROM {new} WHERE id = OLD.id; END"""
+            )
+
+        # Ids of stored virtual tasks are negative
+        after = -(1 << 63)
+        while True:
+            with con:
+                bound = con.execute(
+                    f"SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?",
+                    (after, TASK_BATCH_SIZE - 1),
+                ).fetchone()
+                query = f"{insert} SELECT {values('')} FROM {table} WHERE id > ?"
+                if bound is None:
+                    con.execute(query, (after,))
+                else:
+                    con.execute(query + " AND id <= ?", (after, bound[0]))
+            if bound is None:
+                break
+            after = bound[0]
+
+        with con:
+            con.execute("BEGIN IMMEDIATE")
+            sequence = con.execute(
+                "SELECT coalesce(MAX(seq), 0) FROM sqlite_sequence WHERE name in (?, ?)",
+                (table, new),
+            ).fetchone()[0]
+            for trigger in ("insert", "update", "delete"):
+                con.execute(f"DROP TRIGGER {new}_{trigger}")
+            con.execute(f"DROP TABLE {table}")
+            con.execute(f"ALTER TABLE {new} RENAME TO {table}")
+
+            # Keep AUTOINCREMENT from reusing the ids of deleted rows
+            con.execute(
+                "DELETE FROM sqlite_sequence WHERE name in (?, ?)", (table, new)
+            )
+            con.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                (table, sequence),
+            )
+
+
+def epoch_sql(column: str) -> str:
+    """Returns an SQL expression converting an ISO 8601 text column to epoch
+    microseconds, see utils.to_epoch. Values with a UTC offset are converted to local
+    time. Other values are kept as they are.
+    """
+
+    # Values with a UTC offset are converted to local time like utils.naive_local,
+    # the others are in local time already. The fraction is made of the digits
+    # following the seconds, up to an offset.
+    rest = f"substr({column}, 20)"
+    offset = f"instr({rest}, '+') OR instr({rest}, '-') OR instr({rest}, 'Z')"
+    fraction = f"substr({column}, 21)"
+    digits = f"length({fraction}) - length(ltrim({fraction}, '0123456789'))"
+    return f"""CASE WHEN typeof({column}) = 'text' THEN
+        CAST(CASE WHEN {offset} THEN strftime('%s', {column}, 'localtime')
+            ELSE strftime('%s', {column}) END AS INTEGER) * 1000000
+        + CASE WHEN substr({column}, 20, 1) = '.' THEN
+            CAST(substr(substr({fraction}, 1, {digits}) || '000000', 1, 6) AS INTEGER)
+        ELSE 0 END
+        ELSE {column} END"""
+
+
+# Columns stored as INTEGER, filter values for them are bound as int
+INTEGER_COLUMNS = {
+    "id",
+    "habit_id",
+    "habit_order",
+    "completed",
+    "active",
+    "virtual",
+    "length",
+}
+
+# Columns stored as epoch microseconds, filter values for them are bound as such
+DATETIME_COLUMNS = {"start", "end", "completed_at", "materialized_until"}
+
+
+def add_filters_to_query(
+    query: str,
+    filters: dict[str, str],
+    order_by: tuple[str, ...] = (),
+    after: tuple | None = None,
+    limit: int | None = None,
+) -> tuple[str, list[str]]:
+    """Adds filters to a query.
+
+    Values are bound with the storage class of their column (int for INTEGER columns,
+    epoch microseconds for datetimes), so every predicate is a plain comparison the query
+    planner can answer from an index.
+
+    Rows are sorted by the order_by columns. For keyset pagination, after holds the
+    order_by values of the last row of the previous page and limit the page size.
+
+    The SQL only depends on the columns and operators used, not on the values, and is
+    compiled once per shape by compile_query. IN lists are bound as a single JSON
+    array, so their length does not change the SQL either.
+    """
+
+    shape = []
     params = []
-    query += " WHERE"
     for key, value in filters.items():
-        if value == None:
+        if value is None:
             continue
 
+        operator = "="
         if isinstance(value, str):
-            if value.startswith("<"):
-                query += f" {key} < ? AND"
-                params.append(value[1:])
-                continue
-            if value.startswith(">"):
-                query += f" {key} > ? AND"
-                params.append(value[1:])
-                continue
-            if value.startswith("*in(") and value.endswith(")"):
-                query += (
-                    f" {key} in ({','.join(['?' for _ in value[4:-1].split(',')])}) AND"
-                )
-                params.extend(value[4:-1].split(","))
+            if value.startswith("<") or value.startswith(">"):
+                operator = value[0]
+                value = value[1:]
+            elif value.startswith("*in(") and value.endswith(")"):
+                values = [
+                    filter_value(key, item.strip()) for item in value[4:-1].split(",")
+                ]
+                shape.append((key, "IN"))
+                params.append(json_list(values))
                 continue
 
-        query += f" {key} = ? AND"
-        params.append(value)
+        shape.append((key, operator))
+        params.append(filter_value(key, value))
 
-    return query[:-4], params
+    if after is not None:
+        params.append(filter_value(order_by[0], after[0]))
+        if len(order_by) > 1:
+            params.extend(
+                filter_value(key, value) for key, value in zip(order_by, after)
+            )
+
+    if limit is not None:
+        params.append(int(limit))
+
+    query = compile_query(
+        query, tuple(shape), tuple(order_by), after is not None, limit is not None
+    )
+    return query, params
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_query(
+    query: str,
+    shape: tuple[tuple[str, str], ...],
+    order_by: tuple[str, ...],
+    after: bool,
+    limit: bool,
+) -> str:
+    """Builds the SQL of add_filters_to_query from the (column, operator) pairs of the
+    filters, the order_by columns and whether a keyset cursor and limit are bound
+    """
+
+    predicates = []
+    for key, operator in shape:
+        if operator == "IN":
+            predicates.append(f"{key} IN (SELECT value FROM json_each(?))")
+        else:
+            predicates.append(f"{key} {operator} ?")
+
+    if after:
+        if len(order_by) == 1:
+            predicates.append(f"{order_by[0]} > ?")
+        else:
+            # The range on the leading column can use an index, the row value
+            # comparison skips the rows of the previous page sharing its value
+            predicates.append(f"{order_by[0]} >= ?")
+            predicates.append(
+                f"({', '.join(order_by)}) > ({', '.join(['?' for _ in order_by])})"
+            )
+
+    if len(predicates) > 0:
+        query += " WHERE " + " AND ".join(predicates)
+
+    if len(order_by) > 0:
+        query += " ORDER BY " + ", ".join(order_by)
+
+    if limit:
+        query += " LIMIT ?"
+
+    return query
+
+
+def query_cache_info() -> dict[str, int]:
+    """Returns the hit and miss counters and the size of the compiled query cache"""
+
+    info = compile_query.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
+
+
+def json_list(values: Iterable) -> str:
+    """Encodes values as a JSON array, bound to json_each(?) in place of an IN list"""
+
+    return json.dumps(list(values))
+
+
+def filter_value(key: str, value):
+    """Converts a filter value to the storage class of its column"""
+
+    if isinstance(value, datetime):
+        return to_epoch(value)
+    if key in DATETIME_COLUMNS:
+        return to_epoch(parse_datetime(value))
+    if key in INTEGER_COLUMNS:
+        return int(value)
+    return value
 
 
 # Habits
 
 
+class HabitCache:
+    """A read-through cache of Habit objects by id, holding up to size habits.
+
+    Entries belong to one value of the habits version counter, which triggers bump
+    on every write from any connection, so a changed counter empties the cache.
+    """
+
+    def __init__(self, size: int = HABIT_CACHE_SIZE):
+        """Initializes an empty cache"""
+
+        self.size = size
+        self.habits: OrderedDict[int, Habit] = OrderedDict()
+        self.version: int | None = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def sync(self, version: int):
+        """Empties the cache if it holds habits of another version. Needs the lock."""
+
+        if version != self.version:
+            self.habits.clear()
+            self.version = version
+
+    def get(self, ids: Iterable[int], version: int) -> tuple[list[Habit], list[int]]:
+        """Returns the cached habits of ids and the ids that are not cached"""
+
+        found = []
+        missing = []
+        with self.lock:
+            self.sync(version)
+            for id in ids:
+                habit = self.habits.get(id)
+                if habit is None:
+                    missing.append(id)
+                    self.misses += 1
+                else:
+                    self.habits.move_to_end(id)
+                    found.append(habit)
+                    self.hits += 1
+        return found, missing
+
+    def put(self, habits: list[Habit], version: int):
+        """Adds habits read at version, evicting the least recently used habits"""
+
+        with self.lock:
+            if version != self.version:
+                return
+            for habit in habits:
+                self.habits[habit.id] = habit
+                self.habits.move_to_end(habit.id)
+            while len(self.habits) > self.size:
+                self.habits.popitem(last=False)
+
+    def invalidate(self):
+        """Empties the cache"""
+
+        with self.lock:
+            self.habits.clear()
+            self.version = None
+
+    def info(self) -> dict[str, int]:
+        """Returns the hit and miss counters and the size of the cache"""
+
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.habits),
+                "max_size": self.size,
+            }
+
+
+habit_cache = HabitCache()
+
+
+def habit_cache_info() -> dict[str, int]:
+    """Returns the hit and miss counters and the size of the habit cache"""
+
+    return habit_cache.info()
+
+
 def habit_create(habit: Habit, start_time: datetime | None = None):
-    """Creates a habit in the database"""
-
-    db.execute(
-        """INSERT INTO habits (
-            name, 
-            description, 
-            interval, 
-            lifetime,
-            active, 
-            start,
-            end
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (
-            habit.name,
-            habit.description,
-            habit.interval.duration_str,
-            habit.lifetime.duration_str,
-            habit.active,
-            habit.start.isoformat(),
-            habit.end.isoformat(),
-        ),
-    )
-    con.commit()
-    habit.id = db.lastrowid
+    """Creates a habit and its tasks up to the horizon in the database in a single
+    transaction
+    """
 
-    create_tasks_for_habit(habit, start_time=start_time)
+    until = horizon_end(habit, datetime.now()) if not habit.virtual else habit.end
+
+    with connection() as con, con:
+        cursor = con.execute(
+            """INSERT INTO habits (
+                name, 
+                description, 
+                interval, 
+                lifetime,
+                active, 
+                start,
+                end,
+                virtual,
+                materialized_until
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                habit.name,
+                habit.description,
+                habit.interval.duration_str,
+                habit.lifetime.duration_str,
+                habit.active,
+                to_epoch(habit.start),
+                to_epoch(habit.end),
+                habit.virtual,
+                to_epoch(until) if until < habit.end else None,
+            ),
+        )
+        habit.id = cursor.lastrowid
+
+        if not habit.virtual:
+            ids = create_tasks_for_habit(habit, start_time=start_time, until=until)
+            con.execute(
+                "UPDATE habits SET last_order = ? WHERE id = ?", (len(ids), habit.id)
+            )
+
+    habit_cache.invalidate()
+    bump_data_version()
 
 
 def habit_update(habit: Habit):
-    """Updates a habit in the database"""
+    """Updates a habit in the database in a single transaction. Its future tasks are
+    only regenerated if the interval or lifetime changed, which virtual habits do not
+    allow as their tasks are computed from the start of the habit.
+    """
 
     if habit.id is None:
         raise ValueError("Habit id is None")
 
-    db.execute(
-        """UPDATE habits SET 
-            name = ?,
-            description = ?,
-            interval = ?,
-            lifetime = ?,
-            active = ?
-        WHERE id = ?""",
-        (
-            habit.name,
-            habit.description,
-            habit.interval.duration_str,
-            habit.lifetime.duration_str,
-            habit.active,
-            habit.id,
-        ),
-    )
+    with connection() as con, con:
+        row = con.execute(
+            "SELECT interval, lifetime, virtual FROM habits WHERE id = ?", (habit.id,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Habit with id {habit.id} does not exist")
 
-    db.execute(
-        """DELETE FROM tasks WHERE id IN (SELECT id FROM tasks WHERE habit_id = ? AND start > ?)""",
-        (
-            habit.id,
-            datetime.now().isoformat(),
-        ),
-    )
+        rescheduled = (
+            Duration(row[0]).duration != habit.interval.duration
+            or Duration(row[1]).duration != habit.lifetime.duration
+        )
+        if rescheduled and row[2]:
+            raise ValueError(
+                "The interval and lifetime of virtual habits cannot be changed"
+            )
+
+        con.execute(
+            """UPDATE habits SET 
+                name = ?,
+                description = ?,
+                interval = ?,
+                lifetime = ?,
+                active = ?
+            WHERE id = ?""",
+            (
+                habit.name,
+                habit.description,
+                habit.interval.duration_str,
+                habit.lifetime.duration_str,
+                habit.active,
+                habit.id,
+            ),
+        )
 
-    con.commit()
+        if rescheduled:
+            reschedule_habit(habit, datetime.now())
 
-    db.execute("""SELECT habit_order FROM tasks ORDER BY habit_order DESC LIMIT 1""")
+    habit_cache.invalidate()
+    bump_data_version()
+    return habit_list(id=habit.id)[0]
 
-    habit_order_no = db.fetchone()[0]
 
-    create_tasks_for_habit(habit, habit_order_no)
+def reschedule_habit(habit: Habit, now: datetime):
+    """Replaces the tasks of a habit starting after now with tasks following its
+    interval and lifetime, continuing the habit order after the last kept task.
+    Does not commit, see create_tasks_for_habit.
+    """
 
-    return habit_list(id=habit.id)[0]
+    with connection() as con:
+        completed = con.execute(
+            """SELECT 1 FROM tasks WHERE habit_id = ? AND start > ? AND completed = 1
+            LIMIT 1""",
+            (habit.id, to_epoch(now)),
+        ).fetchone()
+        con.execute(
+            "DELETE FROM tasks WHERE habit_id = ? AND start > ?",
+            (habit.id, to_epoch(now)),
+        )
+
+        # Future tasks may have been completed ahead of time
+        if completed is not None:
+            rebuild_streaks((habit.id,))
+
+        last = con.execute(
+            """SELECT habit_order, start FROM tasks WHERE habit_id = ?
+            ORDER BY habit_order DESC LIMIT 1""",
+            (habit.id,),
+        ).fetchone()
+        interval = habit.interval.duration
+        if last is not None:
+            habit_order_no = last[0]
+            start_time = from_epoch(last[1]) + interval
+        else:
+            habit_order_no = 0
+            start_time = habit.start
+
+        # Skip the occurrences of the new interval that are already in the past
+        if isinstance(interval, timedelta) and start_time <= now:
+            start_time += ((now - start_time) // interval + 1) * interval
+        while start_time <= now:
+            start_time += interval
+
+        until = horizon_end(habit, now)
+        ids = create_tasks_for_habit(habit, habit_order_no, start_time, until)
+        con.execute(
+            "UPDATE habits SET last_order = ?, materialized_until = ? WHERE id = ?",
+            (
+                habit_order_no + len(ids),
+                to_epoch(until) if until < habit.end else None,
+                habit.id,
+            ),
+        )
 
 
 def habit_list(
@@ -151,52 +833,155 @@ def habit_list(
     interval: Duration | None = None,
     lifetime: Duration | None = None,
     active: bool | None = None,
+    virtual: bool | None = None,
 ) -> list[Habit]:
     """Lists habits with filtering support"""
 
+    with connection():
+        return list(
+            habit_iter(id, name, description, interval, lifetime, active, virtual)
+        )
+
+
+def habit_iter(
+    id: int | None = None,
+    name: str | None = None,
+    description: str | None = None,
+    interval: Duration | None = None,
+    lifetime: Duration | None = None,
+    active: bool | None = None,
+    virtual: bool | None = None,
+    after: int | None = None,
+    limit: int | None = None,
+) -> Iterator[Habit]:
+    """Lazily yields habits with filtering support ordered by id, fetching rows in
+    chunks. Pages start after the habit with id after and hold up to limit habits.
+    """
+
+    filters = {
+        "id": id,
+        "name": name,
+        "description": description,
+        "interval": interval.duration_str if interval is not None else None,
+        "lifetime": lifetime.duration_str if lifetime is not None else None,
+        "active": active,
+        "virtual": virtual,
+    }
+
+    habits = habit_lookup(filters)
+    if habits is not None:
+        if after is not None:
+            habits = (habit for habit in habits if habit.id > int(after))
+        return islice(habits, limit)
+
     query, params = add_filters_to_query(
         "SELECT * FROM habits",
-        {
-            "id": id,
-            "name": name,
-            "description": description,
-            "interval": interval.duration_str if interval is not None else None,
-            "lifetime": lifetime.duration_str if lifetime is not None else None,
-            "active": active,
-        },
+        filters,
+        order_by=("id",),
+        after=(after,) if after is not None else None,
+        limit=limit,
     )
 
-    db.execute(query, params)
+    return map(habit_from_row, fetch_rows(query, params))
 
-    habits = db.fetchall()
 
-    return [
-        Habit(
-            id=habit[0],
-            name=habit[1],
-            description=habit[2],
-            interval=habit[3],
-            lifetime=habit[4],
-            active=bool(habit[5]),
-            start=habit[6],
-            end=habit[7],
+def habit_lookup(filters: dict) -> list[Habit] | None:
+    """Answers a habit_iter lookup by id or id list from habit_cache, reading missing
+    habits in the same read transaction as the version counter. Returns copies ordered
+    by id, or None for other lookups, which are streamed from the database.
+    """
+
+    id = filters["id"]
+    if isinstance(id, str):
+        if id.startswith("*in(") and id.endswith(")"):
+            ids = list(dict.fromkeys(int(item) for item in id[4:-1].split(",")))
+        elif id.startswith("<") or id.startswith(">"):
+            return None
+        else:
+            ids = [int(id)]
+    elif id is not None:
+        ids = [id]
+    else:
+        return None
+
+    values = {}
+    for key, value in filters.items():
+        if key == "id" or value is None:
+            continue
+        if isinstance(value, str) and value.startswith(("<", ">", "*in(")):
+            return None
+        values[key] = (
+            filter_value(key, value) if key in ("active", "virtual") else value
         )
-        for habit in habits
-    ]
+
+    with connection() as con:
+        # Habits read inside a write transaction may not be committed
+        cacheable = not con.in_transaction
+        if cacheable:
+            con.execute("BEGIN")
+        try:
+            version = con.execute(
+                "SELECT version FROM versions WHERE name = 'habits'"
+            ).fetchone()[0]
+            habits, missing = habit_cache.get(ids, version)
+            if missing:
+                fetched = [
+                    habit_from_row(row)
+                    for row in con.execute(
+                        "SELECT * FROM habits WHERE id IN (SELECT value FROM json_each(?))",
+                        (json_list(missing),),
+                    )
+                ]
+                if cacheable:
+                    habit_cache.put(fetched, version)
+                habits += fetched
+        finally:
+            if cacheable:
+                con.commit()
+
+    columns = {
+        "name": lambda habit: habit.name,
+        "description": lambda habit: habit.description,
+        "interval": lambda habit: habit.interval.duration_str,
+        "lifetime": lambda habit: habit.lifetime.duration_str,
+        "active": lambda habit: int(habit.active),
+        "virtual": lambda habit: int(habit.virtual),
+    }
+    return sorted(
+        (
+            copy(habit)
+            for habit in habits
+            if all(columns[key](habit) == value for key, value in values.items())
+        ),
+        key=lambda habit: habit.id,
+    )
+
+
+def habit_from_row(habit: tuple) -> Habit:
+    """Creates a Habit from a row of the habits table"""
+
+    return Habit.from_row(habit)
 
 
 def habit_delete(ids: tuple[int]):
-    """Deletes a Habit from the database"""
+    """Deletes habits, their tasks and their streaks from the database in a single
+    transaction
+    """
 
-    query = "DELETE FROM habits WHERE id in (" + ",".join(["?" for _ in ids]) + ")"
+    with connection() as con, con:
+        con.execute(
+            "DELETE FROM habits WHERE id in (SELECT value FROM json_each(?))",
+            (json_list(ids),),
+        )
 
-    db.execute(
-        query,
-        ids,
-    )
-    con.commit()
+        delete_tasks_of_habits(ids)
+        con.execute(
+            "DELETE FROM streaks WHERE habit_id in (SELECT value FROM json_each(?))",
+            (json_list(ids),),
+        )
 
-    task_delete_by_habit(ids)
+    habit_cache.invalidate()
+    bump_data_version()
 
 
 # Tasks
@@ -205,34 +990,101 @@ def habit_delete(ids: tuple[int]):
 def task_create(task: Task):
     """Creates a task in the database"""
 
-    db.execute(
-        """INSERT INTO tasks (
-            habit_id, 
-            habit_order,
-            completed, 
-            start, 
-            end
-        ) VALUES (?, ?, ?, ?, ?)""",
-        (
-            task.habit_id,
-            task.habit_order,
-            task.completed,
-            task.start.isoformat(),
-            task.end.isoformat(),
-        ),
-    )
-    con.commit()
-    task.id = db.lastrowid
+    with connection() as con, con:
+        cursor = con.execute(
+            """INSERT INTO tasks (
+                habit_id, 
+                habit_order,
+                completed, 
+                start, 
+                end
+            ) VALUES (?, ?, ?, ?, ?)""",
+            (
+                task.habit_id,
+                task.habit_order,
+                task.completed,
+                to_epoch(task.start),
+                to_epoch(task.end),
+            ),
+        )
+    task.id = cursor.lastrowid
+    bump_data_version()
+
+
+def task_complete(task_id: int, completed_at: datetime | None = None):
+    """Marks a task as completed and adds it to the streaks of its habit.
+    Tasks of virtual habits are stored on completion.
+    """
+
+    with connection() as con, con:
+        mark_task_completed(task_id, completed_at)
+    bump_data_version()
+
+
+def task_complete_many(
+    completions: Iterable[tuple[int | tuple[int, int], datetime | None]]
+) -> list[int]:
+    """Marks many tasks as completed in a single transaction, see task_complete.
+    Each task is given by its id or by (habit_id, habit_order), together with its
+    completion time or None for now. Returns the ids of the completed tasks.
+    """
+
+    ids = []
+    with connection() as con, con:
+        for task, completed_at in completions:
+            task_id = task_id_for_order(*task) if isinstance(task, tuple) else task
+            mark_task_completed(task_id, completed_at)
+            ids.append(task_id)
+    bump_data_version()
+    return ids
 
 
-def task_complete(task_id: int):
-    """Marks a task as completed"""
+def mark_task_completed(task_id: int, completed_at: datetime | None = None):
+    """Marks a task as completed, see task_complete. Does not commit, see
+    create_tasks_for_habit.
+    """
+
+    if completed_at is None:
+        completed_at = datetime.now()
+
+    if task_id < 0:
+        virtual_task_complete(task_id, completed_at)
+        return
+
+    with connection() as con:
+        con.execute(
+            """UPDATE tasks SET completed = 1, completed_at = ? WHERE id = ?""",
+            (to_epoch(completed_at), task_id),
+        )
+        row = con.execute(
+            "SELECT habit_id, habit_order FROM tasks WHERE id = ?", (task_id,)
+        ).fetchone()
 
-    db.execute(
-        """UPDATE tasks SET completed = 1, completed_at = ? WHERE id = ?""",
-        (datetime.now(), task_id),
+    if row is None:
+        raise ValueError(f"Task with id {task_id} does not exist")
+    add_to_streaks(*row)
+
+
+def task_id_for_order(habit_id: int, habit_order: int) -> int:
+    """Returns the id of the task of a habit with the given habit order"""
+
+    with connection() as con:
+        row = con.execute(
+            "SELECT id FROM tasks WHERE habit_id = ? AND habit_order = ?",
+            (habit_id, habit_order),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+        virtual = con.execute(
+            "SELECT 1 FROM habits WHERE id = ? AND virtual = 1", (habit_id,)
+        ).fetchone()
+        if virtual is not None:
+            return virtual_task_id(habit_id, habit_order)
+
+    raise ValueError(
+        f"Task with habit_id {habit_id} and habit_order {habit_order} does not exist"
     )
-    con.commit()
 
 
 def task_list(
@@ -241,70 +1093,741 @@ def task_list(
     start: datetime | None = None,
     end: datetime | None = None,
 ) -> list[Task]:
-    """Lists tasks with filtering support"""
+    """Lists tasks with filtering support, ordered by start and id.
+    Open tasks of virtual habits are computed from the habit and merged in.
+    """
 
-    query, params = add_filters_to_query(
-        "SELECT * FROM tasks",
-        {"habit_id": habit_id, "completed": completed, "start": start, "end": end},
+    with connection():
+        return list(task_iter(habit_id, completed, start, end))
+
+
+def task_iter(
+    habit_id: int | None = None,
+    completed: bool | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: int | None = None,
+    limit: int | None = None,
+) -> Iterator[Task]:
+    """Lazily yields tasks with filtering support, fetching rows in chunks, see task_list.
+    Pages start after the task with id after and hold up to limit tasks.
+    """
+
+    cursor = task_cursor(after) if after is not None else None
+
+    stored_tasks = map(
+        task_from_row,
+        fetch_rows(*task_list_query(habit_id, completed, start, end, cursor, limit)),
     )
 
-    db.execute(query, params)
+    if completed is True:
+        return stored_tasks
 
-    tasks = db.fetchall()
+    tasks = heapq.merge(
+        stored_tasks,
+        virtual_task_list(habit_id, start, end, cursor),
+        key=task_order_key,
+    )
 
-    return [
-        Task(
-            id=task[0],
-            habit_id=task[1],
-            habit_order=task[2],
-            completed=bool(task[3]),
-            completed_at=task[4],
-            start=task[5],
-            end=task[6],
-        )
-        for task in tasks
-    ]
+    return islice(tasks, limit) if limit is not None else tasks
 
 
-def task_delete_by_habit(habit_ids: tuple[int]):
-    """Deletes Tasks from the database"""
+def task_habit_iter(
+    habit_id: int | None = None,
+    completed: bool | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: int | None = None,
+    limit: int | None = None,
+) -> Iterator[tuple[Task, str, str]]:
+    """Lazily yields tasks like task_iter together with the name and description of
+    their habit, joined in the query of the stored tasks
+    """
+
+    cursor = task_cursor(after) if after is not None else None
 
-    query = (
-        "DELETE FROM tasks WHERE habit_id in ("
-        + ",".join(["?" for _ in habit_ids])
-        + ")"
+    stored_tasks = (
+        (task_from_row(row), row[7], row[8])
+        for row in fetch_rows(
+            *task_list_query(
+                habit_id, completed, start, end, cursor, limit, include_habit=True
+            )
+        )
     )
 
-    db.execute(
-        query,
-        habit_ids,
+    if completed is True:
+        return stored_tasks
+
+    habits = {habit.id: habit for habit in habit_list(id=habit_id, virtual=True)}
+    virtual_tasks = (
+        (task, habits[task.habit_id].name, habits[task.habit_id].description)
+        for task in virtual_task_list(habit_id, start, end, cursor, habits.values())
+    )
+    tasks = heapq.merge(
+        stored_tasks, virtual_tasks, key=lambda item: task_order_key(item[0])
+    )
+
+    return islice(tasks, limit) if limit is not None else tasks
+
+
+def task_cursor(task_id: int) -> tuple[datetime, int]:
+    """Returns the task_order_key of a task, used as keyset pagination cursor"""
+
+    if task_id < 0:
+        task = virtual_task_get(task_id)
+        task_start = task.start if task is not None else None
+    else:
+        with connection() as con:
+            row = con.execute(
+                "SELECT start FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+        task_start = from_epoch(row[0]) if row is not None else None
+
+    if task_start is None:
+        raise ValueError(f"Task with id {task_id} does not exist")
+
+    return (task_start, task_id)
+
+
+def task_from_row(task: tuple) -> Task:
+    """Creates a Task from a row of the tasks table"""
+
+    return Task.from_row(task)
+
+
+# Tasks with the name and description of their habit appended. The subquery is
+# flattened into the join, so filters and ordering still use the task indexes.
+TASKS_WITH_HABITS = """SELECT * FROM (
+    SELECT tasks.*, habits.name AS habit_name, habits.description AS habit_description
+    FROM tasks JOIN habits ON habits.id = tasks.habit_id
+)"""
+
+
+def task_list_query(
+    habit_id: int | None = None,
+    completed: bool | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: tuple[datetime, int] | None = None,
+    limit: int | None = None,
+    include_habit: bool = False,
+) -> tuple[str, list]:
+    """Builds the query and parameters used by task_iter, with include_habit those
+    used by task_habit_iter
+    """
+
+    return add_filters_to_query(
+        TASKS_WITH_HABITS if include_habit else "SELECT * FROM tasks",
+        {"habit_id": habit_id, "completed": completed, "start": start, "end": end},
+        order_by=("start", "id"),
+        after=after,
+        limit=limit,
     )
 
-    con.commit()
+
+def task_order_key(task: Task) -> tuple[datetime, int]:
+    """Sort key matching the order of task_list"""
+
+    return (task.start, task.id)
+
+
+def task_delete_by_habit(habit_ids: tuple[int]):
+    """Deletes the Tasks of habits from the database"""
+
+    with connection() as con, con:
+        delete_tasks_of_habits(habit_ids)
+    bump_data_version()
+
+
+def delete_tasks_of_habits(habit_ids: tuple[int]):
+    """Deletes the tasks of habits. Does not commit, see create_tasks_for_habit."""
+
+    with connection() as con:
+        con.execute(
+            "DELETE FROM tasks WHERE habit_id in (SELECT value FROM json_each(?))",
+            (json_list(habit_ids),),
+        )
 
 
 def create_tasks_for_habit(
-    habit: Habit, habit_order_no: int = 0, start_time: datetime | None = None
-):
+    habit: Habit,
+    habit_order_no: int = 0,
+    start_time: datetime | None = None,
+    until: datetime | None = None,
+) -> range:
     """Creates tasks for a habit. If start_time is provided, tasks will be created from that time onwards.
     Otherwise, tasks will be created from the habit's start time onwards.
     If habit_order_no is provided, tasks will be created from that order onwards.
+    If until is provided, only tasks starting before it will be created.
+
+    Tasks are inserted in batches of TASK_BATCH_SIZE without committing, so callers
+    can write the habit and all of its tasks in one transaction.
+    Returns the ids assigned to the created tasks, in habit order.
     """
-    current = (
-        start_time
-        if start_time is not None and (start_time >= habit.start)
-        else habit.start
+
+    return insert_task_rows(
+        task_rows_for_habit(habit, habit_order_no, start_time, until)
     )
-    current_order = habit_order_no + 1
-    while current < habit.end:
-        task_create(
-            Task(
-                habit_id=habit.id,
-                habit_order=current_order,
-                completed=False,
-                start=current,
-                end=current + habit.lifetime.duration,
+
+
+def insert_task_rows(rows: Iterable[tuple]) -> range:
+    """Inserts task rows in batches of TASK_BATCH_SIZE without committing, see
+    create_tasks_for_habit. Returns the ids assigned to the rows.
+    """
+
+    rows = iter(rows)
+    first_id = None
+    last_id = None
+
+    with connection() as con:
+        while True:
+            batch = list(islice(rows, TASK_BATCH_SIZE))
+            if len(batch) == 0:
+                break
+
+            con.executemany(
+                """INSERT INTO tasks (
+                habit_id, 
+                habit_order,
+                completed, 
+                start, 
+                end
+            ) VALUES (?, ?, ?, ?, ?)""",
+                batch,
             )
+
+            # AUTOINCREMENT ids are contiguous within a write transaction
+            last_id = con.execute("SELECT last_insert_rowid()").fetchone()[0]
+            if first_id is None:
+                first_id = last_id - len(batch) + 1
+
+    if first_id is None:
+        return range(0)
+
+    return range(first_id, last_id + 1)
+
+
+def task_rows_for_habit(
+    habit: Habit,
+    habit_order_no: int = 0,
+    start_time: datetime | None = None,
+    until: datetime | None = None,
+    limit: int | None = None,
+) -> Iterator[tuple]:
+    """Yields the task rows to insert for a habit, at most limit of them, see
+    create_tasks_for_habit. Their timestamps are computed by habit_occurrences in
+    batches of TASK_BATCH_SIZE, so only one batch is held at a time.
+    """
+
+    # Imported on first use, numpy takes long to import for commands not writing
+    from occurrences import habit_occurrence_batches
+
+    first_order = habit_order_no + 1
+    for starts, ends in habit_occurrence_batches(
+        habit, start_time, until, TASK_BATCH_SIZE, limit
+    ):
+        yield from zip(
+            repeat(habit.id),
+            range(first_order, first_order + len(starts)),
+            repeat(False),
+            starts.tolist(),
+            ends.tolist(),
         )
-        current += habit.interval.duration
-        current_order += 1
+        first_order += len(starts)
+
+
+# Horizons
+#
+# With a horizon, habits only materialize the tasks starting before the horizon and
+# store that bound in materialized_until, which is NULL once all tasks up to the end
+# of the habit are materialized. extend_horizons catches up as time passes.
+
+
+def set_horizon(value: Duration | int | None):
+    """Sets how far ahead of now tasks are materialized, see horizon"""
+
+    global horizon
+    horizon = value
+
+
+def horizon_end(habit: Habit, now: datetime) -> datetime:
+    """Returns the time before which the tasks of a habit are materialized, at most
+    the end of the habit
+    """
+
+    if horizon is None:
+        return habit.end
+    if isinstance(horizon, int):
+        until = now + habit.interval.duration * horizon
+    else:
+        until = now + horizon.duration
+    return min(until, habit.end)
+
+
+def extend_horizons(now: datetime | None = None) -> int:
+    """Materializes the tasks of habits whose horizon has fallen behind, committing
+    every TASK_BATCH_SIZE tasks so writers are never blocked for long. Returns the
+    number of created tasks.
+    """
+
+    if now is None:
+        now = datetime.now()
+
+    query = "SELECT * FROM habits WHERE materialized_until IS NOT NULL"
+    params = []
+    if isinstance(horizon, Duration):
+        query += " AND materialized_until < ?"
+        params.append(to_epoch(now + horizon.duration))
+
+    created = 0
+    for habit in list(map(habit_from_row, fetch_rows(query, params))):
+        until = horizon_end(habit, now)
+        while (batch := extend_habit(habit, until)) > 0:
+            created += batch
+    return created
+
+
+def extend_habit(habit: Habit, until: datetime) -> int:
+    """Materializes up to TASK_BATCH_SIZE tasks of a habit starting before until in a
+    single transaction. Returns the number of created tasks, 0 once caught up.
+    """
+
+    with connection() as con, con:
+        # Take the write lock before reading the progress, so a concurrent
+        # reschedule cannot materialize the same habit orders in between
+        con.execute("BEGIN IMMEDIATE")
+        row = con.execute(
+            "SELECT materialized_until, last_order FROM habits WHERE id = ?",
+            (habit.id,),
+        ).fetchone()
+        if row is None or row[0] is None or from_epoch(row[0]) >= until:
+            return 0
+
+        # The interval and lifetime may have changed since habit was read
+        habit = habit_from_row(
+            con.execute("SELECT * FROM habits WHERE id = ?", (habit.id,)).fetchone()
+        )
+
+        # Tasks are materialized in habit order, the next one follows the last
+        habit_order_no = row[1]
+        last = con.execute(
+            "SELECT start FROM tasks WHERE habit_id = ? AND habit_order = ?",
+            (habit.id, habit_order_no),
+        ).fetchone()
+        if last is not None:
+            start_time = from_epoch(last[0]) + habit.interval.duration
+        else:
+            start_time = habit.start
+
+        rows = list(
+            task_rows_for_habit(
+                habit, habit_order_no, start_time, until, TASK_BATCH_SIZE
+            )
+        )
+        insert_task_rows(rows)
+
+        if len(rows) == TASK_BATCH_SIZE:
+            materialized_until = from_epoch(rows[-1][3])
+            materialized_until += habit.interval.duration
+        else:
+            materialized_until = until
+        con.execute(
+            "UPDATE habits SET materialized_until = ?, last_order = ? WHERE id = ?",
+            (
+                to_epoch(materialized_until)
+                if materialized_until < habit.end
+                else None,
+                habit_order_no + len(rows),
+                habit.id,
+            ),
+        )
+
+    bump_data_version()
+    return len(rows)
+
+
+# Virtual tasks
+#
+# Virtual habits only store their completed tasks. Open tasks are computed from the
+# habit's interval and lifetime, and get a stable negative id derived from
+# (habit_id, habit_order) that cannot collide with AUTOINCREMENT ids.
+
+VIRTUAL_TASK_ID_SPAN = 1 << 32
+
+
+def virtual_task_id(habit_id: int, habit_order: int) -> int:
+    """Returns the id of a task of a virtual habit"""
+
+    return habit_order - habit_id * VIRTUAL_TASK_ID_SPAN
+
+
+def parse_virtual_task_id(task_id: int) -> tuple[int, int]:
+    """Returns the (habit_id, habit_order) encoded in a virtual task id"""
+
+    habit_id = -task_id // VIRTUAL_TASK_ID_SPAN + 1
+    return habit_id, task_id + habit_id * VIRTUAL_TASK_ID_SPAN
+
+
+def virtual_task_list(
+    habit_id: int | None = None,
+    start: datetime | str | None = None,
+    end: datetime | str | None = None,
+    after: tuple[datetime, int] | None = None,
+    habits: Iterable[Habit] | None = None,
+) -> Iterator[Task]:
+    """Lazily yields the open tasks of virtual habits matching the filters, ordered like
+    task_list, starting after the task_order_key after. The virtual habits can be
+    given as habits if they were already listed.
+    """
+
+    if habits is None:
+        habits = habit_list(id=habit_id, virtual=True)
+
+    return heapq.merge(
+        *[virtual_habit_tasks(habit, start, end, after) for habit in habits],
+        key=task_order_key,
+    )
+
+
+def virtual_habit_tasks(
+    habit: Habit,
+    start: datetime | str | None = None,
+    end: datetime | str | None = None,
+    after: tuple[datetime, int] | None = None,
+) -> Iterator[Task]:
+    """Lazily yields the open tasks of a virtual habit matching the filters, in habit
+    order, starting after the task_order_key after
+    """
+
+    with connection() as con:
+        completed_orders = {
+            row[0]
+            for row in con.execute(
+                "SELECT habit_order FROM tasks WHERE habit_id = ?", (habit.id,)
+            )
+        }
+    not_before = after[0] if after is not None else None
+    for habit_order, task_start in virtual_occurrences(
+        habit, start, end, not_before=not_before
+    ):
+        if habit_order in completed_orders:
+            continue
+        task_id = virtual_task_id(habit.id, habit_order)
+        if after is not None and (task_start, task_id) <= after:
+            continue
+        yield Task(
+            id=task_id,
+            habit_id=habit.id,
+            habit_order=habit_order,
+            start=task_start,
+            end=task_start + habit.lifetime.duration,
+        )
+
+
+def virtual_task_get(task_id: int) -> Task | None:
+    """Computes the open task of a virtual habit with the given id"""
+
+    habit_id, habit_order = parse_virtual_task_id(task_id)
+    for habit in habit_list(id=habit_id, virtual=True):
+        for _, task_start in virtual_occurrences(habit, None, None, habit_order):
+            return Task(
+                id=task_id,
+                habit_id=habit_id,
+                habit_order=habit_order,
+                start=task_start,
+                end=task_start + habit.lifetime.duration,
+            )
+    return None
+
+
+def virtual_task_complete(task_id: int, completed_at: datetime):
+    """Stores a task of a virtual habit as completed. Does not commit, see
+    create_tasks_for_habit.
+    """
+
+    task = virtual_task_get(task_id)
+    if task is None:
+        raise ValueError(f"Task with id {task_id} does not exist")
+
+    with connection() as con:
+        con.execute(
+            """INSERT INTO tasks (
+                id,
+                habit_id,
+                habit_order,
+                completed,
+                completed_at,
+                start,
+                end
+            ) VALUES (?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET completed_at = excluded.completed_at""",
+            (
+                task.id,
+                task.habit_id,
+                task.habit_order,
+                to_epoch(completed_at),
+                to_epoch(task.start),
+                to_epoch(task.end),
+            ),
+        )
+        add_to_streaks(task.habit_id, task.habit_order)
+
+
+def virtual_occurrences(
+    habit: Habit,
+    start: datetime | str | None,
+    end: datetime | str | None,
+    habit_order: int | None = None,
+    not_before: datetime | None = None,
+) -> Iterable[tuple[int, datetime]]:
+    """Returns the (habit_order, start) of the occurrences of a habit matching the
+    start and end filters, in habit order. Occurrences follow task_rows_for_habit.
+    Only the occurrence habit_order and occurrences starting at or after not_before
+    are returned if given.
+    """
+
+    interval = habit.interval.duration
+    lifetime = habit.lifetime.duration
+    start_filter = parse_datetime_filter(start)
+    end_filter = parse_datetime_filter(end)
+
+    if not isinstance(interval, timedelta) or not isinstance(lifetime, timedelta):
+        occurrences = []
+        current = habit.start
+        current_order = 1
+        while current < habit.end and (
+            habit_order is None or current_order <= habit_order
+        ):
+            if (
+                (habit_order is None or current_order == habit_order)
+                and matches_datetime_filter(current, start_filter)
+                and matches_datetime_filter(current + lifetime, end_filter)
+                and (not_before is None or current >= not_before)
+            ):
+                occurrences.append((current_order, current))
+            current += interval
+            current_order += 1
+        return occurrences
+
+    # Fixed length intervals: the n-th occurrence starts at habit.start + (n - 1) * interval
+    first = 1
+    last = -((habit.start - habit.end) // interval)
+    if habit_order is not None:
+        first = max(first, habit_order)
+        last = min(last, habit_order)
+    if not_before is not None:
+        first = max(first, -(-(not_before - habit.start) // interval) + 1)
+
+    # A filter on the end of a task is a filter on its start shifted by the lifetime
+    for datetime_filter in (
+        start_filter,
+        (end_filter[0], end_filter[1] - lifetime) if end_filter is not None else None,
+    ):
+        if datetime_filter is None:
+            continue
+        operator, value = datetime_filter
+        offset = value - habit.start
+        if operator == "<":
+            last = min(last, -(-offset // interval))
+        elif operator == ">":
+            first = max(first, offset // interval + 2)
+        elif offset % interval == timedelta(0):
+            first = max(first, offset // interval + 1)
+            last = min(last, offset // interval + 1)
+        else:
+            return []
+
+    return (
+        (order, habit.start + (order - 1) * interval)
+        for order in range(first, last + 1)
+    )
+
+
+def parse_datetime_filter(
+    value: datetime | str | None,
+) -> tuple[str, datetime] | None:
+    """Parses a datetime filter as used by add_filters_to_query into (operator, datetime)"""
+
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return ("=", value)
+    if value.startswith("<") or value.startswith(">"):
+        return (value[0], parse_datetime(value[1:]))
+    return ("=", parse_datetime(value))
+
+
+def matches_datetime_filter(
+    value: datetime, datetime_filter: tuple[str, datetime] | None
+) -> bool:
+    """Checks a datetime against a filter returned by parse_datetime_filter"""
+
+    if datetime_filter is None:
+        return True
+    operator, bound = datetime_filter
+    if operator == "<":
+        return value < bound
+    if operator == ">":
+        return value > bound
+    return value == bound
+
+
+# Streaks
+#
+# A streak is a run of completed tasks with consecutive habit orders. The streaks
+# table holds one row per run and is kept up to date as tasks are completed.
+
+
+def add_to_streaks(habit_id: int, habit_order: int):
+    """Adds a completed task to the streaks of its habit, merging it with the streaks
+    ending right before and starting right after it. Does not commit, see
+    create_tasks_for_habit.
+    """
+
+    with connection() as con:
+        containing = con.execute(
+            """SELECT end_order FROM streaks WHERE habit_id = ? AND start_order <= ?
+            ORDER BY start_order DESC LIMIT 1""",
+            (habit_id, habit_order),
+        ).fetchone()
+        if containing is not None and containing[0] >= habit_order:
+            return
+
+        before = con.execute(
+            "SELECT start_order FROM streaks WHERE habit_id = ? AND end_order = ?",
+            (habit_id, habit_order - 1),
+        ).fetchone()
+        after = con.execute(
+            "SELECT end_order FROM streaks WHERE habit_id = ? AND start_order = ?",
+            (habit_id, habit_order + 1),
+        ).fetchone()
+        start_order = before[0] if before is not None else habit_order
+        end_order = after[0] if after is not None else habit_order
+
+        con.execute(
+            "DELETE FROM streaks WHERE habit_id = ? AND start_order in (?, ?)",
+            (habit_id, start_order, habit_order + 1),
+        )
+        con.execute(
+            """INSERT INTO streaks (habit_id, start_order, end_order, length)
+            VALUES (?, ?, ?, ?)""",
+            (habit_id, start_order, end_order, end_order - start_order + 1),
+        )
+
+
+def rebuild_streaks(habit_ids: tuple[int] | None = None):
+    """Recomputes the streaks of the given habits, or of all habits, from their
+    completed tasks. Does not commit, see create_tasks_for_habit.
+    """
+
+    habit_filter = ""
+    params = ()
+    if habit_ids is not None:
+        habit_filter = " AND habit_id in (SELECT value FROM json_each(?))"
+        params = (json_list(habit_ids),)
+
+    with connection() as con:
+        con.execute("DELETE FROM streaks WHERE 1" + habit_filter, params)
+
+        # Orders minus their rank are constant within a run of consecutive orders
+        con.execute(
+            f"""INSERT INTO streaks (habit_id, start_order, end_order, length)
+            SELECT habit_id, MIN(habit_order), MAX(habit_order), COUNT(*)
+            FROM (
+                SELECT
+                    habit_id,
+                    habit_order,
+                    habit_order - ROW_NUMBER() OVER (
+                        PARTITION BY habit_id ORDER BY habit_order
+                    ) AS run
+                FROM (
+                    SELECT DISTINCT habit_id, habit_order FROM tasks
+                    WHERE completed = 1{habit_filter}
+                )
+            )
+            GROUP BY habit_id, run""",
+            params,
+        )
+
+
+def streak_list(
+    habit_id: int | None = None,
+    length: int | str | None = None,
+    current: bool = False,
+) -> list[Streak]:
+    """Lists streaks with filtering support, longest first"""
+
+    with connection():
+        return list(streak_iter(habit_id, length, current))
+
+
+def streak_iter(
+    habit_id: int | None = None,
+    length: int | str | None = None,
+    current: bool = False,
+) -> Iterator[Streak]:
+    """Lazily yields streaks with filtering support, longest first, with the ids of
+    their tasks. With current, only the last streak of each habit is yielded, as long
+    as the task following it has not ended yet.
+    """
+
+    source = "SELECT * FROM streaks"
+    if current:
+        source += """ WHERE (habit_id, end_order) IN (
+            SELECT habit_id, MAX(end_order) FROM streaks GROUP BY habit_id
+        )"""
+
+    query, params = add_filters_to_query(
+        f"SELECT habit_id, start_order, end_order FROM ({source})",
+        {"habit_id": habit_id, "length": length},
+    )
+    query += " ORDER BY length DESC, habit_id, start_order"
+
+    streaks = (Streak(*row) for row in fetch_rows(query, params))
+    if current:
+        now = datetime.now()
+        streaks = (streak for streak in streaks if streak_is_current(streak, now))
+
+    for streak in streaks:
+        with connection() as con:
+            streak.ids = [
+                row[0]
+                for row in con.execute(
+                    """SELECT id FROM tasks WHERE habit_id = ? AND completed = 1
+                    AND habit_order BETWEEN ? AND ? ORDER BY habit_order""",
+                    (streak.habit_id, streak.start_order, streak.end_order),
+                )
+            ]
+        yield streak
+
+
+def streak_is_current(streak: Streak, now: datetime) -> bool:
+    """Checks whether the task following a streak can still be completed. Without a
+    following task, the streak is current until the habit ends, or while the task is
+    not materialized yet.
+    """
+
+    next_order = streak.end_order + 1
+    with connection() as con:
+        row = con.execute(
+            "SELECT end FROM tasks WHERE habit_id = ? AND habit_order = ?",
+            (streak.habit_id, next_order),
+        ).fetchone()
+        habit = con.execute(
+            "SELECT virtual, end, materialized_until FROM habits WHERE id = ?",
+            (streak.habit_id,),
+        ).fetchone()
+
+    if row is not None:
+        return from_epoch(row[0]) > now
+    if habit is None:
+        return False
+
+    # Open tasks of virtual habits are not stored
+    if habit[0]:
+        task = virtual_task_get(virtual_task_id(streak.habit_id, next_order))
+        if task is not None:
+            return task.end > now
+    elif habit[2] is not None:
+        return True
+    return from_epoch(habit[1]) > now
@@ -0,0 +1,12 @@
+from db import connection, rebuild_streaks
+
+
+def rebuild():
+    """Recomputes the streaks of all habits from their completed tasks"""
+
+    with connection() as con, con:
+        rebuild_streaks()
+
+
+if __name__ == "__main__":
+    rebuild()
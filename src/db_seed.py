@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 
-from db import habit_create, db
+from db import habit_create, connection, rebuild_streaks
 from habit import Habit
 
 
@@ -245,7 +245,9 @@ def seed():
     query = """UPDATE tasks SET completed = 1 WHERE id in """
     query += "(" + ",".join(["?" for _ in tasks_complete]) + ")"
 
-    db.execute(query, tuple(tasks_complete))
+    with connection() as con, con:
+        con.execute(query, tuple(tasks_complete))
+        rebuild_streaks()
 
 
 if __name__ == "__main__":
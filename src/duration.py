@@ -1,25 +1,210 @@
-from datetime import datetime
+from calendar import monthrange
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from functools import lru_cache
+from math import gcd
 import isodate
 
+# Months after which the lengths of the months repeat, 400 years of the calendar
+CALENDAR_CYCLE = 4800
+
+# Number of duration strings kept parsed by intern_duration
+DURATION_CACHE_SIZE = 1024
+
 
 class Duration:
-    """A class representing a duration"""
+    """A class representing a duration, immutable once created.
+
+    Durations without a start time are interned: equal duration strings share one
+    instance, parsed once. A start time anchors the instances of the duration.
+    """
+
+    __slots__ = ("duration", "duration_str", "start_time", "months")
+
+    duration: timedelta | isodate.Duration
+    duration_str: str
+    start_time: datetime | None
+    months: int | None
 
-    def __init__(self, duration: str, start_time: datetime = datetime.now()):
+    def __new__(cls, duration: str, start_time: datetime | None = None):
         """Initializes the class with validation"""
 
-        self.duration = isodate.parse_duration(duration)
-        self.duration_str = duration
-        self.start_time = start_time
+        if start_time is None:
+            return intern_duration(duration)
+        return cls.parse(duration, start_time)
+
+    @classmethod
+    def parse(cls, duration: str, start_time: datetime | None = None) -> "Duration":
+        """Parses a duration string into a new instance"""
+
+        instance = super().__new__(cls)
+        parsed = isodate.parse_duration(duration)
+        object.__setattr__(instance, "duration", parsed)
+        object.__setattr__(instance, "duration_str", duration)
+        object.__setattr__(instance, "start_time", start_time)
+        object.__setattr__(instance, "months", calendar_months(parsed))
+        return instance
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError("Duration is immutable")
+
+    def __delattr__(self, name: str):
+        raise AttributeError("Duration is immutable")
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, Duration):
+            return NotImplemented
+        return (self.duration_str, self.start_time) == (
+            other.duration_str,
+            other.start_time,
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.duration_str, self.start_time))
+
+    def __reduce__(self):
+        return Duration, (self.duration_str, self.start_time)
+
+    def anchor(self) -> datetime:
+        """Returns the start time the instances are counted from"""
+
+        if self.start_time is None:
+            raise ValueError("Duration has no start time")
+        return self.start_time
+
+    def find_next_instance(self, current_time: datetime | None = None) -> datetime:
+        """Calculates the next instance after current_time, or now if not given"""
+
+        if current_time is None:
+            current_time = datetime.now()
+        if self.months is None and not isinstance(self.duration, timedelta):
+            next_instance = self.anchor()
+            while next_instance <= current_time:
+                next_instance += self.duration
+            return next_instance
+
+        return self.nth_instance(self.instances_before(current_time, inclusive=True))
+
+    def nth_instance(self, n: int) -> datetime:
+        """Returns the instance after adding the duration n times to the start time"""
+
+        if n < 0:
+            raise ValueError("n must not be negative")
+        if isinstance(self.duration, timedelta):
+            return self.anchor() + n * self.duration
+        if self.months is not None:
+            return add_months(self.anchor(), self.months, n)
+
+        instance = self.anchor()
+        for _ in range(n):
+            instance += self.duration
+        return instance
 
-    def find_next_instance(self, current_time: datetime = datetime.now()) -> datetime:
-        """Calculates the next instance"""
+    def instances_before(self, time: datetime, inclusive: bool = False) -> int:
+        """Counts the instances before time, or at time if inclusive"""
 
-        next_instance = self.start_time
-        while next_instance <= current_time:
-            next_instance += self.duration
+        def before(instance: datetime) -> bool:
+            return instance <= time if inclusive else instance < time
 
-        return next_instance
+        start_time = self.anchor()
+        if not before(start_time):
+            return 0
+        if isinstance(self.duration, timedelta):
+            if self.duration <= timedelta(0):
+                raise ValueError("Duration must be positive")
+            elapsed = time - start_time
+            count = elapsed // self.duration + 1
+            if not inclusive and elapsed % self.duration == timedelta(0):
+                count -= 1
+            return count
+
+        if self.months is not None:
+            # The instance n starts in the month n * months after the start time
+            elapsed = (time.year - start_time.year) * 12
+            elapsed += time.month - start_time.month
+            count = elapsed // self.months
+            while count > 0 and not before(self.nth_instance(count)):
+                count -= 1
+            while before(self.nth_instance(count + 1)):
+                count += 1
+            return count + 1
+
+        count = 0
+        instance = start_time
+        while before(instance):
+            count += 1
+            instance += self.duration
+        return count
+
+    def instances_between(self, start: datetime, end: datetime) -> Iterator[datetime]:
+        """Returns the instances from start up to, but excluding, end"""
+
+        if self.months is None and not isinstance(self.duration, timedelta):
+            instance = self.anchor()
+            while instance < end:
+                if instance >= start:
+                    yield instance
+                instance += self.duration
+            return
+
+        for n in range(self.instances_before(start), self.instances_before(end)):
+            yield self.nth_instance(n)
 
     def __str__(self):
         return self.duration_str
+
+
+@lru_cache(maxsize=DURATION_CACHE_SIZE)
+def intern_duration(duration: str) -> Duration:
+    """Returns the shared instance of a duration string without a start time"""
+
+    return Duration.parse(duration)
+
+
+def duration_cache_info() -> dict[str, int]:
+    """Returns the hit and miss counters and the size of the interned durations"""
+
+    info = intern_duration.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
+
+
+def calendar_months(duration: timedelta | isodate.Duration) -> int | None:
+    """Returns the number of months of a duration of whole years and months only, or
+    None for other durations
+    """
+
+    if isinstance(duration, timedelta) or duration.tdelta != timedelta(0):
+        return None
+    months = duration.years * 12 + duration.months
+    if months <= 0 or months != int(months):
+        return None
+    return int(months)
+
+
+def add_months(time: datetime, months: int, n: int) -> datetime:
+    """Returns the time after adding a duration of months n times, like repeated
+    additions of an isodate.Duration, which clamp the day to the end of the month
+    and keep the clamped day in later months
+    """
+
+    index = time.year * 12 + time.month - 1
+    day = time.day
+
+    # The day is the length of the shortest month passed, which is at least 28. The
+    # months passed repeat after a calendar cycle.
+    steps = min(n, CALENDAR_CYCLE // gcd(months, CALENDAR_CYCLE))
+    for step in range(1, steps + 1):
+        if day <= 28:
+            break
+        year, month = divmod(index + step * months, 12)
+        day = min(day, monthrange(year, month + 1)[1])
+
+    year, month = divmod(index + n * months, 12)
+    return time.replace(year=year, month=month + 1, day=day)
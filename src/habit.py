@@ -1,18 +1,32 @@
 from datetime import datetime
 from duration import Duration
+from utils import EpochDatetime, from_epoch, naive_local, parse_datetime
 
 
 class Habit:
     """A class representing a habit"""
 
+    __slots__ = (
+        "id",
+        "name",
+        "description",
+        "interval",
+        "lifetime",
+        "active",
+        "_start",
+        "_end",
+        "virtual",
+    )
+
     id: int | None
     name: str
     description: str
     interval: Duration
     lifetime: Duration
     active: bool
-    start: datetime
-    end: datetime
+    start: datetime = EpochDatetime()
+    end: datetime = EpochDatetime()
+    virtual: bool
 
     def __init__(
         self,
@@ -20,9 +34,10 @@ class Habit:
         description: str,
         interval: Duration | str,
         lifetime: Duration | str,
-        start: datetime | str,
-        end: datetime | str,
+        start: datetime | int | str,
+        end: datetime | int | str,
         active: bool = True,
+        virtual: bool = False,
         id: int | None = None,
     ):
         """Initializes the class with validation"""
@@ -49,19 +64,27 @@ class Habit:
             raise TypeError("active must be a boolean")
         self.active = active
 
+        if virtual is not True and virtual is not False:
+            raise TypeError("virtual must be a boolean")
+        self.virtual = virtual
+
         if isinstance(start, datetime):
-            self.start = start
+            self.start = naive_local(start)
+        elif isinstance(start, int):
+            self.start = from_epoch(start)
         elif isinstance(start, str):
-            self.start = datetime.fromisoformat(start)
+            self.start = parse_datetime(start)
         else:
-            raise TypeError("start must be a datetime or string")
+            raise TypeError("start must be a datetime, epoch or string")
 
         if isinstance(end, datetime):
-            self.end = end
+            self.end = naive_local(end)
+        elif isinstance(end, int):
+            self.end = from_epoch(end)
         elif isinstance(end, str):
-            self.end = datetime.fromisoformat(end)
+            self.end = parse_datetime(end)
         else:
-            raise TypeError("end must be a datetime or string")
+            raise TypeError("end must be a datetime, epoch or string")
 
         if isinstance(id, int):
             self.id = id
@@ -70,6 +93,24 @@ class Habit:
         else:
             self.id = None
 
+    @classmethod
+    def from_row(cls, row: tuple) -> "Habit":
+        """Creates a Habit from a row of the habits table without validation, the
+        timestamps are converted on first access
+        """
+
+        habit = cls.__new__(cls)
+        habit.id = row[0]
+        habit.name = row[1]
+        habit.description = row[2]
+        habit.interval = Duration(row[3])
+        habit.lifetime = Duration(row[4])
+        habit.active = bool(row[5])
+        habit._start = row[6]
+        habit._end = row[7]
+        habit.virtual = bool(row[8])
+        return habit
+
     def to_dict(self):
         """Converts the class to a dictionary"""
 
@@ -82,4 +123,5 @@ class Habit:
             "active": self.active,
             "start": self.start.isoformat(),
             "end": self.end.isoformat(),
+            "virtual": self.virtual,
         }
@@ -1,22 +1,162 @@
-from flask import Flask, jsonify, request
-import json
-from db import (
-    habit_create,
-    habit_delete,
-    habit_list,
-    habit_update,
-    task_complete,
-    task_list,
+from api import (
+    complete_tasks,
+    create_habit,
+    delete_habit,
+    habit_analytics,
+    list_habits,
+    list_streaks,
+    list_tasks,
+    stats,
+    update_habit,
 )
+from async_server import WORKERS, AsyncWSGIServer
+from collections.abc import Callable, Iterable, Iterator
+from functools import wraps
+from flask import Flask, Response, jsonify, request
+from itertools import islice
+import json
+from db import data_version, extend_horizons, set_horizon
 from duration import Duration
-from habit import Habit
 import argparse
+import hashlib
+import secrets
+import threading
+import time
 from werkzeug.exceptions import HTTPException
 import traceback
-from utils import not_none
 
 app = Flask(__name__)
 
+# Number of items serialized per chunk of a streamed response
+STREAM_CHUNK_SIZE = 500
+
+# Seconds between runs of the background horizon extender
+EXTEND_INTERVAL = 60
+
+# Default seconds between checks for changes to write to the snapshot file
+SNAPSHOT_INTERVAL = 300
+
+# Part of every ETag, so the ETags of a restarted server never match
+ETAG_NONCE = secrets.token_hex(4)
+
+# Helpers
+
+
+def stream_json(items: Iterable[dict]) -> Response:
+    """Streams items as a JSON array, or as newline delimited JSON if the client
+    accepts application/x-ndjson, serializing STREAM_CHUNK_SIZE items at a time.
+    """
+
+    ndjson = (
+        request.accept_mimetypes.best_match(
+            ["application/json", "application/x-ndjson"]
+        )
+        == "application/x-ndjson"
+    )
+
+    def generate():
+        iterator = iter(items)
+        separator = ""
+        if not ndjson:
+            yield "["
+        while chunk := list(islice(iterator, STREAM_CHUNK_SIZE)):
+            encoded = [app.json.dumps(item) for item in chunk]
+            if ndjson:
+                yield "\n".join(encoded) + "\n"
+            else:
+                yield separator + ",".join(encoded)
+                separator = ","
+        if not ndjson:
+            yield "]"
+
+    return Response(
+        generate(),
+        mimetype="application/x-ndjson" if ndjson else "application/json",
+    )
+
+
+def request_etag(version: int) -> str:
+    """Returns the ETag of the current request's response at a data version, derived
+    from the path, query string and accepted media types
+    """
+
+    key = request.full_path + "|" + request.headers.get("Accept", "")
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    return f"{ETAG_NONCE}-{version}-{digest}"
+
+
+def conditional(view: Callable) -> Callable:
+    """Tags the responses of a view with an ETag and answers a matching If-None-Match
+    with 304 Not Modified, without calling the view, while the data is unchanged
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = request_etag(data_version())
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+        response.set_etag(etag)
+        return response
+
+    return wrapper
+
+
+def respond(result: Iterator[dict] | dict | list) -> Response:
+    """Returns the result of an api handler as JSON, streaming listings"""
+
+    if isinstance(result, (dict, list)):
+        return jsonify(result)
+    return stream_json(result)
+
+
+def parse_horizon(value: str | None) -> Duration | int | None:
+    """Parses the --horizon argument, a number of intervals or an ISO 8601 duration"""
+
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    return Duration(value)
+
+
+def run_extender(periodic: bool):
+    """Extends the horizons of habits in the background, every EXTEND_INTERVAL
+    seconds if periodic, otherwise once to materialize habits left partially
+    materialized by an earlier run with a horizon
+    """
+
+    while True:
+        try:
+            extend_horizons()
+        except Exception:
+            print(traceback.format_exc())
+        if not periodic:
+            return
+        time.sleep(EXTEND_INTERVAL)
+
+
+def run_snapshots(path: str, interval: float):
+    """Writes the tasks to a snapshot file at path in the background, checking every
+    interval seconds whether the data changed since the last snapshot
+    """
+
+    # Imported here, numpy is only needed with --snapshot
+    from snapshot import write_snapshot
+
+    written = None
+    while True:
+        try:
+            version = data_version()
+            if version != written:
+                write_snapshot(path)
+                written = version
+        except Exception:
+            print(traceback.format_exc())
+        time.sleep(interval)
+
+
 # Routes
 
 
@@ -38,107 +178,113 @@ def status():
 
 
 @app.route("/habits", methods=["GET"])
+@conditional
 def route_habits_list():
     """List habits with filtering support"""
-
-    id = request.args.get("id", None, str)
-    name = request.args.get("name", None, str)
-    description = request.args.get("description", None, str)
-    interval = request.args.get("interval", None, str)
-    interval = Duration(interval) if interval is not None else None
-    lifetime = request.args.get("lifetime", None, str)
-    lifetime = Duration(lifetime) if lifetime is not None else None
-    active = request.args.get("active", None, str)
-    active = active.lower() == "true" if active is not None else None
-    habits = habit_list(id, name, description, interval, lifetime, active)
-    return jsonify([habit.to_dict() for habit in habits])
+    return respond(list_habits(request.args))
 
 
 @app.route("/habits", methods=["POST"])
 def route_habits_create():
     """Create a new habit"""
-
-    data = json.loads(request.data)
-    habit = Habit(
-        name=data.get("name"),
-        description=data.get("description"),
-        interval=data.get("interval"),
-        lifetime=data.get("lifetime"),
-        active=data.get("active"),
-        start=data.get("start"),
-        end=data.get("end"),
-    )
-    habit_create(habit)
-    return jsonify(habit.to_dict())
+    return respond(create_habit(request.args, json.loads(request.data)))
 
 
 @app.route("/habits", methods=["PUT"])
 def route_habits_update():
     """Update an existing habit"""
-
-    data = json.loads(request.data)
-    id = data.get("id")
-    if id is None:
-        raise ValueError("Habit id is None")
-    existing_habits = habit_list(id=id)
-    if len(existing_habits) < 1:
-        raise ValueError(f"Habit with id {id} does not exist")
-    existing_habit = existing_habits[0]
-
-    new_habit = Habit(
-        id=not_none(data.get("id"), existing_habit.id),
-        name=not_none(data.get("name"), existing_habit.name),
-        description=not_none(data.get("description"), existing_habit.description),
-        interval=not_none(data.get("interval"), existing_habit.interval),
-        lifetime=not_none(data.get("lifetime"), existing_habit.lifetime),
-        active=not_none(data.get("active"), existing_habit.active),
-        start=not_none(data.get("start"), existing_habit.start),
-        end=not_none(data.get("end"), existing_habit.end),
-    )
-    updated_habit = habit_update(new_habit)
-    return jsonify(updated_habit.to_dict())
+    return respond(update_habit(request.args, json.loads(request.data)))
 
 
 @app.route("/habits", methods=["DELETE"])
 def route_habits_delete():
     """Delete a habit"""
-    id = request.args.get("id", None, int)
-    habit_delete((id,))
-    return jsonify({"id": id})
+    return respond(delete_habit(request.args))
 
 
 @app.route("/tasks", methods=["GET"])
+@conditional
 def route_tasks_list():
-    """List tasks with filtering support"""
-
-    habit_id = request.args.get("habit_id", None, str)
-    completed = request.args.get("completed", None, str)
-    completed = completed.lower() == "true" if completed is not None else None
-    start = request.args.get("start", None, str)
-    end = request.args.get("end", None, str)
-    tasks = task_list(habit_id, completed, start, end)
-    return jsonify([task.to_dict() for task in tasks])
+    """List tasks with filtering support, optionally joined with their habit"""
+    return respond(list_tasks(request.args))
 
 
 @app.route("/tasks", methods=["PATCH"])
 def route_tasks_complete():
-    """Marks a task as completed"""
+    """Marks a task as completed, or a batch of tasks given in the body"""
+    body = json.loads(request.data) if len(request.data) > 0 else None
+    return respond(complete_tasks(request.args, body))
+
+
+@app.route("/streaks", methods=["GET"])
+def route_streaks_list():
+    """List streaks of completed tasks, longest first, with filtering support"""
+    return respond(list_streaks(request.args))
+
+
+@app.route("/analytics/habits", methods=["GET"])
+def route_analytics_habits():
+    """Completion statistics of habits for their tasks started in a time range"""
+    return respond(habit_analytics(request.args))
+
 
-    id = request.args.get("id", None, int)
-    if id is None:
-        raise ValueError("Task id is None")
-    task_complete(id)
-    return jsonify({"id": id})
+@app.route("/stats", methods=["GET"])
+def route_stats():
+    """Hit and miss counters of the server caches"""
+    return respond(stats(request.args))
 
 
 # CLI
 
 parser = argparse.ArgumentParser(description="Habit Tracker Server")
 parser.add_argument("--port", type=int, help="Port to run the server on", default=5000)
-
-args = parser.parse_args()
+parser.add_argument(
+    "--server",
+    choices=["dev", "async"],
+    help="The Flask development server, or an asyncio server running requests on a bounded thread pool",
+    default="dev",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    help="Number of threads handling requests with --server async",
+    default=WORKERS,
+)
+parser.add_argument(
+    "--horizon",
+    type=str,
+    help="Only create tasks this far ahead, as a number of intervals (e.g. 100) or a duration (e.g. P30D), and extend them in the background",
+    default=None,
+)
+parser.add_argument(
+    "--snapshot",
+    type=str,
+    metavar="PATH",
+    help="Write the tasks to a columnar snapshot file at this path in the background, for the snapshot analytics of the CLI",
+    default=None,
+)
+parser.add_argument(
+    "--snapshot-interval",
+    type=float,
+    help="Seconds between checks for changes to write to the snapshot file",
+    default=SNAPSHOT_INTERVAL,
+)
 
 # Run the server
 
 if __name__ == "__main__":
-    app.run(debug=True, use_reloader=False, port=args.port)
+    args = parser.parse_args()
+    set_horizon(parse_horizon(args.horizon))
+    threading.Thread(
+        target=run_extender, args=(args.horizon is not None,), daemon=True
+    ).start()
+    if args.snapshot is not None:
+        threading.Thread(
+            target=run_snapshots,
+            args=(args.snapshot, args.snapshot_interval),
+            daemon=True,
+        ).start()
+    if args.server == "async":
+        AsyncWSGIServer(app, args.workers).run("127.0.0.1", args.port)
+    else:
+        app.run(debug=True, use_reloader=False, port=args.port)
@@ -0,0 +1,171 @@
+"""Occurrences of habits computed as arrays of timestamps.
+
+Timestamps are int64 arrays of microseconds since EPOCH, as stored in the tasks
+table. Fixed length intervals are generated with arange, intervals of whole years
+and months by stepping month indices. Other calendar durations, mixing months with
+days or times, are stepped one instance at a time.
+"""
+
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from itertools import islice
+import numpy as np
+from duration import Duration
+from habit import Habit
+from utils import MICROSECOND, from_epoch, to_epoch
+
+# Microseconds in a day
+DAY = 86_400_000_000
+
+
+def occurrence_starts(
+    interval: Duration, start: datetime, end: datetime, limit: int | None = None
+) -> np.ndarray:
+    """Returns the starts of the occurrences repeating interval from start before end,
+    like repeated additions of the interval, at most limit of them
+    """
+
+    batches = list(occurrence_batches(interval, start, end, None, limit))
+    return batches[0] if batches else np.empty(0, dtype=np.int64)
+
+
+def occurrence_batches(
+    interval: Duration,
+    start: datetime,
+    end: datetime,
+    size: int | None,
+    limit: int | None = None,
+) -> Iterator[np.ndarray]:
+    """Yields the starts of occurrence_starts in consecutive arrays of at most size
+    starts, or in a single array if size is None
+    """
+
+    if end <= start:
+        return
+
+    if isinstance(interval.duration, timedelta):
+        step = interval.duration // MICROSECOND
+        if step <= 0:
+            raise ValueError("interval must be positive")
+        count = -(-(end - start) // interval.duration)
+        if limit is not None:
+            count = min(count, limit)
+        for first in range(0, count, size or max(count, 1)):
+            stop = min(first + (size or count), count)
+            yield to_epoch(start) + np.arange(first, stop, dtype=np.int64) * step
+        return
+
+    anchored = Duration(interval.duration_str, start)
+    if anchored.months is None:
+        instances = islice(anchored.instances_between(start, end), limit)
+        while True:
+            starts = np.fromiter(
+                (to_epoch(instance) for instance in islice(instances, size)),
+                dtype=np.int64,
+            )
+            if len(starts) == 0:
+                return
+            yield starts
+
+    count = anchored.instances_before(end)
+    if limit is not None:
+        count = min(count, limit)
+
+    # Repeated additions clamp the day to the shortest month passed, carried over
+    # from one batch to the next
+    day = start.day
+    for first in range(0, count, size or max(count, 1)):
+        stop = min(first + (size or count), count)
+        months = (
+            month_index(start)
+            + np.arange(first, stop, dtype=np.int64) * anchored.months
+        )
+        days = np.minimum(day, np.minimum.accumulate(month_length(months)))
+        day = int(days[-1])
+        yield epoch_at(months, days, to_epoch(start) % DAY)
+
+
+def shift(starts: np.ndarray, duration: Duration) -> np.ndarray:
+    """Returns the timestamps after adding a duration to each of starts"""
+
+    if isinstance(duration.duration, timedelta):
+        return starts + duration.duration // MICROSECOND
+
+    if duration.months is None:
+        return np.fromiter(
+            (
+                to_epoch(from_epoch(start) + duration.duration)
+                for start in starts.tolist()
+            ),
+            dtype=np.int64,
+            count=len(starts),
+        )
+
+    days = starts // DAY
+    dates = days.astype("datetime64[D]")
+    months = dates.astype("datetime64[M]").astype(np.int64)
+    day = days - month_start(months) + 1
+    months = months + duration.months
+    return epoch_at(months, np.minimum(day, month_length(months)), starts % DAY)
+
+
+def habit_occurrences(
+    habit: Habit,
+    start_time: datetime | None = None,
+    until: datetime | None = None,
+    limit: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the starts and ends of the occurrences of a habit from start_time, if
+    not before the start of the habit, up to until or the end of the habit, at most
+    limit of them
+    """
+
+    batches = list(habit_occurrence_batches(habit, start_time, until, None, limit))
+    if not batches:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return batches[0]
+
+
+def habit_occurrence_batches(
+    habit: Habit,
+    start_time: datetime | None = None,
+    until: datetime | None = None,
+    size: int | None = None,
+    limit: int | None = None,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Yields the starts and ends of habit_occurrences in consecutive arrays of at
+    most size occurrences, see occurrence_batches
+    """
+
+    start = (
+        start_time
+        if start_time is not None and start_time >= habit.start
+        else habit.start
+    )
+    end = min(habit.end, until) if until is not None else habit.end
+    for starts in occurrence_batches(habit.interval, start, end, size, limit):
+        yield starts, shift(starts, habit.lifetime)
+
+
+def month_index(time: datetime) -> int:
+    """Returns the number of months from the month of EPOCH to the month of time"""
+
+    return (time.year - 1970) * 12 + time.month - 1
+
+
+def month_start(months: np.ndarray) -> np.ndarray:
+    """Returns the days since EPOCH of the first days of months"""
+
+    return months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+
+
+def month_length(months: np.ndarray) -> np.ndarray:
+    """Returns the number of days of months"""
+
+    return month_start(months + 1) - month_start(months)
+
+
+def epoch_at(months: np.ndarray, days: np.ndarray, time_of_day) -> np.ndarray:
+    """Returns the timestamps of the days of months at a time of day in microseconds"""
+
+    return (month_start(months) + days - 1) * DAY + time_of_day
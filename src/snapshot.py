@@ -0,0 +1,211 @@
+"""Columnar snapshots of the tasks table.
+
+A snapshot file holds the stored tasks ordered by habit and habit order, one column
+after the other, so reads can memory-map it without touching SQLite:
+
+- a header of SNAPSHOT_MAGIC, the number of tasks, the time of the snapshot and the
+  number of virtual habits;
+- habit_id and habit_order as int32;
+- start, end and completed_at as int64 microseconds since EPOCH, NULL_EPOCH for
+  tasks that are not completed;
+- the completed flags as a bitmap, one bit per task;
+- the ids of the virtual habits as int32, in order.
+
+Columns start at multiples of 8 bytes. Open tasks of virtual habits are not stored,
+so they are not part of snapshots either, and their habits are listed instead.
+
+Usage: python src/snapshot.py PATH, or run the server with --snapshot PATH
+"""
+
+import os
+import sys
+from datetime import datetime
+import numpy as np
+from db import FETCH_SIZE, connection
+from utils import to_epoch
+
+# Identifies snapshot files and the version of their layout
+SNAPSHOT_MAGIC = b"HTSNAP02"
+
+# Size in bytes of the header, the magic followed by three int64
+HEADER_SIZE = len(SNAPSHOT_MAGIC) + 24
+
+# Stands in for the completed_at of tasks that are not completed
+NULL_EPOCH = np.iinfo(np.int64).min
+
+# Names and types of the columns, in file order
+COLUMNS = (
+    ("habit_id", np.int32),
+    ("habit_order", np.int32),
+    ("start", np.int64),
+    ("end", np.int64),
+    ("completed_at", np.int64),
+)
+
+
+def column_offsets(
+    rows: int, virtual_habits: int
+) -> tuple[dict[str, int], int, int, int]:
+    """Returns the offsets of the columns in a snapshot of rows tasks, the offsets of
+    the completion bitmap and of the virtual habit ids, and the size of the file
+    """
+
+    offsets = {}
+    offset = HEADER_SIZE
+    for name, dtype in COLUMNS:
+        offsets[name] = offset
+        offset += -(-rows * np.dtype(dtype).itemsize // 8) * 8
+    bitmap_offset = offset
+    offset += -(-rows // 64) * 8
+    return offsets, bitmap_offset, offset, offset + virtual_habits * 4
+
+
+def write_snapshot(path: str, now: datetime | None = None) -> int:
+    """Writes the tasks table to a snapshot file at path, read in one transaction and
+    replacing the file at once. Returns the number of tasks written.
+    """
+
+    if now is None:
+        now = datetime.now()
+    temporary = path + ".tmp"
+
+    with connection() as con:
+        con.execute("BEGIN")
+        try:
+            rows = con.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+            virtual = np.array(
+                con.execute(
+                    "SELECT id FROM habits WHERE virtual = 1 ORDER BY id"
+                ).fetchall(),
+                dtype="<i4",
+            ).reshape(-1)
+            offsets, bitmap_offset, virtual_offset, size = column_offsets(
+                rows, len(virtual)
+            )
+
+            with open(temporary, "wb") as file:
+                file.write(SNAPSHOT_MAGIC)
+                file.write(
+                    np.array([rows, to_epoch(now), len(virtual)], dtype="<i8").tobytes()
+                )
+                file.truncate(size)
+                file.seek(virtual_offset)
+                file.write(virtual.tobytes())
+
+            completed = np.zeros(rows, dtype=bool)
+            if rows > 0:
+                data = np.memmap(temporary, mode="r+")
+                columns = {
+                    name: np.ndarray(
+                        rows,
+                        dtype=np.dtype(dtype).newbyteorder("<"),
+                        buffer=data,
+                        offset=offsets[name],
+                    )
+                    for name, dtype in COLUMNS
+                }
+                cursor = con.execute(
+                    """SELECT habit_id, habit_order, start, end,
+                    coalesce(completed_at, ?), completed
+                    FROM tasks ORDER BY habit_id, habit_order""",
+                    (int(NULL_EPOCH),),
+                )
+                position = 0
+                while batch := cursor.fetchmany(FETCH_SIZE):
+                    values = np.array(batch, dtype=np.int64)
+                    end = position + len(batch)
+                    for index, (name, _) in enumerate(COLUMNS):
+                        columns[name][position:end] = values[:, index]
+                    completed[position:end] = values[:, 5] == 1
+                    position = end
+
+                bitmap = np.packbits(completed, bitorder="little")
+                data[bitmap_offset : bitmap_offset + len(bitmap)] = bitmap
+                data.flush()
+                del columns, data
+        finally:
+            con.commit()
+
+    os.replace(temporary, path)
+    return rows
+
+
+class Snapshot:
+    """The columns of a snapshot file, memory-mapped read only"""
+
+    rows: int
+    created_at: int
+    virtual_habit_ids: np.ndarray
+    habit_id: np.ndarray
+    habit_order: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    completed_at: np.ndarray
+    bitmap: np.ndarray
+
+    def __init__(self, path: str):
+        """Maps the snapshot file at path"""
+
+        data = np.memmap(path, mode="r")
+        if bytes(data[: len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        header = np.ndarray(3, dtype="<i8", buffer=data, offset=len(SNAPSHOT_MAGIC))
+        self.rows = int(header[0])
+        self.created_at = int(header[1])
+
+        offsets, bitmap_offset, virtual_offset, size = column_offsets(
+            self.rows, int(header[2])
+        )
+        if len(data) < size:
+            raise ValueError(f"{path} is truncated")
+        for name, dtype in COLUMNS:
+            column = np.ndarray(
+                self.rows,
+                dtype=np.dtype(dtype).newbyteorder("<"),
+                buffer=data,
+                offset=offsets[name],
+            )
+            setattr(self, name, column)
+        self.bitmap = data[bitmap_offset:virtual_offset]
+        self.virtual_habit_ids = np.ndarray(
+            int(header[2]), dtype="<i4", buffer=data, offset=virtual_offset
+        )
+
+    def habit_rows(self, habit_id: int | None = None) -> slice:
+        """Returns the rows of the tasks of a habit, or of all tasks if not given"""
+
+        if habit_id is None:
+            return slice(0, self.rows)
+        return slice(
+            int(np.searchsorted(self.habit_id, habit_id, side="left")),
+            int(np.searchsorted(self.habit_id, habit_id, side="right")),
+        )
+
+    def is_virtual(self, habit_id: int) -> bool:
+        """Checks whether a habit is virtual, so only its completed tasks are stored"""
+
+        index = np.searchsorted(self.virtual_habit_ids, habit_id)
+        return bool(
+            index < len(self.virtual_habit_ids)
+            and self.virtual_habit_ids[index] == habit_id
+        )
+
+    def virtual(self, rows: slice) -> np.ndarray:
+        """Returns which tasks of rows belong to virtual habits"""
+
+        return np.isin(self.habit_id[rows], self.virtual_habit_ids)
+
+    def completed(self, rows: slice) -> np.ndarray:
+        """Returns the completed flags of rows, unpacking only their part of the
+        bitmap
+        """
+
+        first = rows.start // 8
+        bits = np.unpackbits(self.bitmap[first : -(-rows.stop // 8)], bitorder="little")
+        return bits[rows.start - first * 8 : rows.stop - first * 8].astype(bool)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python src/snapshot.py PATH")
+    print(f"Wrote {write_snapshot(sys.argv[1])} tasks to {sys.argv[1]}")
@@ -0,0 +1,105 @@
+"""Completion analytics computed with numpy over the columns of a Snapshot.
+
+Results are dictionaries of equally long arrays, one entry per column. Like
+habit_summaries, a task counts once it is completed or has ended, and missed tasks
+ended without being completed. Snapshots only hold the completed tasks of virtual
+habits, so their tasks are left out of completion rates.
+"""
+
+from datetime import datetime
+import numpy as np
+from snapshot import Snapshot
+from utils import to_epoch
+
+# Microseconds in a day and in an hour
+DAY = 86_400_000_000
+HOUR = 3_600_000_000
+
+# Weekday of EPOCH, a Thursday, counting from Monday as 0
+EPOCH_WEEKDAY = 3
+
+
+def rated_rows(snapshot: Snapshot, habit_id: int | None) -> slice:
+    """Returns the rows of a habit, or of all habits, for completion rates. Raises a
+    ValueError for virtual habits.
+    """
+
+    if habit_id is not None and snapshot.is_virtual(habit_id):
+        raise ValueError(
+            f"Habit {habit_id} is virtual, snapshots do not hold its missed tasks"
+        )
+    return snapshot.habit_rows(habit_id)
+
+
+def counted(snapshot: Snapshot, rows: slice, now: datetime | None) -> np.ndarray:
+    """Returns which tasks of rows are completed or have ended by now, leaving out
+    the tasks of virtual habits
+    """
+
+    if now is None:
+        now = datetime.now()
+    mask = snapshot.completed(rows) | (snapshot.end[rows] <= to_epoch(now))
+    if len(snapshot.virtual_habit_ids) > 0:
+        mask &= ~snapshot.virtual(rows)
+    return mask
+
+
+def completion_heatmap(
+    snapshot: Snapshot, habit_id: int | None = None, now: datetime | None = None
+) -> dict[str, np.ndarray]:
+    """Counts the tasks and the completed tasks of a habit, or of all habits but
+    virtual ones, by the day they start on
+    """
+
+    rows = rated_rows(snapshot, habit_id)
+    mask = counted(snapshot, rows, now)
+    days = snapshot.start[rows][mask] // DAY
+    completed = snapshot.completed(rows)[mask]
+
+    unique_days, index = np.unique(days, return_inverse=True)
+    tasks = np.bincount(index, minlength=len(unique_days))
+    done = np.bincount(index, weights=completed, minlength=len(unique_days))
+    return {
+        "date": unique_days.astype("datetime64[D]"),
+        "tasks": tasks,
+        "completed": done.astype(np.int64),
+        "completion_rate": done / tasks,
+    }
+
+
+def weekday_hour_distribution(
+    snapshot: Snapshot, habit_id: int | None = None
+) -> np.ndarray:
+    """Counts the completions of a habit, or of all habits, in a 7 x 24 matrix by the
+    weekday, Monday first, and the hour they were completed at
+    """
+
+    rows = snapshot.habit_rows(habit_id)
+    completed_at = snapshot.completed_at[rows][snapshot.completed(rows)]
+    weekdays = (completed_at // DAY + EPOCH_WEEKDAY) % 7
+    hours = completed_at % DAY // HOUR
+    return np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+
+
+def rolling_completion_rate(
+    snapshot: Snapshot, habit_id: int, window: int, now: datetime | None = None
+) -> dict[str, np.ndarray]:
+    """Returns the share of completed tasks among the last window tasks of a habit,
+    at each of its tasks in habit order
+    """
+
+    if window < 1:
+        raise ValueError("window must be positive")
+
+    rows = rated_rows(snapshot, habit_id)
+    mask = counted(snapshot, rows, now)
+    completed = snapshot.completed(rows)[mask]
+
+    totals = np.concatenate(([0], np.cumsum(completed)))
+    positions = np.arange(1, len(completed) + 1)
+    first = np.maximum(positions - window, 0)
+    return {
+        "habit_order": snapshot.habit_order[rows][mask].astype(np.int64),
+        "start": snapshot.start[rows][mask].astype("datetime64[us]"),
+        "completion_rate": (totals[positions] - totals[first]) / (positions - first),
+    }
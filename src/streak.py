@@ -0,0 +1,52 @@
+class Streak:
+    """A class representing a run of consecutive completed tasks of a habit"""
+
+    habit_id: int
+    start_order: int
+    end_order: int
+    ids: list[int]
+
+    def __init__(
+        self,
+        habit_id: int,
+        start_order: int,
+        end_order: int,
+        ids: list[int] | None = None,
+    ):
+        """Initializes the class with validation"""
+
+        if not isinstance(habit_id, int):
+            raise TypeError("habit_id must be a int")
+        self.habit_id = habit_id
+
+        if not isinstance(start_order, int):
+            raise TypeError("start_order must be a int")
+        self.start_order = start_order
+
+        if not isinstance(end_order, int):
+            raise TypeError("end_order must be a int")
+        if end_order < start_order:
+            raise ValueError("end_order must not be before start_order")
+        self.end_order = end_order
+
+        if ids is None:
+            self.ids = []
+        elif isinstance(ids, list):
+            self.ids = ids
+        else:
+            raise TypeError("ids must be a list or None")
+
+    @property
+    def length(self) -> int:
+        """The number of tasks in the streak"""
+
+        return self.end_order - self.start_order + 1
+
+    def to_dict(self):
+        """Converts the class to a dictionary"""
+
+        return {
+            "streak": self.length,
+            "ids": self.ids,
+            "habit_id": self.habit_id,
+        }
@@ -1,25 +1,36 @@
 from datetime import datetime
+from utils import EpochDatetime, from_epoch, naive_local, parse_datetime
 
 
 class Task:
     """A class representing a task"""
 
+    __slots__ = (
+        "id",
+        "habit_id",
+        "habit_order",
+        "_start",
+        "_end",
+        "completed",
+        "_completed_at",
+    )
+
     id: int | None
     habit_id: int
     habit_order: int
-    start: datetime
-    end: datetime
+    start: datetime = EpochDatetime()
+    end: datetime = EpochDatetime()
     completed: bool
-    completed_at: datetime | None
+    completed_at: datetime | None = EpochDatetime()
 
     def __init__(
         self,
         habit_id: int,
         habit_order: int,
-        start: datetime | str,
-        end: datetime | str,
+        start: datetime | int | str,
+        end: datetime | int | str,
         completed: bool = False,
-        completed_at: datetime | None = None,
+        completed_at: datetime | int | str | None = None,
         id: int | None = None,
     ):
         """Initializes the class with validation"""
@@ -33,31 +44,37 @@ class Task:
         self.habit_order = habit_order
 
         if isinstance(start, datetime):
-            self.start = start
+            self.start = naive_local(start)
+        elif isinstance(start, int):
+            self.start = from_epoch(start)
         elif isinstance(start, str):
-            self.start = datetime.fromisoformat(start)
+            self.start = parse_datetime(start)
         else:
-            raise TypeError("start must be a datetime or string")
+            raise TypeError("start must be a datetime, epoch or string")
 
         if isinstance(end, datetime):
-            self.end = end
+            self.end = naive_local(end)
+        elif isinstance(end, int):
+            self.end = from_epoch(end)
         elif isinstance(end, str):
-            self.end = datetime.fromisoformat(end)
+            self.end = parse_datetime(end)
         else:
-            raise TypeError("end must be a datetime or string")
+            raise TypeError("end must be a datetime, epoch or string")
 
         if completed is not True and completed is not False:
             raise TypeError("completed must be a boolean")
         self.completed = completed
 
         if isinstance(completed_at, datetime):
-            self.completed_at = completed_at
+            self.completed_at = naive_local(completed_at)
+        elif isinstance(completed_at, int):
+            self.completed_at = from_epoch(completed_at)
         elif isinstance(completed_at, str):
-            self.completed_at = datetime.fromisoformat(completed_at)
+            self.completed_at = parse_datetime(completed_at)
         elif completed_at is None:
             self.completed_at = None
         else:
-            raise TypeError("completed_at must be a datetime, string or None")
+            raise TypeError("completed_at must be a datetime, epoch, string or None")
 
         if isinstance(id, int):
             self.id = id
@@ -66,6 +83,22 @@ class Task:
         else:
             self.id = None
 
+    @classmethod
+    def from_row(cls, row: tuple) -> "Task":
+        """Creates a Task from a row of the tasks table without validation, the
+        timestamps are converted on first access
+        """
+
+        task = cls.__new__(cls)
+        task.id = row[0]
+        task.habit_id = row[1]
+        task.habit_order = row[2]
+        task.completed = bool(row[3])
+        task._completed_at = row[4]
+        task._start = row[5]
+        task._end = row[6]
+        return task
+
     def to_dict(self):
         """Converts the class to a dictionary"""
 
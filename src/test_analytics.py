@@ -0,0 +1,75 @@
+import unittest
+from datetime import datetime, timedelta
+from analytics import habit_summaries
+from db import habit_create, habit_delete, task_complete, task_id_for_order
+from habit import Habit
+
+
+class TestAnalytics(unittest.TestCase):
+    def create_habit(self, virtual: bool) -> Habit:
+        """Creates a habit of ten hourly tasks with orders 1-3, 5 and 6 completed half
+        an hour after their start
+        """
+
+        habit = Habit(
+            name="testAnalytics",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start=datetime(2023, 10, 24, 0, 0, 0),
+            end=datetime(2023, 10, 24, 10, 0, 0),
+            virtual=virtual,
+        )
+        habit_create(habit)
+        self.addCleanup(habit_delete, (habit.id,))
+
+        for order in [1, 2, 3, 5, 6]:
+            completed_at = habit.start + timedelta(hours=order - 1, minutes=30)
+            task_complete(task_id_for_order(habit.id, order), completed_at)
+        return habit
+
+    def test_habit_summaries(self):
+        """Test the completion statistics of stored and virtual habits"""
+
+        for virtual in [False, True]:
+            habit = self.create_habit(virtual)
+
+            [summary] = habit_summaries(habit.id)
+            self.assertEqual(
+                summary,
+                {
+                    "habit_id": habit.id,
+                    "name": "testAnalytics",
+                    "occurrences": 10,
+                    "completed": 5,
+                    "missed": 5,
+                    "completion_rate": 0.5,
+                    "longest_streak": 3,
+                    "current_streak": 0,
+                    "average_latency": 1800.0,
+                },
+            )
+
+            # Tasks that have not ended yet are neither completed nor missed
+            now = datetime(2023, 10, 24, 6, 30, 0)
+            [summary] = habit_summaries(habit.id, now=now)
+            self.assertEqual(summary["occurrences"], 7)
+            self.assertEqual(summary["missed"], 1)
+            self.assertEqual(summary["completion_rate"], 5 / 6)
+            self.assertEqual(summary["current_streak"], 2)
+
+            [summary] = habit_summaries(
+                f"*in({habit.id})",
+                start=datetime(2023, 10, 24, 4, 0, 0),
+                end=datetime(2023, 10, 24, 8, 0, 0),
+            )
+            self.assertEqual(summary["occurrences"], 4)
+            self.assertEqual(summary["completed"], 2)
+            self.assertEqual(summary["missed"], 2)
+            self.assertEqual(summary["longest_streak"], 2)
+
+        self.assertEqual(habit_summaries(0), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
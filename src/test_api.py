@@ -0,0 +1,261 @@
+import json
+import unittest
+import requests
+
+url = "http://127.0.0.1:5000"
+
+
+def create_habit(**fields) -> dict:
+    response = requests.post(
+        url + "/habits",
+        json={
+            "name": "testApi",
+            "description": "test description",
+            "interval": "PT1M",
+            "lifetime": "PT1M",
+            "active": True,
+            "start": "2023-10-24T00:00:00",
+            "end": "2023-10-25T00:00:00",
+        }
+        | fields,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+class TestApi(unittest.TestCase):
+    def setUp(self):
+        self.habit = create_habit()
+        self.addCleanup(
+            requests.delete, url + "/habits", params={"id": self.habit["id"]}
+        )
+
+    def test_stream_json(self):
+        """Test that listings are streamed as a JSON array"""
+
+        response = requests.get(
+            url + "/tasks", params={"habit_id": self.habit["id"]}, stream=True
+        )
+        self.assertEqual(response.headers["Content-Type"], "application/json")
+        self.assertNotIn("Content-Length", response.headers)
+
+        tasks = response.json()
+        self.assertEqual(len(tasks), 1440)
+        self.assertEqual([task["habit_order"] for task in tasks], list(range(1, 1441)))
+
+        response = requests.get(url + "/habits", params={"id": self.habit["id"]})
+        self.assertEqual(response.json(), [self.habit])
+
+        response = requests.get(url + "/tasks", params={"habit_id": 0})
+        self.assertEqual(response.json(), [])
+
+    def test_stream_ndjson(self):
+        """Test that listings are streamed as newline delimited JSON on request"""
+
+        response = requests.get(
+            url + "/tasks",
+            params={"habit_id": self.habit["id"]},
+            headers={"Accept": "application/x-ndjson"},
+            stream=True,
+        )
+        self.assertEqual(response.headers["Content-Type"], "application/x-ndjson")
+
+        tasks = [json.loads(line) for line in response.iter_lines()]
+        self.assertEqual(len(tasks), 1440)
+        self.assertEqual([task["habit_order"] for task in tasks], list(range(1, 1441)))
+
+        response = requests.get(
+            url + "/habits",
+            params={"id": self.habit["id"]},
+            headers={"Accept": "application/x-ndjson"},
+        )
+        self.assertEqual(response.text, json.dumps(self.habit, sort_keys=True) + "\n")
+
+    def walk_pages(self, endpoint: str, params: dict, limit: int) -> list[dict]:
+        items = []
+        after = None
+        while True:
+            response = requests.get(
+                url + endpoint, params=params | {"limit": limit, "after": after}
+            )
+            self.assertEqual(response.status_code, 200, response.text)
+            page = response.json()
+            self.assertLessEqual(len(page["items"]), limit)
+            items.extend(page["items"])
+            after = page["next"]
+            if after is None:
+                return items
+            self.assertEqual(after, page["items"][-1]["id"])
+
+    def test_pagination(self):
+        """Test that keyset pagination walks the same items as the full listing"""
+
+        virtual = create_habit(virtual=True, interval="PT7M")
+        self.addCleanup(requests.delete, url + "/habits", params={"id": virtual["id"]})
+        requests.patch(
+            url + "/tasks", params={"id": virtual["id"] * -(1 << 32) + 3}
+        ).raise_for_status()
+
+        params = {"habit_id": f"*in({self.habit['id']},{virtual['id']})"}
+        tasks = requests.get(url + "/tasks", params=params).json()
+        self.assertEqual(len(tasks), 1440 + 206)
+        self.assertEqual(self.walk_pages("/tasks", params, 500), tasks)
+        self.assertEqual(self.walk_pages("/tasks", params, 1646), tasks)
+        self.assertEqual(self.walk_pages("/tasks", params, 7), tasks)
+
+        params = {"completed": "false", "habit_id": virtual["id"]}
+        tasks = requests.get(url + "/tasks", params=params).json()
+        self.assertEqual(len(tasks), 205)
+        self.assertEqual(self.walk_pages("/tasks", params, 10), tasks)
+
+        params = {"name": "testApi"}
+        habits = requests.get(url + "/habits", params=params).json()
+        self.assertEqual(len(habits), 2)
+        self.assertEqual(self.walk_pages("/habits", params, 1), habits)
+
+    def test_complete_batch(self):
+        """Test that batches of tasks are completed in one transaction"""
+
+        virtual = create_habit(virtual=True)
+        self.addCleanup(requests.delete, url + "/habits", params={"id": virtual["id"]})
+        tasks = requests.get(url + "/tasks", params={"habit_id": self.habit["id"]})
+        ids = [task["id"] for task in tasks.json()]
+
+        # An unknown task fails the whole batch
+        response = requests.patch(url + "/tasks", json=[ids[0], 0])
+        self.assertEqual(response.status_code, 400)
+        response = requests.patch(
+            url + "/tasks", json=[ids[0], {"habit_id": virtual["id"], "habit_order": 0}]
+        )
+        self.assertEqual(response.status_code, 400)
+        completed = requests.get(url + "/tasks", params={"completed": "true"})
+        self.assertNotIn(ids[0], [task["id"] for task in completed.json()])
+
+        response = requests.patch(
+            url + "/tasks",
+            json=[
+                ids[0],
+                {"id": ids[1], "completed_at": "2023-10-24T00:01:30"},
+                {"habit_id": self.habit["id"], "habit_order": 3},
+                {"habit_id": virtual["id"], "habit_order": 2},
+            ],
+        )
+        self.assertEqual(response.status_code, 200, response.text)
+        virtual_id = virtual["id"] * -(1 << 32) + 2
+        self.assertEqual(response.json(), {"ids": ids[0:3] + [virtual_id]})
+
+        completed = requests.get(
+            url + "/tasks",
+            params={
+                "habit_id": f"*in({self.habit['id']},{virtual['id']})",
+                "completed": "true",
+            },
+        ).json()
+        self.assertEqual(
+            [task["id"] for task in completed], [ids[0], virtual_id, ids[1], ids[2]]
+        )
+        self.assertEqual(completed[2]["completed_at"], "2023-10-24T00:01:30")
+
+    def test_stats(self):
+        """Test that the query cache counters are exposed"""
+
+        before = requests.get(url + "/stats").json()["query_cache"]
+        for habit_id in ["*in(1)", "*in(1,2)", "*in(1,2,3)"]:
+            requests.get(url + "/tasks", params={"habit_id": habit_id, "limit": 1})
+        after = requests.get(url + "/stats").json()["query_cache"]
+
+        self.assertGreaterEqual(after["hits"], before["hits"] + 2)
+        self.assertLessEqual(after["size"], after["max_size"])
+
+    def test_etag(self):
+        """Test that unchanged listings are answered with 304 Not Modified"""
+
+        for endpoint, params in [
+            ("/habits", {"id": self.habit["id"]}),
+            ("/tasks", {"habit_id": self.habit["id"], "limit": 10}),
+        ]:
+            response = requests.get(url + endpoint, params=params)
+            etag = response.headers["ETag"]
+            response = requests.get(
+                url + endpoint, params=params, headers={"If-None-Match": etag}
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+
+            # Other representations and queries have their own ETag
+            response = requests.get(
+                url + endpoint,
+                params=params,
+                headers={"If-None-Match": etag, "Accept": "application/x-ndjson"},
+            )
+            self.assertEqual(response.status_code, 200)
+            response = requests.get(
+                url + endpoint,
+                params=params | {"name": "other"},
+                headers={"If-None-Match": etag},
+            )
+            self.assertEqual(response.status_code, 200)
+
+        tasks = requests.get(url + "/tasks", params=params).json()["items"]
+        requests.patch(url + "/tasks", params={"id": tasks[0]["id"]}).raise_for_status()
+        response = requests.get(
+            url + "/tasks", params=params, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertTrue(response.json()["items"][0]["completed"])
+
+    def test_include_habit(self):
+        """Test that tasks are joined with their habit on request"""
+
+        virtual = create_habit(virtual=True, name="testApiVirtual", interval="PT7M")
+        self.addCleanup(requests.delete, url + "/habits", params={"id": virtual["id"]})
+
+        params = {"habit_id": f"*in({self.habit['id']},{virtual['id']})"}
+        tasks = requests.get(url + "/tasks", params=params).json()
+        joined = requests.get(url + "/tasks", params=params | {"include": "habit"})
+        self.assertEqual(joined.status_code, 200, joined.text)
+        joined = joined.json()
+
+        self.assertEqual(
+            [task["id"] for task in joined], [task["id"] for task in tasks]
+        )
+        names = {self.habit["id"]: "testApi", virtual["id"]: "testApiVirtual"}
+        for task in joined:
+            self.assertEqual(
+                task.pop("habit"),
+                {"name": names[task["habit_id"]], "description": "test description"},
+            )
+        self.assertEqual(joined, tasks)
+
+        page = requests.get(
+            url + "/tasks", params=params | {"include": "habit", "limit": 2}
+        ).json()
+        self.assertEqual(
+            [task["id"] for task in page["items"]], [tasks[0]["id"], tasks[1]["id"]]
+        )
+        self.assertEqual(page["next"], tasks[1]["id"])
+
+        response = requests.get(url + "/tasks", params=params | {"include": "other"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_analytics_habits(self):
+        """Test that habit statistics are computed by the server"""
+
+        response = requests.get(
+            url + "/analytics/habits",
+            params={"habit_id": self.habit["id"], "end": "2023-10-24T01:00:00"},
+        )
+        self.assertEqual(response.status_code, 200, response.text)
+        [summary] = response.json()
+        self.assertEqual(summary["occurrences"], 60)
+        self.assertEqual(summary["missed"], 60)
+        self.assertEqual(summary["completion_rate"], 0.0)
+
+        response = requests.get(url + "/streaks", params={"limit": 1})
+        self.assertLessEqual(len(response.json()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import http.client
+import socket
+import threading
+import unittest
+from async_server import MAX_BODY_SIZE, AsyncWSGIServer
+
+WORKERS = 4
+IDLE_CLIENTS = 500
+
+
+def app(environ, start_response):
+    """A WSGI app echoing the request body, streaming /stream in chunks"""
+
+    if environ["PATH_INFO"] == "/stream":
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return (str(i).encode() + b"\n" for i in range(1000))
+
+    body = environ["wsgi.input"].read()
+    response = environ["REQUEST_METHOD"].encode() + b" " + body
+    start_response(
+        "200 OK",
+        [("Content-Type", "text/plain"), ("Content-Length", str(len(response)))],
+    )
+    return [response]
+
+
+class TestAsyncServer(unittest.TestCase):
+    def setUp(self):
+        server = AsyncWSGIServer(app, WORKERS)
+        ready = threading.Event()
+        loop = asyncio.new_event_loop()
+
+        def started(port: int):
+            self.port = port
+            ready.set()
+
+        task = loop.create_task(server.serve("127.0.0.1", 0, started))
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        ready.wait(5)
+
+        async def cancel():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        def stop():
+            # Close the connections before the loop stops, they cannot close after
+            asyncio.run_coroutine_threadsafe(cancel(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+            loop.close()
+            server.executor.shutdown()
+
+        self.addCleanup(stop)
+
+    def test_keep_alive(self):
+        """Test that requests on a kept alive connection are answered in turn"""
+
+        con = http.client.HTTPConnection("127.0.0.1", self.port)
+        self.addCleanup(con.close)
+
+        con.request("POST", "/echo", body=b"hello")
+        response = con.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b"POST hello")
+        sock = con.sock
+
+        con.request("GET", "/stream")
+        response = con.getresponse()
+        self.assertEqual(response.getheader("Transfer-Encoding"), "chunked")
+        self.assertEqual(
+            response.read(), b"".join(str(i).encode() + b"\n" for i in range(1000))
+        )
+        self.assertIs(con.sock, sock)
+
+    def test_request_framing(self):
+        """Test that bodies that are too large or ambiguously framed are rejected"""
+
+        for head, status in [
+            (b"Content-Length: -1\r\n", b"400"),
+            (b"Content-Length: 5\r\nTransfer-Encoding: chunked\r\n", b"400"),
+            (b"Content-Length: %d\r\n" % (MAX_BODY_SIZE + 1), b"413"),
+            (b"Transfer-Encoding: chunked\r\n", b"413"),
+        ]:
+            with socket.create_connection(("127.0.0.1", self.port)) as sock:
+                sock.sendall(b"POST /echo HTTP/1.1\r\nHost: test\r\n" + head + b"\r\n")
+                if b"chunked" in head and b"Content-Length" not in head:
+                    sock.sendall(b"%x\r\n" % (MAX_BODY_SIZE + 1))
+                response = sock.makefile("rb").readline()
+                self.assertEqual(response.split(b" ")[1], status, head)
+
+    def test_http_10(self):
+        """Test that streamed responses to HTTP/1.0 clients end by closing"""
+
+        with socket.create_connection(("127.0.0.1", self.port)) as sock:
+            sock.sendall(b"GET /stream HTTP/1.0\r\n\r\n")
+            response = sock.makefile("rb").read()
+        head, _, body = response.partition(b"\r\n\r\n")
+        self.assertNotIn(b"chunked", head.lower())
+        self.assertIn(b"Connection: close", head)
+        self.assertEqual(body, b"".join(str(i).encode() + b"\n" for i in range(1000)))
+
+    def test_idle_clients(self):
+        """Test that idle keep-alive clients do not take up threads"""
+
+        threads = threading.active_count()
+        idle = [
+            socket.create_connection(("127.0.0.1", self.port))
+            for _ in range(IDLE_CLIENTS)
+        ]
+        for sock in idle:
+            self.addCleanup(sock.close)
+
+        cons = [http.client.HTTPConnection("127.0.0.1", self.port) for _ in range(20)]
+        for con in cons:
+            self.addCleanup(con.close)
+        for i, con in enumerate(cons):
+            con.request("POST", "/echo", body=str(i).encode())
+        for i, con in enumerate(cons):
+            self.assertEqual(con.getresponse().read(), b"POST " + str(i).encode())
+
+        self.assertLessEqual(threading.active_count(), threads + WORKERS)
+
+
+if __name__ == "__main__":
+    unittest.main()
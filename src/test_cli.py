@@ -1,6 +1,11 @@
 import json
+import os
+import subprocess
+import tempfile
 import unittest
-from cli import parser
+from cli import etag_cache, parse_args
+from db import DATABASE_PATH
+from snapshot import write_snapshot
 import io
 import sys
 
@@ -16,7 +21,7 @@ def reset_stdout():
 
 
 def run_cli(arguments: list[str]) -> list[dict] | dict:
-    args = parser.parse_args(args=arguments)
+    args = parse_args(arguments)
 
     captured_output = capture_stdout()
     args.func(args)
@@ -71,6 +76,7 @@ class TestTask(unittest.TestCase):
                 "active": True,
                 "start": "2023-10-24T08:00:00",
                 "end": "2023-10-25T08:00:00",
+                "virtual": False,
             },
         )
 
@@ -102,6 +108,7 @@ class TestTask(unittest.TestCase):
                 "active": True,
                 "start": "2023-10-24T08:00:00",
                 "end": "2023-10-25T08:00:00",
+                "virtual": False,
             },
         )
 
@@ -228,6 +235,7 @@ class TestTask(unittest.TestCase):
                 "active": True,
                 "start": "2023-10-24T08:00:00",
                 "end": "2023-10-25T08:00:00",
+                "virtual": False,
             },
         )
 
@@ -255,6 +263,7 @@ class TestTask(unittest.TestCase):
                 "active": True,
                 "start": "2023-10-24T08:00:00",
                 "end": "2023-10-25T08:00:00",
+                "virtual": False,
             },
         )
 
@@ -307,6 +316,334 @@ class TestTask(unittest.TestCase):
         self.assertEqual(len(parsed_output), 1)
         self.assertDictEqual(parsed_output[0], {"id": habit_id})
 
+    def test_cli_page_size(self):
+        parsed_output = run_cli(
+            [
+                "--format",
+                "json",
+                "habits:create",
+                "--name",
+                "test",
+                "--description",
+                "test description",
+                "--interval",
+                "PT1H",
+                "--lifetime",
+                "PT1H",
+                "--start",
+                "2023-10-24T00:00:00",
+                "--end",
+                "2023-10-25T00:00:00",
+            ]
+        )
+        habit_id = parsed_output[0]["id"]
+        self.addCleanup(
+            run_cli, ["--format", "json", "habits:delete", "--id", str(habit_id)]
+        )
+
+        # List tasks page by page
+
+        tasks = run_cli(["--format", "json", "tasks:list", "--habit_id", str(habit_id)])
+        self.assertEqual(len(tasks), 24)
+
+        for page_size in ["5", "24", "100"]:
+            parsed_output = run_cli(
+                [
+                    "--format",
+                    "json",
+                    "tasks:list",
+                    "--habit_id",
+                    str(habit_id),
+                    "--page-size",
+                    page_size,
+                ]
+            )
+            self.assertEqual(parsed_output, tasks)
+
+        # List habits page by page
+
+        parsed_output = run_cli(
+            [
+                "--format",
+                "json",
+                "habits:list",
+                "--id",
+                str(habit_id),
+                "--page-size",
+                "1",
+            ]
+        )
+        self.assertEqual(
+            parsed_output,
+            run_cli(["--format", "json", "habits:list", "--id", str(habit_id)]),
+        )
+
+    def test_cli_complete_batch(self):
+        parsed_output = run_cli(
+            [
+                "--format",
+                "json",
+                "habits:create",
+                "--name",
+                "test",
+                "--description",
+                "test description",
+                "--interval",
+                "PT1H",
+                "--lifetime",
+                "PT1H",
+                "--start",
+                "2023-10-24T00:00:00",
+                "--end",
+                "2023-10-25T00:00:00",
+            ]
+        )
+        habit_id = parsed_output[0]["id"]
+        self.addCleanup(
+            run_cli, ["--format", "json", "habits:delete", "--id", str(habit_id)]
+        )
+        tasks = run_cli(["--format", "json", "tasks:list", "--habit_id", str(habit_id)])
+        ids = [task["id"] for task in tasks]
+
+        # Unchanged listings are revalidated by their ETag
+        etags = len(etag_cache)
+        self.assertEqual(
+            run_cli(["--format", "json", "tasks:list", "--habit_id", str(habit_id)]),
+            tasks,
+        )
+        self.assertEqual(len(etag_cache), etags)
+
+        # Paged listings are not cached
+        run_cli(
+            [
+                "--format",
+                "json",
+                "tasks:list",
+                "--habit_id",
+                str(habit_id),
+                "--page-size",
+                "5",
+            ]
+        )
+        self.assertEqual(len(etag_cache), etags)
+
+        # Complete tasks by id
+
+        parsed_output = run_cli(
+            [
+                "--format",
+                "json",
+                "tasks:complete",
+                "--ids",
+                ",".join(str(id) for id in ids[0:3]),
+            ]
+        )
+        self.assertEqual(parsed_output, {"ids": ids[0:3]})
+
+        # Complete tasks from a file
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+            json.dump(
+                [
+                    ids[3],
+                    {"habit_id": habit_id, "habit_order": 5},
+                    {"id": ids[5], "completed_at": "2023-10-24T05:30:00"},
+                ],
+                file,
+            )
+        self.addCleanup(os.remove, file.name)
+
+        parsed_output = run_cli(
+            ["--format", "json", "tasks:complete", "--from-file", file.name]
+        )
+        self.assertEqual(parsed_output, {"ids": ids[3:6]})
+
+        tasks = run_cli(
+            [
+                "--format",
+                "json",
+                "tasks:list",
+                "--habit_id",
+                str(habit_id),
+                "--completed",
+                "true",
+            ]
+        )
+        self.assertEqual([task["id"] for task in tasks], ids[0:6])
+        self.assertEqual(tasks[5]["completed_at"], "2023-10-24T05:30:00")
+
+        parsed_output = run_cli(
+            [
+                "--format",
+                "json",
+                "analytics",
+                "list_longest_streaks",
+                "--habit_id",
+                str(habit_id),
+            ]
+        )
+        self.assertEqual(
+            parsed_output, [{"streak": 6, "ids": ids[0:6], "habit_id": habit_id}]
+        )
+
+    def test_cli_batch(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+            file.write(
+                """# Commands run over one connection
+habits:create --name testBatch --description "test description" --interval PT1H --lifetime PT1H --start 2023-10-24T00:00:00 --end 2023-10-25T00:00:00
+
+habits:unknown
+["habits:list", "--name", "testBatch"]
+"""
+            )
+        self.addCleanup(os.remove, file.name)
+
+        args = parse_args(["--format", "json", "batch", file.name])
+        captured_output = capture_stdout()
+        stderr = io.StringIO()
+        sys.stderr = stderr
+        try:
+            args.func(args)
+        finally:
+            sys.stderr = sys.__stderr__
+            reset_stdout()
+        args.file.close()
+
+        created, listed = [
+            json.loads(line) for line in captured_output.getvalue().splitlines()
+        ]
+        self.addCleanup(
+            run_cli,
+            ["--format", "json", "habits:delete", "--id", str(created[0]["id"])],
+        )
+        self.assertEqual(listed, created)
+        self.assertIn("Error in line 4", stderr.getvalue())
+
+    def test_cli_direct(self):
+        created = run_cli(
+            [
+                "--format",
+                "json",
+                "habits:create",
+                "--name",
+                "testDirect",
+                "--description",
+                "test description",
+                "--interval",
+                "PT1H",
+                "--lifetime",
+                "PT1H",
+                "--start",
+                "2023-10-24T00:00:00",
+                "--end",
+                "2023-10-25T00:00:00",
+            ]
+        )
+        habit_id = str(created[0]["id"])
+        self.addCleanup(
+            run_cli, ["--format", "json", "habits:delete", "--id", habit_id]
+        )
+
+        # Direct mode runs against the database file of the server, whose ETags
+        # change with writes of other processes
+        direct = ["--format", "json", "--direct", DATABASE_PATH]
+        tasks = run_cli(["--format", "json", "tasks:list", "--habit_id", habit_id])
+        self.assertEqual(
+            run_cli(direct + ["tasks:complete", "--ids", str(tasks[3]["id"])]),
+            {"ids": [tasks[3]["id"]]},
+        )
+
+        for command in [
+            ["habits:list", "--id", habit_id],
+            ["tasks:list", "--habit_id", habit_id],
+            ["tasks:list", "--habit_id", habit_id, "--page-size", "7"],
+            ["tasks:list", "--habit_id", habit_id, "--completed", "true"],
+            ["tasks:active"],
+            ["analytics", "list_longest_streaks", "--habit_id", habit_id],
+            ["analytics", "habit_summary", "--habit_id", habit_id],
+            ["tasks:complete", "--id", "0"],
+        ]:
+            self.assertEqual(
+                run_cli(direct + command),
+                run_cli(["--format", "json"] + command),
+                command,
+            )
+
+    def test_cli_snapshot_analytics(self):
+        created = run_cli(
+            [
+                "--format",
+                "json",
+                "habits:create",
+                "--name",
+                "testSnapshot",
+                "--description",
+                "test description",
+                "--interval",
+                "PT1H",
+                "--lifetime",
+                "PT1H",
+                "--start",
+                "2023-10-24T00:00:00",
+                "--end",
+                "2023-10-25T00:00:00",
+            ]
+        )
+        habit_id = str(created[0]["id"])
+        self.addCleanup(
+            run_cli, ["--format", "json", "habits:delete", "--id", habit_id]
+        )
+        tasks = run_cli(["--format", "json", "tasks:list", "--habit_id", habit_id])
+        run_cli(["--format", "json", "tasks:complete", "--id", str(tasks[1]["id"])])
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "tasks.snapshot")
+        write_snapshot(path)
+
+        analytics = ["--format", "json", "analytics", "--snapshot", path]
+        self.assertEqual(
+            run_cli(analytics + ["completion_heatmap", "--habit_id", habit_id]),
+            [
+                {
+                    "date": "2023-10-24",
+                    "tasks": 24,
+                    "completed": 1,
+                    "completion_rate": 1 / 24,
+                }
+            ],
+        )
+        weekdays = run_cli(analytics + ["weekday_hours", "--habit_id", habit_id])
+        self.assertEqual([row["weekday"] for row in weekdays][:2], ["Mon", "Tue"])
+        self.assertEqual(
+            sum(row[str(hour)] for row in weekdays for hour in range(24)), 1
+        )
+        rolling = run_cli(
+            analytics
+            + ["rolling_completion_rate", "--habit_id", habit_id, "--window", "2"]
+        )
+        self.assertEqual(
+            [row["completion_rate"] for row in rolling[:3]], [0.0, 0.5, 0.5]
+        )
+        self.assertEqual(rolling[0]["start"], "2023-10-24T00:00:00")
+
+    def test_cli_lazy_imports(self):
+        """Test that starting the CLI does not import what only some commands need"""
+
+        code = (
+            "import sys, cli; args = cli.parse_args(['tasks:active']); "
+            "print(sorted(set(sys.modules) & {'requests', 'tabulate', 'db', 'api'})); "
+            "print(sorted(cli.assigned_commands))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.splitlines(), ["[]", "['tasks:active']"])
+
 
 if __name__ == "__main__":
     unittest.main()
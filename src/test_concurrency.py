@@ -0,0 +1,75 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+url = "http://127.0.0.1:5000"
+
+HABITS = 32
+WORKERS = 16
+
+
+class TestConcurrency(unittest.TestCase):
+    def test_parallel_requests(self):
+        """Test that parallel requests to /habits and /tasks each get their own results"""
+
+        def create_habit(i: int) -> dict:
+            response = requests.post(
+                url + "/habits",
+                json={
+                    "name": f"testConcurrency{i}",
+                    "description": "test description",
+                    "interval": "PT1H",
+                    "lifetime": "PT1H",
+                    "active": True,
+                    "start": "2023-10-24T00:00:00",
+                    "end": "2023-10-25T00:00:00",
+                },
+            )
+            self.assertEqual(response.status_code, 200, response.text)
+            return response.json()
+
+        def list_habit(habit: dict) -> tuple[dict, list[dict], list[dict]]:
+            habits = requests.get(url + "/habits", params={"id": habit["id"]})
+            tasks = requests.get(url + "/tasks", params={"habit_id": habit["id"]})
+            self.assertEqual(habits.status_code, 200, habits.text)
+            self.assertEqual(tasks.status_code, 200, tasks.text)
+            return habit, habits.json(), tasks.json()
+
+        def complete_task(task: dict) -> dict:
+            response = requests.patch(url + "/tasks", params={"id": task["id"]})
+            self.assertEqual(response.status_code, 200, response.text)
+            return response.json()
+
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            habits = list(executor.map(create_habit, range(HABITS)))
+            for habit in habits:
+                self.addCleanup(
+                    requests.delete, url + "/habits", params={"id": habit["id"]}
+                )
+
+            self.assertEqual(len({habit["id"] for habit in habits}), HABITS)
+            self.assertEqual(
+                [habit["name"] for habit in habits],
+                [f"testConcurrency{i}" for i in range(HABITS)],
+            )
+
+            first_tasks = []
+            for habit, listed_habits, tasks in executor.map(list_habit, habits * 4):
+                self.assertEqual(listed_habits, [habit])
+                self.assertEqual(len(tasks), 24)
+                self.assertTrue(all(task["habit_id"] == habit["id"] for task in tasks))
+                first_tasks.append(tasks[0])
+
+            completed = list(executor.map(complete_task, first_tasks[:HABITS]))
+            self.assertEqual(
+                completed, [{"id": task["id"]} for task in first_tasks[:HABITS]]
+            )
+
+            for habit, _, tasks in executor.map(list_habit, habits):
+                self.assertEqual(
+                    [task["completed"] for task in tasks], [True] + [False] * 23
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,605 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from db import (
+    DATABASE_PATH,
+    ConnectionPool,
+    connection,
+    extend_horizons,
+    habit_cache_info,
+    habit_create,
+    habit_delete,
+    habit_list,
+    habit_update,
+    migrate,
+    query_cache_info,
+    rebuild_streaks,
+    set_horizon,
+    streak_list,
+    task_complete,
+    task_list,
+    task_list_query,
+)
+from duration import Duration
+from habit import Habit
+from utils import to_epoch
+
+
+@contextmanager
+def local_timezone(name: str):
+    """Sets the local timezone of the process to name inside the block"""
+
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = name
+    time.tzset()
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = previous
+        time.tzset()
+
+
+class TestDb(unittest.TestCase):
+    def test_habit_create_bulk_tasks(self):
+        """Test that all tasks of a habit are created in order with contiguous ids"""
+
+        habit = Habit(
+            name="testBulk",
+            description="testDescription",
+            interval="PT5M",
+            lifetime="PT5M",
+            start=datetime(2023, 10, 19, 0, 0, 0),
+            end=datetime(2023, 10, 29, 0, 0, 0),
+        )
+        habit_create(habit)
+        self.addCleanup(habit_delete, (habit.id,))
+
+        tasks = task_list(habit_id=habit.id)
+
+        self.assertEqual(len(tasks), 2880)
+        self.assertEqual([task.habit_order for task in tasks], list(range(1, 2881)))
+        self.assertEqual(
+            [task.id for task in tasks], list(range(tasks[0].id, tasks[0].id + 2880))
+        )
+        self.assertEqual(tasks[0].start, datetime(2023, 10, 19, 0, 0, 0))
+        self.assertEqual(tasks[-1].end, datetime(2023, 10, 29, 0, 0, 0))
+
+    def test_utc_offsets(self):
+        """Test that datetimes with a UTC offset are stored in local time"""
+
+        # 2 hours ahead of UTC in October 2023
+        self.enterContext(local_timezone("Europe/Oslo"))
+        habit = Habit(
+            name="testOffsets",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start="2023-10-24T08:00:00+02:00",
+            end=datetime(2023, 10, 24, 12, 0, 0, tzinfo=timezone(-timedelta(hours=1))),
+        )
+        habit_create(habit)
+        self.addCleanup(habit_delete, (habit.id,))
+
+        self.assertEqual(
+            [(h.start, h.end) for h in habit_list(id=habit.id)],
+            [(datetime(2023, 10, 24, 8), datetime(2023, 10, 24, 15))],
+        )
+        tasks = task_list(habit_id=habit.id, start=">2023-10-24T06:30:00Z")
+        self.assertEqual([task.habit_order for task in tasks], [2, 3, 4, 5, 6, 7])
+        self.assertEqual(tasks[0].start, datetime(2023, 10, 24, 9))
+        self.assertEqual(
+            [
+                task.habit_order
+                for task in task_list(habit_id=habit.id, start=">2023-10-24T08:30:00")
+            ],
+            [2, 3, 4, 5, 6, 7],
+        )
+
+    def test_virtual_habit_tasks(self):
+        """Test that tasks of virtual habits match materialized ones and are stored on completion"""
+
+        habits = [
+            Habit(
+                name="testVirtual",
+                description="testDescription",
+                interval=interval,
+                lifetime="PT2H",
+                start=datetime(2023, 10, 24, 8, 0, 0),
+                end=datetime(2024, 1, 24, 8, 0, 0),
+                virtual=virtual,
+            )
+            for interval in ["PT4H", "P1M"]
+            for virtual in [False, True]
+        ]
+        for habit in habits:
+            habit_create(habit)
+            self.addCleanup(habit_delete, (habit.id,))
+
+        def fields(tasks):
+            return [(t.habit_order, t.start, t.end, t.completed) for t in tasks]
+
+        for materialized, virtual in [habits[0:2], habits[2:4]]:
+            for start, end in [
+                (None, None),
+                ("<2023-11-01T10:00:00", ">2023-11-01T09:00:00"),
+                ("2023-11-24T08:00:00", None),
+                (">2023-12-24T08:00:00", "<2023-12-25T12:00:00"),
+            ]:
+                self.assertEqual(
+                    fields(task_list(habit_id=virtual.id, start=start, end=end)),
+                    fields(task_list(habit_id=materialized.id, start=start, end=end)),
+                )
+
+        virtual = habits[1]
+        tasks = task_list(habit_id=virtual.id)
+        self.assertEqual(len(tasks), 552)
+        self.assertTrue(all(task.id < 0 for task in tasks))
+        self.assertEqual([task.id for task in tasks], sorted(task.id for task in tasks))
+
+        task_complete(tasks[3].id)
+
+        completed_tasks = task_list(habit_id=virtual.id, completed=True)
+        self.assertEqual(len(completed_tasks), 1)
+        self.assertEqual(completed_tasks[0].id, tasks[3].id)
+        self.assertEqual(completed_tasks[0].start, tasks[3].start)
+        self.assertIsNotNone(completed_tasks[0].completed_at)
+        self.assertEqual(len(task_list(habit_id=virtual.id, completed=False)), 551)
+        self.assertEqual(
+            [task.id for task in task_list(habit_id=virtual.id)],
+            [task.id for task in tasks],
+        )
+
+    def test_streaks(self):
+        """Test that streaks are merged on completion and match a rebuild"""
+
+        now = datetime.now().replace(microsecond=0)
+        habits = [
+            Habit(
+                name="testStreaks",
+                description="testDescription",
+                interval="PT1H",
+                lifetime="PT1H",
+                start=now - timedelta(hours=12, minutes=30),
+                end=now + timedelta(hours=11, minutes=30),
+                virtual=virtual,
+            )
+            for virtual in [False, True]
+        ]
+        for habit in habits:
+            habit_create(habit)
+            self.addCleanup(habit_delete, (habit.id,))
+
+        def fields(streaks):
+            return [(s.habit_id, s.length, s.ids) for s in streaks]
+
+        for habit in habits:
+            tasks = task_list(habit_id=habit.id)
+            for order in [3, 5, 4, 4, 10, 1, 2]:
+                task_complete(tasks[order - 1].id)
+            ids = [task.id for task in tasks]
+
+            streaks = streak_list(habit_id=habit.id)
+            self.assertEqual(
+                fields(streaks), [(habit.id, 5, ids[0:5]), (habit.id, 1, ids[9:10])]
+            )
+            self.assertEqual(
+                fields(streak_list(habit_id=habit.id, length=">1")),
+                [(habit.id, 5, ids[0:5])],
+            )
+
+            # Task 11 has ended without being completed, task 13 is open until
+            # half an hour from now
+            self.assertEqual(streak_list(habit_id=habit.id, current=True), [])
+            task_complete(tasks[12].id)
+            self.assertEqual(
+                fields(streak_list(habit_id=habit.id, current=True)),
+                [(habit.id, 1, ids[12:13])],
+            )
+            task_complete(tasks[11].id)
+            self.assertEqual(
+                fields(streak_list(habit_id=habit.id, current=True)),
+                [(habit.id, 2, ids[11:13])],
+            )
+
+            streaks = streak_list(habit_id=habit.id)
+            with connection() as con, con:
+                rebuild_streaks((habit.id,))
+            self.assertEqual(
+                fields(streak_list(habit_id=habit.id)),
+                [
+                    (habit.id, 5, ids[0:5]),
+                    (habit.id, 2, ids[11:13]),
+                    (habit.id, 1, ids[9:10]),
+                ],
+            )
+            self.assertEqual(fields(streak_list(habit_id=habit.id)), fields(streaks))
+
+    def test_streaks_ended(self):
+        """Test that streaks up to the last task of an ended habit are not current"""
+
+        for virtual in [False, True]:
+            habit = Habit(
+                name="testStreaksEnded",
+                description="testDescription",
+                interval="PT1H",
+                lifetime="PT1H",
+                start=datetime(2023, 10, 24, 8, 0, 0),
+                end=datetime(2023, 10, 24, 12, 0, 0),
+                virtual=virtual,
+            )
+            habit_create(habit)
+            self.addCleanup(habit_delete, (habit.id,))
+
+            tasks = task_list(habit_id=habit.id)
+            for task in tasks[2:]:
+                task_complete(task.id)
+            self.assertEqual(
+                [s.length for s in streak_list(habit_id=habit.id)], [2], virtual
+            )
+            self.assertEqual(streak_list(habit_id=habit.id, current=True), [])
+
+    def test_habit_delete_rollback(self):
+        """Test that a habit, its tasks and its streaks are deleted all or nothing"""
+
+        habit = Habit(
+            name="testDeleteRollback",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start=datetime(2023, 10, 24, 8, 0, 0),
+            end=datetime(2023, 10, 24, 12, 0, 0),
+        )
+        habit_create(habit)
+        self.addCleanup(habit_delete, (habit.id,))
+        task_complete(task_list(habit_id=habit.id)[0].id)
+
+        with connection() as con, con:
+            con.execute(
+                f"""CREATE TRIGGER test_streaks_delete BEFORE DELETE ON streaks
+                WHEN old.habit_id = {habit.id}
+                BEGIN SELECT RAISE(ABORT, 'streaks delete failed'); END"""
+            )
+
+        def drop_trigger():
+            with connection() as con, con:
+                con.execute("DROP TRIGGER IF EXISTS test_streaks_delete")
+
+        self.addCleanup(drop_trigger)
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            habit_delete((habit.id,))
+        self.assertEqual([h.id for h in habit_list(id=habit.id)], [habit.id])
+        self.assertEqual(len(task_list(habit_id=habit.id)), 4)
+        self.assertEqual([s.length for s in streak_list(habit_id=habit.id)], [1])
+
+    def test_horizon(self):
+        """Test that tasks are only materialized up to the horizon and extended later"""
+
+        now = datetime.now().replace(microsecond=0)
+        habit = Habit(
+            name="testHorizon",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start=now - timedelta(hours=1, minutes=30),
+            end=now + timedelta(hours=22, minutes=30),
+        )
+        self.addCleanup(set_horizon, None)
+        set_horizon(3)
+        habit_create(habit)
+        self.addCleanup(habit_delete, (habit.id,))
+
+        def starts():
+            return [task.start for task in task_list(habit_id=habit.id)]
+
+        def expected(count):
+            return [habit.start + timedelta(hours=order) for order in range(count)]
+
+        self.assertEqual(starts(), expected(5))
+
+        extend_horizons(now + timedelta(hours=5))
+        self.assertEqual(starts(), expected(10))
+
+        set_horizon(Duration("PT10H"))
+        with mock.patch("db.TASK_BATCH_SIZE", 4):
+            extend_horizons(now + timedelta(hours=5))
+        self.assertEqual(starts(), expected(17))
+
+        set_horizon(None)
+        extend_horizons()
+        tasks = task_list(habit_id=habit.id)
+        self.assertEqual([task.start for task in tasks], expected(24))
+        self.assertEqual([task.habit_order for task in tasks], list(range(1, 25)))
+        self.assertEqual(extend_horizons(), 0)
+
+    def test_habit_update(self):
+        """Test that updates only regenerate future tasks when the schedule changes"""
+
+        now = datetime.now().replace(microsecond=0)
+        habit = Habit(
+            name="testUpdate",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start=now - timedelta(hours=4, minutes=30),
+            end=now + timedelta(hours=19, minutes=30),
+        )
+        habit_create(habit)
+        self.addCleanup(habit_delete, (habit.id,))
+        tasks = task_list(habit_id=habit.id)
+        self.assertEqual(len(tasks), 24)
+        task_complete(tasks[4].id)
+        task_complete(tasks[5].id)
+        tasks = task_list(habit_id=habit.id)
+
+        def fields(tasks):
+            return [(t.id, t.habit_order, t.start, t.end, t.completed) for t in tasks]
+
+        # Metadata changes keep the tasks as they are
+        habit.name = "testUpdate2"
+        self.assertEqual(habit_update(habit).name, "testUpdate2")
+        self.assertEqual(fields(task_list(habit_id=habit.id)), fields(tasks))
+
+        # Tasks starting after now follow the new interval and continue the order
+        habit.interval = Duration("PT2H")
+        habit_update(habit)
+        updated = task_list(habit_id=habit.id)
+        self.assertEqual(fields(updated[:5]), fields(tasks[:5]))
+        self.assertEqual(
+            [(t.habit_order, t.start) for t in updated[5:]],
+            [
+                (order, tasks[4].start + timedelta(hours=2 * (order - 5)))
+                for order in range(6, 15)
+            ],
+        )
+        self.assertEqual(
+            [(s.length, s.ids) for s in streak_list(habit_id=habit.id)],
+            [(1, [tasks[4].id])],
+        )
+
+        # Tasks starting after now get the new lifetime
+        habit.lifetime = Duration("PT30M")
+        habit_update(habit)
+        rescheduled = task_list(habit_id=habit.id)
+        self.assertEqual(fields(rescheduled[:5]), fields(updated[:5]))
+        self.assertEqual(
+            [(t.habit_order, t.start) for t in rescheduled[5:]],
+            [(t.habit_order, t.start) for t in updated[5:]],
+        )
+        self.assertTrue(
+            all(t.end - t.start == timedelta(minutes=30) for t in rescheduled[5:])
+        )
+
+        # Tasks of virtual habits are computed from the start of the habit
+        virtual = Habit(
+            name="testUpdateVirtual",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start=now - timedelta(hours=4, minutes=30),
+            end=now + timedelta(hours=19, minutes=30),
+            virtual=True,
+        )
+        habit_create(virtual)
+        self.addCleanup(habit_delete, (virtual.id,))
+        tasks = task_list(habit_id=virtual.id)
+        task_complete(tasks[1].id)
+        tasks = task_list(habit_id=virtual.id)
+
+        virtual.interval = Duration("PT2H")
+        with self.assertRaises(ValueError):
+            habit_update(virtual)
+        self.assertEqual(fields(task_list(habit_id=virtual.id)), fields(tasks))
+        self.assertEqual(habit_list(id=virtual.id)[0].interval, Duration("PT1H"))
+
+        virtual.interval = Duration("PT1H")
+        virtual.name = "testUpdateVirtual2"
+        self.assertEqual(habit_update(virtual).name, "testUpdateVirtual2")
+
+    def test_migrate_timestamps(self):
+        """Test that databases with ISO 8601 timestamps are migrated to epoch integers"""
+
+        path = os.path.join(tempfile.mkdtemp(), "database.db")
+        con = sqlite3.connect(path)
+        con.executescript(
+            """CREATE TABLE habits (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                lifetime TEXT NOT NULL,
+                active INTEGER NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL
+            );
+            CREATE TABLE tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                habit_id INTEGER NOT NULL,
+                habit_order INTEGER NOT NULL,
+                completed INTEGER NOT NULL,
+                completed_at TEXT,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL
+            );
+            INSERT INTO habits VALUES (
+                1, 'a', 'b', 'PT1H', 'PT1H', 1, '2023-10-24T08:00:00', '2023-10-24T13:00:00+04:00'
+            );
+            INSERT INTO tasks VALUES
+                (1, 1, 1, 1, '2023-10-24 08:30:00.123456', '2023-10-24T08:00:00', '2023-10-24T09:00:00'),
+                (2, 1, 2, 1, '2023-10-24T09:30:00.123+02:00', '2023-10-24T07:00:00Z', '2023-10-24T11:00:00+03:00'),
+                (4, 1, 3, 0, NULL, '2023-10-24T10:00:00', '2023-10-24T11:00:00');
+            DELETE FROM tasks WHERE id = 4;"""
+        )
+        con.commit()
+        con.close()
+
+        # Timestamps with a UTC offset are converted to local time, 2 hours ahead of
+        # UTC in Oslo in October 2023
+        with local_timezone("Europe/Oslo"), mock.patch(
+            "db.pool", ConnectionPool(path)
+        ), mock.patch("db.TASK_BATCH_SIZE", 1):
+            migrate()
+
+            self.assertEqual(
+                [(h.start, h.end) for h in habit_list()],
+                [(datetime(2023, 10, 24, 8), datetime(2023, 10, 24, 11))],
+            )
+            self.assertEqual(
+                [(t.id, t.start, t.completed_at) for t in task_list()],
+                [
+                    (
+                        1,
+                        datetime(2023, 10, 24, 8),
+                        datetime(2023, 10, 24, 8, 30, 0, 123456),
+                    ),
+                    (
+                        2,
+                        datetime(2023, 10, 24, 9),
+                        datetime(2023, 10, 24, 9, 30, 0, 123000),
+                    ),
+                ],
+            )
+            self.assertEqual([(s.length, s.ids) for s in streak_list()], [(2, [1, 2])])
+            self.assertEqual(
+                len(
+                    task_list(start=">2023-10-24T08:00:00", end="<2023-10-24T10:00:01")
+                ),
+                1,
+            )
+
+            with connection() as con:
+                self.assertEqual(con.execute("PRAGMA user_version").fetchone()[0], 1)
+                self.assertEqual(
+                    con.execute(
+                        "SELECT DISTINCT typeof(start), typeof(end) FROM tasks"
+                    ).fetchall(),
+                    [("integer", "integer")],
+                )
+                self.assertEqual(
+                    con.execute(
+                        "SELECT seq FROM sqlite_sequence WHERE name = 'tasks'"
+                    ).fetchone(),
+                    (4,),
+                )
+
+    def test_task_queries_use_indexes(self):
+        """Test that the hot task queries are answered from an index"""
+
+        now = datetime.now().isoformat()
+        queries = [
+            task_list_query(habit_id=1),
+            task_list_query(habit_id="*in(1, 2)", completed=True),
+            task_list_query(completed=False, start="<" + now, end=">" + now),
+            task_list_query(start="<" + now, end=">" + now),
+            (
+                "DELETE FROM tasks WHERE habit_id in (SELECT value FROM json_each(?))",
+                ["[1, 2]"],
+            ),
+            (
+                "DELETE FROM tasks WHERE habit_id = ? AND start > ?",
+                [1, to_epoch(datetime.now())],
+            ),
+        ]
+
+        for query, params in queries:
+            with connection() as con:
+                plan = [
+                    row[3] for row in con.execute("EXPLAIN QUERY PLAN " + query, params)
+                ]
+            self.assertRegex(plan[0], r"^SEARCH tasks USING (COVERING )?INDEX", query)
+
+    def test_query_cache(self):
+        """Test that queries differing only in their values share one compiled SQL"""
+
+        now = datetime.now().isoformat()
+        first_query, first_params = task_list_query(
+            habit_id="*in(1, 2)", start="<" + now
+        )
+        misses = query_cache_info()["misses"]
+        hits = query_cache_info()["hits"]
+
+        for habit_ids in [
+            "*in(1)",
+            "*in(1, 2, 3)",
+            "*in(" + ",".join(["4"] * 50) + ")",
+        ]:
+            query, params = task_list_query(habit_id=habit_ids, start=">" + now)
+            self.assertEqual(query, first_query.replace("start < ?", "start > ?"))
+            self.assertEqual(len(params), len(first_params))
+            query, params = task_list_query(habit_id=habit_ids, start="<" + now)
+            self.assertEqual(query, first_query)
+
+        self.assertEqual(query_cache_info()["misses"], misses + 1)
+        self.assertEqual(query_cache_info()["hits"], hits + 5)
+        self.assertEqual(params, ["[" + ", ".join(["4"] * 50) + "]", params[1]])
+
+    def test_habit_cache(self):
+        """Test that habit lookups are cached and invalidated by writes"""
+
+        habit = Habit(
+            name="testCache",
+            description="testDescription",
+            interval="P1D",
+            lifetime="PT1H",
+            start=datetime(2023, 10, 19, 0, 0, 0),
+            end=datetime(2023, 10, 21, 0, 0, 0),
+        )
+        habit_create(habit)
+        self.addCleanup(habit_delete, (habit.id,))
+
+        habit_list(id=habit.id)
+        hits = habit_cache_info()["hits"]
+        cached = habit_list(id=f"*in({habit.id},0)")
+        self.assertEqual([h.to_dict() for h in cached], [habit.to_dict()])
+        self.assertEqual(habit_cache_info()["hits"], hits + 1)
+
+        # Callers get copies
+        cached[0].name = "changed"
+        self.assertEqual(habit_list(id=habit.id)[0].name, "testCache")
+
+        habit.description = "updated"
+        habit_update(habit)
+        self.assertEqual(habit_list(id=habit.id)[0].description, "updated")
+
+        hits = habit_cache_info()["hits"]
+        self.assertEqual(
+            [h.id for h in habit_list(id=habit.id, interval=Duration("P1D"))],
+            [habit.id],
+        )
+        self.assertEqual(habit_list(id=habit.id, active=False), [])
+        self.assertEqual(habit_cache_info()["hits"], hits + 2)
+
+        # Other lookups are streamed from the database
+        info = habit_cache_info()
+        self.assertEqual(
+            [h.id for h in habit_list(name="testCache", interval=Duration("P1D"))],
+            [habit.id],
+        )
+        self.assertEqual(habit_cache_info(), info)
+
+        # Writes from other connections bump the version counter
+        con = sqlite3.connect(DATABASE_PATH)
+        with con:
+            con.execute(
+                "UPDATE habits SET name = 'testCacheOther' WHERE id = ?", (habit.id,)
+            )
+        con.close()
+        self.assertEqual(habit_list(name="testCache"), [])
+        self.assertEqual(habit_list(id=habit.id)[0].name, "testCacheOther")
+
+        habit_delete((habit.id,))
+        self.assertEqual(habit_list(id=habit.id), [])
+        info = habit_cache_info()
+        self.assertLessEqual(info["size"], info["max_size"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from datetime import datetime
+from datetime import datetime, timedelta
 from duration import Duration
 
 
@@ -34,6 +34,88 @@ class TestDuration(unittest.TestCase):
 
         self.assertEqual(str(duration2.duration), "1 years, 2 months, 3 days, 4:05:06")
 
+    def step_instances(self, duration: Duration, count: int) -> list[datetime]:
+        """Returns the first instances of a duration by repeated addition"""
+
+        instances = [duration.start_time]
+        for _ in range(count - 1):
+            instances.append(instances[-1] + duration.duration)
+        return instances
+
+    def test_class_duration_instances(self):
+        """Test that computed instances match repeated addition of the duration"""
+
+        for duration_str, start_time in [
+            ("PT7M", datetime(2023, 10, 19, 13, 43, 12)),
+            ("P1D", datetime(2023, 10, 19, 13, 43, 12)),
+            ("P1M", datetime(2024, 1, 31, 8, 0, 0)),
+            ("P1Y", datetime(2024, 2, 29, 8, 0, 0)),
+            ("P3M", datetime(2023, 8, 30, 8, 0, 0)),
+            ("P1Y2M3DT4H5M6S", datetime(2023, 10, 19, 13, 43, 12)),
+        ]:
+            duration = Duration(duration_str, start_time)
+            instances = self.step_instances(duration, 50)
+
+            for n, instance in enumerate(instances):
+                self.assertEqual(duration.nth_instance(n), instance, duration_str)
+                self.assertEqual(
+                    duration.find_next_instance(instance - timedelta(seconds=1)),
+                    instance,
+                    duration_str,
+                )
+                if n > 0:
+                    self.assertEqual(
+                        duration.find_next_instance(instances[n - 1]), instance
+                    )
+
+            self.assertEqual(
+                list(duration.instances_between(instances[3], instances[10])),
+                instances[3:10],
+                duration_str,
+            )
+            self.assertEqual(
+                list(
+                    duration.instances_between(
+                        start_time - timedelta(days=1),
+                        instances[2] + timedelta(seconds=1),
+                    )
+                ),
+                instances[0:3],
+                duration_str,
+            )
+            self.assertEqual(
+                list(duration.instances_between(instances[5], instances[5])), []
+            )
+
+        # Monthly instances keep the day clamped at the end of February
+        duration = Duration("P1M", datetime(2023, 1, 31))
+        self.assertEqual(duration.nth_instance(2), datetime(2023, 3, 28))
+        self.assertEqual(
+            duration.find_next_instance(datetime(2023, 12, 1)), datetime(2023, 12, 28)
+        )
+
+    def test_class_duration_interned(self):
+        """Test that durations without a start time are shared and immutable"""
+
+        duration = Duration("PT4H")
+        self.assertIs(Duration("PT4H"), duration)
+        self.assertIsNone(duration.start_time)
+        self.assertNotEqual(Duration("PT4H", datetime(2023, 10, 19)), duration)
+        self.assertEqual(
+            Duration("PT4H", datetime(2023, 10, 19)),
+            Duration("PT4H", datetime(2023, 10, 19)),
+        )
+        self.assertEqual(len({Duration("PT4H"), Duration("P1D"), duration}), 2)
+
+        with self.assertRaises(AttributeError):
+            duration.duration_str = "P1D"
+        with self.assertRaises(ValueError):
+            duration.nth_instance(1)
+
+        # Instances are found from the current time, not the time of the import
+        duration = Duration("PT1S", datetime.now())
+        self.assertGreater(duration.find_next_instance(), datetime.now())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from datetime import datetime
 from duration import Duration
 from habit import Habit
+from utils import to_epoch
 
 
 class TestHabit(unittest.TestCase):
@@ -29,6 +30,7 @@ class TestHabit(unittest.TestCase):
                 "start": "2023-10-19T13:43:12",
                 "end": "2023-10-20T13:43:12",
                 "active": False,
+                "virtual": False,
             },
         )
 
@@ -51,9 +53,42 @@ class TestHabit(unittest.TestCase):
                 "start": "2023-10-19T13:43:12",
                 "end": "2023-10-20T13:43:12",
                 "active": True,
+                "virtual": False,
             },
         )
 
+    def test_class_habit_from_row(self):
+        """Test creating a Habit from a database row"""
+
+        start = datetime(2023, 10, 19, 13, 43, 12)
+        end = datetime(2023, 10, 20, 13, 43, 12)
+        habit = Habit.from_row(
+            (
+                1,
+                "testName",
+                "testDescription",
+                "P1D",
+                "PT1H",
+                1,
+                to_epoch(start),
+                to_epoch(end),
+                0,
+            )
+        )
+        self.assertEqual(
+            habit.to_dict(),
+            Habit(
+                name="testName",
+                description="testDescription",
+                interval="P1D",
+                lifetime="PT1H",
+                start=start,
+                end=end,
+                id=1,
+            ).to_dict(),
+        )
+        self.assertIs(habit.interval, Duration("P1D"))
+
 
 if __name__ == "__main__":
     unittest.main()
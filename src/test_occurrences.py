@@ -0,0 +1,87 @@
+import unittest
+from datetime import datetime, timedelta
+from habit import Habit
+import numpy as np
+from occurrences import habit_occurrence_batches, habit_occurrences
+from utils import to_epoch
+
+
+def step_occurrences(habit: Habit, start: datetime, end: datetime) -> list[tuple]:
+    """Returns the (start, end) epochs of the occurrences of a habit by repeated
+    addition of its interval
+    """
+
+    occurrences = []
+    current = start
+    while current < end:
+        occurrences.append(
+            (to_epoch(current), to_epoch(current + habit.lifetime.duration))
+        )
+        current += habit.interval.duration
+    return occurrences
+
+
+class TestOccurrences(unittest.TestCase):
+    def test_habit_occurrences(self):
+        """Test that computed occurrences match repeated addition of the interval"""
+
+        for start in [
+            datetime(2024, 1, 31, 10, 5, 7, 123),
+            datetime(2024, 2, 29, 8, 0, 0),
+            datetime(1969, 12, 31, 23, 30, 0),
+        ]:
+            for interval, lifetime in [
+                ("PT7M", "PT1H"),
+                ("P1D", "P1M"),
+                ("P1M", "PT1H"),
+                ("P1Y", "P1Y"),
+                ("P3M", "P1M1D"),
+                ("P1M1D", "PT1H"),
+            ]:
+                habit = Habit(
+                    name="testOccurrences",
+                    description="testDescription",
+                    interval=interval,
+                    lifetime=lifetime,
+                    start=start,
+                    end=start + timedelta(days=2000),
+                )
+                expected = step_occurrences(habit, habit.start, habit.end)
+
+                starts, ends = habit_occurrences(habit)
+                self.assertEqual(
+                    list(zip(starts.tolist(), ends.tolist())), expected, interval
+                )
+
+                # Later start times step from themselves, until bounds the starts
+                later = start + timedelta(days=40, hours=5)
+                until = start + timedelta(days=700)
+                starts, ends = habit_occurrences(habit, later, until, limit=10)
+                self.assertEqual(
+                    list(zip(starts.tolist(), ends.tolist())),
+                    step_occurrences(habit, later, until)[:10],
+                    interval,
+                )
+
+                starts, ends = habit_occurrences(habit, habit.end)
+                self.assertEqual((len(starts), len(ends)), (0, 0))
+
+                # Batches continue one another, clamped days included
+                batches = list(
+                    habit_occurrence_batches(habit, None, until, size=7, limit=100)
+                )
+                self.assertTrue(all(len(starts) <= 7 for starts, _ in batches))
+                self.assertEqual(
+                    list(
+                        zip(
+                            np.concatenate([starts for starts, _ in batches]).tolist(),
+                            np.concatenate([ends for _, ends in batches]).tolist(),
+                        )
+                    ),
+                    step_occurrences(habit, habit.start, until)[:100],
+                    interval,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from db import habit_create, habit_delete, task_complete, task_id_for_order
+from habit import Habit
+from snapshot import Snapshot, write_snapshot
+from snapshot_analytics import (
+    completion_heatmap,
+    counted,
+    rolling_completion_rate,
+    weekday_hour_distribution,
+)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        """Creates a habit of 48 hourly tasks with orders 1-3, 5, 6 and 30 completed
+        half an hour after their start, a virtual habit with one completed task, and a
+        snapshot of the tasks
+        """
+
+        self.habit = Habit(
+            name="testSnapshot",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start=datetime(2023, 10, 24, 0, 0, 0),
+            end=datetime(2023, 10, 26, 0, 0, 0),
+        )
+        habit_create(self.habit)
+        self.addCleanup(habit_delete, (self.habit.id,))
+
+        for order in [1, 2, 3, 5, 6, 30]:
+            completed_at = self.habit.start + timedelta(hours=order - 1, minutes=30)
+            task_complete(task_id_for_order(self.habit.id, order), completed_at)
+
+        self.virtual = Habit(
+            name="testSnapshotVirtual",
+            description="testDescription",
+            interval="PT1H",
+            lifetime="PT1H",
+            start=datetime(2023, 10, 24, 0, 0, 0),
+            end=datetime(2023, 10, 26, 0, 0, 0),
+            virtual=True,
+        )
+        habit_create(self.virtual)
+        self.addCleanup(habit_delete, (self.virtual.id,))
+        task_complete(task_id_for_order(self.virtual.id, 2))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "tasks.snapshot")
+        write_snapshot(self.path)
+        self.snapshot = Snapshot(self.path)
+
+    def test_snapshot(self):
+        """Test that snapshots hold the tasks of a habit in habit order"""
+
+        rows = self.snapshot.habit_rows(self.habit.id)
+        self.assertEqual(rows.stop - rows.start, 48)
+        self.assertEqual(self.snapshot.habit_order[rows].tolist(), list(range(1, 49)))
+        self.assertEqual(
+            [
+                order
+                for order, done in enumerate(self.snapshot.completed(rows), 1)
+                if done
+            ],
+            [1, 2, 3, 5, 6, 30],
+        )
+        self.assertEqual(self.snapshot.habit_rows(0), slice(0, 0))
+
+        self.assertTrue(self.snapshot.is_virtual(self.virtual.id))
+        self.assertFalse(self.snapshot.is_virtual(self.habit.id))
+        rows = self.snapshot.habit_rows(self.virtual.id)
+        self.assertEqual(self.snapshot.habit_order[rows].tolist(), [2])
+
+        with open(self.path, "r+b") as file:
+            file.write(b"x")
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+
+    def test_snapshot_analytics(self):
+        """Test the completion analytics of a snapshot"""
+
+        now = datetime(2023, 10, 24, 10, 0, 0)
+        heatmap = completion_heatmap(self.snapshot, self.habit.id, now)
+        self.assertEqual(
+            heatmap["date"].astype(str).tolist(), ["2023-10-24", "2023-10-25"]
+        )
+        self.assertEqual(heatmap["tasks"].tolist(), [10, 1])
+        self.assertEqual(heatmap["completed"].tolist(), [5, 1])
+        self.assertEqual(heatmap["completion_rate"].tolist(), [0.5, 1.0])
+
+        # 2023-10-24 is a Tuesday
+        distribution = weekday_hour_distribution(self.snapshot, self.habit.id)
+        self.assertEqual(distribution.shape, (7, 24))
+        self.assertEqual(distribution[1, :7].tolist(), [1, 1, 1, 0, 1, 1, 0])
+        self.assertEqual(distribution[2, 5], 1)
+        self.assertEqual(distribution.sum(), 6)
+
+        rolling = rolling_completion_rate(self.snapshot, self.habit.id, 3, now)
+        self.assertEqual(rolling["habit_order"].tolist(), list(range(1, 11)) + [30])
+        self.assertEqual(
+            rolling["completion_rate"].tolist(),
+            [1, 1, 1, 2 / 3, 2 / 3, 2 / 3, 2 / 3, 1 / 3, 0, 0, 1 / 3],
+        )
+
+        # Only the completed tasks of virtual habits are stored, so they have no
+        # completion rates
+        rows = self.snapshot.habit_rows(self.virtual.id)
+        self.assertFalse(counted(self.snapshot, rows, now).any())
+        with self.assertRaises(ValueError):
+            completion_heatmap(self.snapshot, self.virtual.id, now)
+        with self.assertRaises(ValueError):
+            rolling_completion_rate(self.snapshot, self.virtual.id, 3, now)
+        self.assertEqual(
+            weekday_hour_distribution(self.snapshot, self.virtual.id).sum(), 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+from streak import Streak
+
+
+class TestStreak(unittest.TestCase):
+    def test_class_streak_simple(self):
+        """Test the Streak class with valid parameters"""
+
+        streak = Streak(habit_id=1, start_order=3, end_order=5, ids=[7, 8, 9])
+        self.assertEqual(streak.length, 3)
+        self.assertEqual(
+            streak.to_dict(), {"streak": 3, "ids": [7, 8, 9], "habit_id": 1}
+        )
+
+        streak = Streak(habit_id=1, start_order=4, end_order=4)
+        self.assertEqual(streak.to_dict(), {"streak": 1, "ids": [], "habit_id": 1})
+
+    def test_class_streak_invalid(self):
+        """Test the Streak class with invalid parameters"""
+
+        with self.assertRaises(TypeError):
+            Streak(habit_id="1", start_order=1, end_order=1)
+        with self.assertRaises(ValueError):
+            Streak(habit_id=1, start_order=2, end_order=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from datetime import datetime
 from task import Task
+from utils import to_epoch
 
 
 class TestTask(unittest.TestCase):
@@ -47,6 +48,33 @@ class TestTask(unittest.TestCase):
             },
         )
 
+    def test_class_task_from_row(self):
+        """Test creating a Task from a database row"""
+
+        start = datetime(2023, 10, 19, 13, 43, 12)
+        end = datetime(2023, 10, 20, 13, 43, 12)
+        task = Task.from_row(
+            (1, 2, 3, 1, to_epoch(end), to_epoch(start), to_epoch(end))
+        )
+        self.assertEqual(
+            task.to_dict(),
+            Task(
+                habit_id=2,
+                habit_order=3,
+                start=start,
+                end=end,
+                completed=True,
+                completed_at=end,
+                id=1,
+            ).to_dict(),
+        )
+        self.assertIs(task.start, task.start)
+
+        task.completed_at = None
+        self.assertIsNone(task.to_dict()["completed_at"])
+        with self.assertRaises(AttributeError):
+            task.other = 1
+
 
 if __name__ == "__main__":
     unittest.main()
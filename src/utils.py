@@ -1,5 +1,63 @@
+from datetime import datetime, timedelta
+
+# Timestamps are stored as microseconds since this naive datetime
+EPOCH = datetime(1970, 1, 1)
+
+MICROSECOND = timedelta(microseconds=1)
+
+
 def not_none(value, default):
     if value is None:
         return default
     else:
         return value
+
+
+def naive_local(value: datetime) -> datetime:
+    """Converts a datetime with a UTC offset to a naive datetime in local time, like
+    datetime.now() and naive datetimes, which are kept as they are
+    """
+
+    if value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+
+def parse_datetime(value: str) -> datetime:
+    """Parses an ISO 8601 datetime, see naive_local"""
+
+    return naive_local(datetime.fromisoformat(value))
+
+
+def to_epoch(value: datetime) -> int:
+    """Converts a datetime to microseconds since EPOCH, see naive_local"""
+
+    return (naive_local(value) - EPOCH) // MICROSECOND
+
+
+def from_epoch(value: int) -> datetime:
+    """Converts microseconds since EPOCH to a naive datetime"""
+
+    return EPOCH + timedelta(microseconds=value)
+
+
+class EpochDatetime:
+    """A datetime attribute of a slotted model, stored in the slot of its name with a
+    leading underscore. Microseconds since EPOCH, as read from the database, are
+    converted on first access.
+    """
+
+    def __set_name__(self, owner: type, name: str):
+        self.slot = "_" + name
+
+    def __get__(self, instance, owner: type | None = None):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if type(value) is int:
+            value = from_epoch(value)
+            setattr(instance, self.slot, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)